@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Body, Form
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Body, Form, Query, Request, WebSocket, \
+    WebSocketDisconnect
 from sqlalchemy.orm import Session
 from sqlalchemy import create_engine, Time
 from sqlalchemy.orm import sessionmaker
@@ -6,6 +7,19 @@ from typing import List, Optional
 from backend import models, schemas
 from backend.config import settings
 from backend import crud
+from backend.gallery import gallery
+from backend import matching
+from backend import imaging
+from backend import quality
+from backend import analytics
+from backend import calibration
+from backend.inference import inference_executor
+from backend.batching import embedding_batcher, face_embedding_batcher
+from backend.embedding_cache import embedding_cache
+from backend.recognition_session import RecognitionSession
+from backend.metrics import StageTimer, span
+from backend.frame_cache import FrameCache, frame_cache_stats, frame_hash, get_session_cache
+from backend.logging_config import sampled
 from passlib.context import CryptContext
 from datetime import datetime, date
 import logging
@@ -13,20 +27,17 @@ import shutil
 import os
 import json
 import base64
-from io import BytesIO
-from PIL import Image
-from sklearn.metrics.pairwise import euclidean_distances
-from collections import Counter
-import numpy as np
+import asyncio
 from fastapi.responses import JSONResponse
-import matplotlib.pyplot as plt
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
 
 # Tạo engine và session để kết nối với cơ sở dữ liệu
 engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 def get_db():
@@ -298,8 +309,9 @@ def get_teacher_image(id_gv: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Image not found")
 
     image_url = f"http://localhost:8000/{image.image_path}"
+    thumbnail_url = f"http://localhost:8000/{imaging.existing_thumbnail(image.image_path)}"
 
-    return schemas.TeacherImageResponse(id_gv=image.id_gv, image_path=image_url)
+    return schemas.TeacherImageResponse(id_gv=image.id_gv, image_path=image_url, thumbnail_path=thumbnail_url)
 
 
 @router.put("/images/hoc-sinh/{id_hs}/", response_model=schemas.StudentImageResponse)
@@ -312,12 +324,15 @@ async def update_student_image(
     os.makedirs(directory, exist_ok=True)
 
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    file_location = f"{directory}/{timestamp}_{file.filename}"
+    file_location = f"{directory}/{timestamp}_{imaging.upload_file_name(file.filename)}"
+
+    # Xoay theo EXIF, thu nhỏ về kích thước chuẩn và tạo ảnh thu nhỏ
+    normalized = await crud.normalize_upload(await file.read())
 
     # Lưu file hình ảnh
     try:
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
+        with span("file_write"):
+            imaging.save_upload(normalized, file_location)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Không thể lưu hình ảnh: {str(e)}")
 
@@ -329,6 +344,7 @@ async def update_student_image(
     if not updated_image:
         raise HTTPException(status_code=404, detail="Học sinh không tồn tại hoặc không thể cập nhật hình ảnh")
 
+    updated_image.thumbnail_path = imaging.thumbnail_path(file_location)
     return updated_image
 
 
@@ -345,8 +361,9 @@ def get_student_image(id_hs: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Image not found")
 
     image_url = f"http://localhost:8000/{image.image_path}"
+    thumbnail_url = f"http://localhost:8000/{imaging.existing_thumbnail(image.image_path)}"
 
-    return schemas.StudentImageResponse(id_hs=image.id_hs, image_path=image_url)
+    return schemas.StudentImageResponse(id_hs=image.id_hs, image_path=image_url, thumbnail_path=thumbnail_url)
 
 
 @router.post("/images/phu-huynh/{id_ph}/")
@@ -357,12 +374,13 @@ async def upload_parent_image(id_ph: int, file: UploadFile = File(...), db: Sess
         "image": {
             "id_ph": new_image.id_ph,
             "image_path": new_image.image_path,
-            "vector": new_image.vector
+            "thumbnail_path": imaging.thumbnail_path(new_image.image_path),
+            "vector": new_image.get_embedding().tolist()
         },
         "flipped_image": {
             "id_ph": new_flipped_image.id_ph,
             "image_path": new_flipped_image.image_path,
-            "vector": new_flipped_image.vector
+            "vector": new_flipped_image.get_embedding().tolist()
         }
     }
 
@@ -377,18 +395,14 @@ def get_all_parent_images(id_ph: int, db: Session = Depends(get_db)):
         # Chuyển đổi dữ liệu trước khi trả về
         response_images = []
         for image in images:
-            # Kiểm tra kiểu dữ liệu của vector
-            if isinstance(image.vector, str):
-                vector_data = json.loads(image.vector) if image.vector else []
-            elif isinstance(image.vector, list):
-                vector_data = image.vector
-            else:
-                vector_data = []
+            # Đọc vector từ cột nhị phân (hoặc JSON với dữ liệu chưa chuyển đổi)
+            vector_data = image.get_embedding().tolist() if image.has_embedding() else []
 
             response_image = {
                 "id_image": image.id_image,
                 "id_ph": image.id_ph,
                 "image_path": image.image_path,
+                "thumbnail_path": image.thumbnail_path,
                 "vector": vector_data
             }
             response_images.append(response_image)
@@ -473,73 +487,295 @@ async def create_diemdanh(
 async def recognize(
         frame: dict,
         id_hs_list: list[int],
-        euclid_threshold: float,
+        euclid_threshold: Optional[float] = None,
+        session_id: Optional[str] = None,
+        search_all: bool = False,
         db: Session = Depends(get_db)
 ):
-    try:
-        # Giải mã frame từ base64 thành ảnh
-        frame_data = frame.get("frame")
-        if not frame_data:
-            raise HTTPException(status_code=400, detail="Không có frame trong yêu cầu")
-
-        image_data = frame_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes))
-        if image.mode == 'RGBA':
-            image = image.convert('RGB')
+    # Giải mã frame từ base64 (data URL) thành bytes
+    frame_data = frame.get("frame")
+    if not frame_data:
+        raise HTTPException(status_code=400, detail="Không có frame trong yêu cầu")
 
-        # Lưu ảnh tạm thời để trích xuất vector
-        temp_image_path = "temp_image.jpg"
-        image.save(temp_image_path)
-
-        # Trích xuất vector từ ảnh
-        input_vector = await crud.calculate_vector(temp_image_path)
+    try:
+        image_bytes = base64.b64decode(frame_data.split(',')[-1])
+        face_box = imaging.parse_face_box(frame.get("face_box"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Frame không hợp lệ: {str(e)}")
+
+    return await recognize_frame(image_bytes, id_hs_list, euclid_threshold, db, get_session_cache(session_id),
+                                 search_all, face_box=face_box, face_cropped=bool(frame.get("face_cropped")))
+
+
+# Nhận frame JPEG dạng nhị phân: body application/octet-stream hoặc multipart (trường "file").
+# id_hs_list và euclid_threshold truyền qua query (?id_hs_list=1&id_hs_list=2) hoặc trường form.
+# euclid_threshold chỉ bắt buộc khi chưa có ngưỡng hiệu chỉnh (xem backend/calibration.py).
+# search_all=true: tìm trong toàn bộ phụ huynh của trường thay vì chỉ phụ huynh của id_hs_list.
+# face_box=x,y,w,h (hộp khuôn mặt trình duyệt đã phát hiện) hoặc face_cropped=true (frame chỉ chứa khuôn mặt):
+# server bỏ qua bước phát hiện khuôn mặt và chỉ chạy mô hình trích xuất vector.
+@router.post("/recognize/raw", response_model=schemas.RecognitionResult)
+async def recognize_raw(
+        request: Request,
+        id_hs_list: Optional[List[int]] = Query(None),
+        euclid_threshold: Optional[float] = Query(None),
+        session_id: Optional[str] = Query(None),
+        search_all: bool = Query(False),
+        face_box: Optional[str] = Query(None),
+        face_cropped: bool = Query(False),
+        db: Session = Depends(get_db)
+):
+    content_type = request.headers.get("content-type", "")
 
-        # Lấy vector của phụ huynh từ id_hs_list
-        vectors = []
-        for id_hs in id_hs_list:
-            vectors.extend(await crud.get_vectors_by_student_id(db, id_hs))
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Không có frame trong yêu cầu")
+        image_bytes = await upload.read()
+
+        try:
+            if id_hs_list is None:
+                id_hs_list = [int(value) for value in form.getlist("id_hs_list")]
+            if euclid_threshold is None and form.get("euclid_threshold") is not None:
+                euclid_threshold = float(form.get("euclid_threshold"))
+            if not search_all:
+                search_all = str(form.get("search_all", "")).lower() in ("1", "true", "on")
+            if face_box is None:
+                face_box = form.get("face_box")
+            if not face_cropped:
+                face_cropped = str(form.get("face_cropped", "")).lower() in ("1", "true", "on")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="id_hs_list hoặc euclid_threshold không hợp lệ")
+    else:
+        image_bytes = await request.body()
+
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Không có frame trong yêu cầu")
+    try:
+        parsed_face_box = imaging.parse_face_box(face_box)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await recognize_frame(image_bytes, id_hs_list or [], euclid_threshold, db,
+                                 get_session_cache(session_id), search_all,
+                                 face_box=parsed_face_box, face_cropped=face_cropped)
+
+
+# Kênh nhận dạng liên tục qua WebSocket cho trang camera của giáo viên.
+# Client gửi cấu hình dạng JSON {"id_hs_list": [...], "euclid_threshold": ..., "search_all": false,
+# "face_cropped": false} một lần (hoặc khi thay đổi),
+# sau đó gửi liên tục các frame JPEG dạng nhị phân. Server trả về các sự kiện JSON:
+# "config" (đã nhận cấu hình), "result" (kết quả nhận dạng) và "error".
+@router.websocket("/recognize/ws")
+async def recognize_ws(websocket: WebSocket):
+    await websocket.accept()
+    session = RecognitionSession()
+    send_lock = asyncio.Lock()
+
+    async def send_event(event: dict):
+        async with send_lock:
+            await websocket.send_json(event)
+
+    async def receive_loop():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+
+            if message.get("bytes") is not None:
+                session.put_frame(message["bytes"])
+            elif message.get("text") is not None:
+                try:
+                    session.configure(json.loads(message["text"]))
+                except (ValueError, TypeError) as e:
+                    await send_event({"type": "error", "status_code": 400, "detail": f"Cấu hình không hợp lệ: {str(e)}"})
+                    continue
+                await send_event({"type": "config", "id_hs_list": session.id_hs_list,
+                                  "euclid_threshold": session.euclid_threshold,
+                                  "search_all": session.search_all,
+                                  "face_cropped": session.face_cropped})
+
+    async def process_loop():
+        while True:
+            image_bytes = await session.next_frame()
+            if not session.configured:
+                await send_event({"type": "error", "status_code": 400, "detail": "Chưa gửi cấu hình phiên nhận dạng"})
+                continue
+            # Phiên CSDL ngắn cho từng frame: kết nối WebSocket của camera có thể mở hàng giờ
+            db = SessionLocal()
+            try:
+                event = await recognize_event(image_bytes, session, db)
+            finally:
+                db.close()
+            await send_event({**event, "stats": session.stats()})
+
+    receiver = asyncio.create_task(receive_loop())
+    processor = asyncio.create_task(process_loop())
+    try:
+        done, _ = await asyncio.wait({receiver, processor}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is not None and not isinstance(task.exception(), WebSocketDisconnect):
+                raise task.exception()
+    finally:
+        receiver.cancel()
+        processor.cancel()
 
-        if not vectors:
-            return JSONResponse(content={"success": False, "message": "Không tìm thấy vector nào cho học sinh."})
 
-        distances = []
-        for vector_info in vectors:
-            # Chuyển đổi vector từ JSON string về dạng ndarray
-            vector = np.array(json.loads(vector_info['vector']))
-
-            # Tính khoảng cách Euclid
-            distance = euclidean_distances(input_vector.reshape(1, -1), vector.reshape(1, -1))[0][0]
-            print(
-                f"ID Phụ Huynh: {vector_info['id_ph']}, Đường dẫn ảnh: {vector_info['image_path']}, Khoảng cách: {distance}")
-
-            if distance < euclid_threshold:
-                distances.append({
-                    "id_ph": vector_info['id_ph'],
-                    "image_path": vector_info['image_path'],
-                    "distance": distance
+async def recognize_event(image_bytes: bytes, session: RecognitionSession, db: Session) -> dict:
+    try:
+        result = await recognize_frame(image_bytes, session.id_hs_list, session.euclid_threshold, db,
+                                       session.frame_cache, session.search_all,
+                                       face_cropped=session.face_cropped)
+    except HTTPException as e:
+        return {"type": "error", "status_code": e.status_code, "detail": e.detail}
+
+    if isinstance(result, JSONResponse):
+        payload = json.loads(result.body)
+    else:
+        payload = result.model_dump()
+    return {"type": "result", **payload}
+
+
+# Gallery thường đã được nạp lúc khởi động; nếu chưa (lần nạp đó lỗi), chỉ một yêu cầu nạp lại
+# trong threadpool, các yêu cầu khác chờ trên khóa thay vì chặn event loop hoặc nạp trùng.
+_gallery_load_lock = asyncio.Lock()
+
+
+async def ensure_gallery_loaded(db: Session):
+    if gallery.loaded:
+        return
+    async with _gallery_load_lock:
+        if gallery.loaded:
+            return
+        try:
+            await run_in_threadpool(gallery.load, db)
+        except Exception as e:
+            db.rollback()
+            logger.error("Không thể nạp gallery khuôn mặt phụ huynh", extra={"error": str(e)})
+            raise HTTPException(status_code=503, detail="Dữ liệu khuôn mặt phụ huynh chưa sẵn sàng, vui lòng thử lại sau.")
+        logger.info("Đã nạp vector khuôn mặt phụ huynh vào bộ nhớ", extra={"vectors": len(gallery)})
+
+
+# Quy trình nhận dạng dùng chung cho các endpoint: giải mã, trích xuất vector, so khớp và điểm danh.
+# frame_cache (theo phiên camera) cho phép dùng lại vector của frame gần như giống hệt frame vừa xử lý.
+# search_all: so khớp với toàn bộ phụ huynh của trường qua chỉ mục ANN, bỏ qua id_hs_list.
+# face_box / face_cropped: khuôn mặt do client xác định, chỉ cắt ảnh và bỏ qua bước phát hiện của server.
+# Ngưỡng đã hiệu chỉnh (toàn cục và theo phụ huynh) được ưu tiên hơn euclid_threshold của client;
+# kết quả trả về ngưỡng toàn cục đã áp dụng và nguồn của nó (threshold, threshold_source).
+# timer: nhận thời gian của từng giai đoạn (giải mã, phát hiện, trích xuất vector, gallery, so khớp, điểm danh).
+async def recognize_frame(image_bytes: bytes, id_hs_list: List[int], euclid_threshold: Optional[float],
+                          db: Session, frame_cache: Optional[FrameCache] = None, search_all: bool = False,
+                          face_box: Optional[tuple] = None, face_cropped: bool = False,
+                          timer: Optional[StageTimer] = None):
+    timer = timer or StageTimer()
+    try:
+        threshold, parent_thresholds, threshold_source = await calibration.threshold_store.resolve(db, euclid_threshold)
+        if threshold is None:
+            raise HTTPException(status_code=400, detail="Thiếu tham số euclid_threshold (chưa có ngưỡng hiệu chỉnh)")
+        timer.lap("threshold")
+
+        # Giải mã trực tiếp thành mảng numpy trong bộ nhớ (không ghi file tạm)
+        try:
+            image = imaging.decode_image(image_bytes, settings.FRAME_DECODE_MIN_SIDE)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Frame không hợp lệ: {str(e)}")
+        timer.lap("decode")
+
+        # Khuôn mặt do client xác định: cắt, không cần phát hiện lại (kích thước được kiểm tra ở cổng chất lượng)
+        face = None
+        face_size = frame_size = None  # Kích thước khuôn mặt / frame theo ảnh gốc, cho bước kiểm tra chất lượng
+        if face_box is not None or face_cropped:
+            try:
+                source_size = imaging.image_size(image_bytes)
+                if face_box is not None:
+                    face_size, frame_size = (face_box[2], face_box[3]), source_size
+                    face_box = imaging.scale_face_box(face_box, source_size, (image.shape[1], image.shape[0]))
+                else:
+                    face_size = source_size
+                face = imaging.crop_face(image, face_box, settings.CLIENT_FACE_MARGIN)
+            except ValueError as e:
+                # Hộp khuôn mặt sai trong một frame camera: bỏ frame và chờ frame sau như cổng chất lượng
+                quality.quality_stats.record(quality.INVALID_FACE)
+                return JSONResponse(content={
+                    "success": False,
+                    "retry": True,
+                    "reason": quality.INVALID_FACE,
+                    "message": quality.REASON_MESSAGES[quality.INVALID_FACE],
+                    "detail": str(e),
+                })
+        timer.lap("detect")
+
+        # Loại frame mờ, quá tối / quá sáng hoặc khuôn mặt quá nhỏ trước khi tốn một lượt chạy mô hình
+        if settings.QUALITY_GATE:
+            assessment = quality.assess(image if face is None else face, face_size, frame_size)
+            timer.lap("quality")
+            if not assessment.ok:
+                return JSONResponse(content={
+                    "success": False,
+                    "retry": True,
+                    "reason": assessment.reason,
+                    "message": quality.REASON_MESSAGES[assessment.reason],
+                    "quality": assessment.to_dict(),
                 })
 
-        if not distances:
-            return JSONResponse(content={"success": False, "message": "Không có vector nào dưới ngưỡng."})
-
-        top_5_matches = sorted(distances, key=lambda x: x['distance'])[:5]
-
-        # In thông tin của top 5
-        print("Top 5 kết quả nhận diện:")
-        for match in top_5_matches:
-            print(
-                f"ID Phụ Huynh: {match['id_ph']}, Đường dẫn ảnh: {match['image_path']}, Khoảng cách: {match['distance']}")
+        # Trích xuất vector từ ảnh (bỏ qua mô hình nếu frame gần giống frame vừa xử lý)
+        input_vector = None
+        if frame_cache is not None:
+            hash_value = frame_hash(image if face is None else face)
+            input_vector = frame_cache.lookup(hash_value)
+        if input_vector is None:
+            if face is not None:
+                input_vector = await crud.calculate_face_vector(face)
+            else:
+                input_vector = await crud.calculate_vector(image)
+            if frame_cache is not None:
+                frame_cache.store(hash_value, input_vector)
+        timer.lap("embed")
+
+        # Lấy vector của phụ huynh từ gallery trong bộ nhớ (không truy vấn CSDL)
+        await ensure_gallery_loaded(db)
+        use_templates = settings.MATCH_MODE == "template" and not search_all
+        if search_all:
+            candidates = gallery.search_all(input_vector, settings.ANN_CANDIDATES)
+        elif use_templates:
+            candidates = gallery.template_candidates(id_hs_list)
+        else:
+            candidates = gallery.candidates(id_hs_list)
+        timer.lap("gallery")
 
-        id_ph_counts = Counter(match['id_ph'] for match in top_5_matches)
-        common_id_ph = [id_ph for id_ph, count in id_ph_counts.items() if count >= 2]
+        if len(candidates.vectors) == 0:
+            return JSONResponse(content={"success": False, "message": "Không tìm thấy vector nào cho học sinh."})
 
-        # Chọn id_ph đón
-        if common_id_ph:
-            best_match_id = common_id_ph[0]
-            best_match = next(match for match in top_5_matches if match['id_ph'] == best_match_id)
+        if use_templates:
+            # So khớp với mẫu đại diện của từng phụ huynh, chỉ dùng vector gốc khi các phụ huynh quá sát nhau
+            result, candidates = matching.match_templates(input_vector, candidates, gallery.parent_candidates,
+                                                          threshold=threshold, metric=settings.MATCH_METRIC,
+                                                          tie_margin=settings.TEMPLATE_TIE_MARGIN,
+                                                          parent_thresholds=parent_thresholds)
         else:
-            best_match = top_5_matches[0]
+            # So khớp toàn bộ gallery bằng một phép nhân ma trận, chọn top 5 và bỏ phiếu theo id_ph
+            result = matching.match(input_vector, *candidates, threshold=threshold,
+                                    metric=settings.MATCH_METRIC, parent_thresholds=parent_thresholds)
+        timer.lap("match")
+
+        if result is None:
+            return JSONResponse(content={"success": False, "message": "Không có vector nào dưới ngưỡng.",
+                                         "threshold": threshold, "threshold_source": threshold_source})
+
+        # Top 5 chỉ được ghi khi bật DEBUG, lấy mẫu theo LOG_MATCH_SAMPLE_RATE
+        if logger.isEnabledFor(logging.DEBUG) and sampled(settings.LOG_MATCH_SAMPLE_RATE):
+            logger.debug("Top kết quả nhận diện", extra={"top": [
+                {"id_ph": int(candidates.id_ph[index]), "image_path": candidates.image_paths[index],
+                 "distance": float(distance)}
+                for index, distance in zip(result.top_indices, result.top_distances)
+            ]})
+        timer.lap("log")
+
+        best_match = {
+            "id_ph": result.id_ph,
+            "image_path": result.image_path,
+            "distance": result.distance
+        }
 
         recognized_id_ph = best_match['id_ph']
 
@@ -579,7 +815,8 @@ async def recognize(
             diem_danh_record.id_ph_don = recognized_id_ph
             diem_danh_record.gio_ra = current_time
         else:
-            new_record = models.DiemDanh(id_hs=id_hs, ngay=today, id_ph_don=recognized_id_ph, gio_ra=current_time)
+            new_record = models.DiemDanh(id_hs=id_hs, id_lh=student_record.id_lh, ngay=today,
+                                         id_ph_don=recognized_id_ph, gio_ra=current_time)
             db.add(new_record)
 
         db.commit()
@@ -587,6 +824,7 @@ async def recognize(
         # Lấy tên phụ huynh từ cơ sở dữ liệu
         parent_record = db.query(models.PhuHuynh).filter(models.PhuHuynh.id_ph == recognized_id_ph).first()
         parent_name = parent_record.ten_ph if parent_record else "Không xác định"
+        timer.lap("attendance")
 
         # Trả về kết quả nhận dạng
         return schemas.RecognitionResult(
@@ -596,7 +834,9 @@ async def recognize(
                 "id_ph": recognized_id_ph,
                 "image_path": best_match['image_path'],
                 "distance": best_match['distance']
-            }
+            },
+            threshold=threshold,
+            threshold_source=threshold_source,
         )
 
     except HTTPException as e:
@@ -606,6 +846,19 @@ async def recognize(
         raise HTTPException(status_code=500, detail=f"Lỗi hệ thống: {str(e)}")
 
 
+@router.get("/inference/metrics")
+def get_inference_metrics():
+    # Số yêu cầu đang chạy / đang chờ trong bộ thực thi suy luận và histogram của bộ gom batch
+    return {
+        **inference_executor.metrics(),
+        "batching": embedding_batcher.metrics(),
+        "face_batching": face_embedding_batcher.metrics(),
+        "quality": quality.quality_stats.snapshot(),
+        "frame_cache": frame_cache_stats.snapshot(),
+        "embedding_cache": embedding_cache.metrics(),
+    }
+
+
 @router.get("/diem-danh", response_model=schemas.DiemDanhResponseList)
 async def get_diem_danh_api(
         id_lh: int,
@@ -627,44 +880,41 @@ async def get_diem_danh_api(
         raise HTTPException(status_code=400, detail="Ngày không đúng định dạng. Định dạng đúng là YYYY-MM-DD.")
 
 
+@router.get("/analytics/distances")
+async def distance_analytics(
+        bins: int = Query(analytics.DEFAULT_BINS, ge=1, le=1000),
+        max_distance: Optional[float] = Query(None, gt=0),
+        include_augmented: bool = False,
+        format: str = Query("json", pattern="^(json|png)$"),
+        db: Session = Depends(get_db)
+):
+    # Phân phối khoảng cách cùng người / khác người; tính toán và vẽ đều chạy ngoài event loop
+    histogram = await run_in_threadpool(analytics.compute_distance_histogram, db, bins, max_distance,
+                                        include_augmented)
+    if format == "png":
+        image = await run_in_threadpool(analytics.render_png, histogram)
+        return Response(content=image, media_type="image/png")
+    return histogram
+
+
+# Kết quả hiệu chỉnh ngưỡng hiện tại (curve=true: kèm đường FAR / FRR theo ngưỡng)
+@router.get("/calibration")
+async def get_calibration(curve: bool = False, db: Session = Depends(get_db)):
+    state = calibration.get_calibration(db)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Chưa có kết quả hiệu chỉnh ngưỡng.")
+    return calibration.calibration_summary(state, curve)
+
+
+# Chạy hiệu chỉnh (mặc định chỉ tính ảnh mới; full=true tính lại từ đầu) và áp dụng ngay cho worker này
+@router.post("/calibration/run")
+async def run_calibration(full: bool = False, db: Session = Depends(get_db)):
+    result = await run_in_threadpool(calibration.run_calibration, db, full)
+    await run_in_threadpool(calibration.threshold_store.load, db)
+    return result
+
+
 @router.get("/calculate-all-distances")
 async def calculate_all_distances(db: Session = Depends(get_db)):
-    # Lấy tất cả dữ liệu từ bảng PhuHuynh_Images
-    all_images = db.query(models.PhuHuynh_Images).all()
-
-    distances_same = []  # Khoảng cách Euclid cho cặp ảnh cùng người
-    distances_diff = []  # Khoảng cách Euclid cho cặp ảnh khác người
-
-    # Tính khoảng cách Euclid cho tất cả cặp ảnh (cùng người và khác người)
-    for img1 in all_images:
-        embedding1 = img1.get_embedding()  # Gọi phương thức get_embedding để lấy embedding của ảnh 1
-        if embedding1 is None:
-            continue
-        # Cặp ảnh cùng người
-        for img2 in all_images:
-            embedding2 = img2.get_embedding()  # Gọi phương thức get_embedding để lấy embedding của ảnh 2
-            if embedding2 is None:
-                continue
-            # Nếu là ảnh của cùng một phụ huynh, tính khoảng cách
-            if img1.id_ph == img2.id_ph:  # Cùng id_ph (cùng người)
-                dist = np.linalg.norm(embedding1 - embedding2)
-                distances_same.append(dist)
-            # Nếu là ảnh của phụ huynh khác, tính khoảng cách
-            else:
-                dist = np.linalg.norm(embedding1 - embedding2)
-                distances_diff.append(dist)
-
-    # Vẽ biểu đồ phân phối khoảng cách Euclid
-    fig, ax = plt.subplots()
-    ax.hist(distances_same, bins=30, alpha=0.5, label='Cùng người')
-    ax.hist(distances_diff, bins=30, alpha=0.5, label='Khác người')
-    ax.legend(loc='upper right')
-    ax.set_title('Phân phối Khoảng cách Euclid')
-
-    # Lưu biểu đồ vào bộ nhớ và trả về dưới dạng hình ảnh
-    img_stream = BytesIO()
-    plt.savefig(img_stream, format='png')
-    img_stream.seek(0)
-
-    # Trả về hình ảnh như một phản hồi HTTP
-    return StreamingResponse(img_stream, media_type="image/png")
+    # Giữ đường dẫn cũ: trả về biểu đồ PNG như trước
+    return await distance_analytics(bins=30, max_distance=None, include_augmented=False, format="png", db=db)
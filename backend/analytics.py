@@ -0,0 +1,205 @@
+import argparse
+import json
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import false
+from sqlalchemy.orm import Session
+
+from backend import matching, models
+from backend.config import settings
+
+# Phân tích phân phối khoảng cách Euclid giữa các ảnh phụ huynh (cùng người / khác người).
+# Toàn bộ embedding được nạp một lần vào ma trận, khoảng cách được tính theo từng khối bằng BLAS
+# và cộng dồn vào histogram có số bin cố định, không giữ danh sách N² khoảng cách trong bộ nhớ.
+# Sử dụng: python -m backend.analytics [--bins 100] [--png distances.png]
+
+DEFAULT_BINS = 100
+DEFAULT_BLOCK_SIZE = 2048
+
+
+def load_embeddings(db: Session, include_augmented: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Trả về (id_image, id_ph, ma trận embedding float32) theo thứ tự id_image; mỗi dòng chỉ được giải mã một lần
+    query = db.query(models.PhuHuynh_Images.id_image, models.PhuHuynh_Images.id_ph,
+                     models.PhuHuynh_Images.embedding, models.PhuHuynh_Images.vector)
+    if not include_augmented:
+        # Ảnh lật gần như trùng ảnh gốc, giữ lại sẽ kéo lệch phân phối cùng người
+        query = query.filter(models.PhuHuynh_Images.is_augmented == false())
+
+    image_ids = []
+    parent_ids = []
+    vectors = []
+    for id_image, id_ph, embedding, vector in query.order_by(models.PhuHuynh_Images.id_image).yield_per(1000):
+        if embedding is not None:
+            vectors.append(models.decode_embedding(embedding))
+        elif vector:
+            vectors.append(np.asarray(json.loads(vector), dtype=models.EMBEDDING_DTYPE))
+        else:
+            continue
+        image_ids.append(id_image)
+        parent_ids.append(id_ph)
+
+    if not vectors:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+    return (np.asarray(image_ids, dtype=np.int64), np.asarray(parent_ids, dtype=np.int64),
+            np.vstack(vectors).astype(np.float32, copy=False))
+
+
+class _Accumulator:
+    def __init__(self, bins: int):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.total = 0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, distances: np.ndarray, bin_index: np.ndarray):
+        if distances.size == 0:
+            return
+        self.counts += np.bincount(bin_index, minlength=self.counts.size)
+        self.total += distances.size
+        self.sum += float(distances.sum(dtype=np.float64))
+        self.sum_sq += float(np.square(distances, dtype=np.float64).sum())
+        self.min = min(self.min, float(distances.min()))
+        self.max = max(self.max, float(distances.max()))
+
+    def to_dict(self) -> dict:
+        mean = self.sum / self.total if self.total else None
+        std = float(np.sqrt(max(self.sum_sq / self.total - mean * mean, 0.0))) if self.total else None
+        return {
+            "pairs": self.total,
+            "mean": mean,
+            "std": std,
+            "min": self.min if self.total else None,
+            "max": self.max if self.total else None,
+            "counts": self.counts.tolist(),
+        }
+
+
+# Duyệt khoảng cách của mọi cặp ảnh (i < j) theo từng khối block_size x block_size.
+# first_new > 0: chỉ các cặp có ít nhất một ảnh từ vị trí first_new trở đi (ảnh mới thêm, xếp cuối ma trận).
+# Trả về lần lượt (vị trí dòng đầu, vị trí cột đầu, ma trận khoảng cách của khối, mặt nạ các cặp hợp lệ).
+def pair_blocks(vectors: np.ndarray, metric: str = matching.EUCLIDEAN, first_new: int = 0,
+                block_size: int = DEFAULT_BLOCK_SIZE) -> Iterator[Tuple[int, int, np.ndarray, np.ndarray]]:
+    n = len(vectors)
+    sq_norms = matching.squared_norms(vectors)
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        for col_start in range(max(start, first_new), n, block_size):
+            col_stop = min(col_start + block_size, n)
+            # Một phép nhân ma trận (BLAS) cho cả khối
+            block = matching.batch_distances(vectors[start:stop], vectors[col_start:col_stop],
+                                             sq_norms[col_start:col_stop], metric)
+            rows = np.arange(start, stop)[:, None]
+            cols = np.arange(col_start, col_stop)[None, :]
+            yield start, col_start, block, rows < cols
+
+
+def bin_index(distances: np.ndarray, bins: int, max_distance: float) -> np.ndarray:
+    # Khoảng cách vượt max_distance được dồn vào bin cuối
+    return np.minimum((distances * (bins / max_distance)).astype(np.int64), bins - 1)
+
+
+def default_max_distance(vectors: np.ndarray, metric: str = matching.EUCLIDEAN) -> float:
+    if metric == matching.COSINE:
+        return 2.0
+    if len(vectors) == 0:
+        return 1.0
+    # Cận trên của mọi khoảng cách Euclid: 2 * bán kính lớn nhất quanh tâm
+    radius = float(np.sqrt(((vectors - vectors.mean(axis=0)) ** 2).sum(axis=1).max()))
+    return max(2.0 * radius, 1e-6)
+
+
+# Histogram khoảng cách của mọi cặp ảnh (i < j), tách theo cùng người / khác người.
+def distance_histogram(parent_ids: np.ndarray, vectors: np.ndarray, bins: int = DEFAULT_BINS,
+                       max_distance: Optional[float] = None, block_size: int = DEFAULT_BLOCK_SIZE,
+                       metric: str = matching.EUCLIDEAN) -> dict:
+    n = len(parent_ids)
+    if max_distance is None:
+        max_distance = default_max_distance(vectors, metric)
+    edges = np.linspace(0.0, max_distance, bins + 1)
+
+    same = _Accumulator(bins)
+    diff = _Accumulator(bins)
+    for start, col_start, block, valid in pair_blocks(vectors, metric, block_size=block_size):
+        rows, cols = parent_ids[start:start + block.shape[0]], parent_ids[col_start:col_start + block.shape[1]]
+        is_same = rows[:, None] == cols[None, :]
+        same_mask, diff_mask = is_same & valid, ~is_same & valid
+        index = bin_index(block, bins, max_distance)
+        same.add(block[same_mask], index[same_mask])
+        diff.add(block[diff_mask], index[diff_mask])
+
+    return {
+        "metric": metric,
+        "images": int(n),
+        "parents": int(len(np.unique(parent_ids))),
+        "bin_edges": edges.tolist(),
+        "same": same.to_dict(),
+        "different": diff.to_dict(),
+    }
+
+
+def compute_distance_histogram(db: Session, bins: int = DEFAULT_BINS, max_distance: Optional[float] = None,
+                               include_augmented: bool = False) -> dict:
+    _, parent_ids, vectors = load_embeddings(db, include_augmented)
+    return distance_histogram(parent_ids, vectors, bins, max_distance, metric=settings.MATCH_METRIC)
+
+
+def render_png(histogram: dict) -> bytes:
+    # matplotlib chỉ được nạp khi cần vẽ; dùng Figure trực tiếp (không qua pyplot) để an toàn khi chạy trong thread
+    from io import BytesIO
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    edges = np.asarray(histogram["bin_edges"])
+    widths = np.diff(edges)
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    ax = figure.subplots()
+    for key, label in (("same", "Cùng người"), ("different", "Khác người")):
+        counts = np.asarray(histogram[key]["counts"], dtype=np.float64)
+        # Chuẩn hóa theo mật độ vì số cặp khác người lớn hơn nhiều số cặp cùng người
+        if counts.sum() > 0:
+            counts = counts / (counts.sum() * widths)
+        ax.bar(edges[:-1], counts, width=widths, align="edge", alpha=0.5, label=label)
+    ax.legend(loc="upper right")
+    ax.set_title("Phân phối Khoảng cách Euclid" if histogram["metric"] == matching.EUCLIDEAN
+                 else f"Phân phối Khoảng cách ({histogram['metric']})")
+    ax.set_xlabel("Khoảng cách")
+
+    stream = BytesIO()
+    figure.savefig(stream, format="png")
+    return stream.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.analytics",
+                                     description="Phân phối khoảng cách giữa các ảnh phụ huynh")
+    parser.add_argument("--bins", type=int, default=DEFAULT_BINS)
+    parser.add_argument("--max-distance", type=float, default=None,
+                        help="Khoảng cách ứng với bin cuối (mặc định: tự ước lượng)")
+    parser.add_argument("--include-augmented", action="store_true", help="Tính cả ảnh lật")
+    parser.add_argument("--png", help="Ghi biểu đồ ra file PNG")
+    parser.add_argument("--output", help="Ghi kết quả JSON ra file thay vì in ra màn hình")
+    args = parser.parse_args(argv)
+
+    db = models.SessionLocal()
+    try:
+        histogram = compute_distance_histogram(db, args.bins, args.max_distance, args.include_augmented)
+    finally:
+        db.close()
+
+    if args.png:
+        with open(args.png, "wb") as file:
+            file.write(render_png(histogram))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(histogram, file)
+    else:
+        print(json.dumps(histogram))
+
+
+if __name__ == "__main__":
+    main()
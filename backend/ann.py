@@ -0,0 +1,369 @@
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+import numpy as np
+
+from backend import matching
+
+logger = logging.getLogger(__name__)
+
+
+# Chỉ mục tìm kiếm láng giềng gần nhất (theo khoảng cách Euclid) trên toàn bộ vector phụ huynh,
+# dùng cho chế độ nhận dạng "toàn trường". Mọi chỉ mục dùng id_image làm khóa và hỗ trợ
+# thêm / xóa từng phần khi ảnh phụ huynh được tải lên hoặc bị xóa.
+class ANNIndex(ABC):
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        ...
+
+    @abstractmethod
+    def remove(self, ids: np.ndarray):
+        ...
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Trả về (ids, distances) của k vector gần nhất, sắp xếp tăng dần theo khoảng cách
+        ...
+
+
+# Mảng id + vector có thể tăng kích thước, xóa phần tử bằng cách đổi chỗ với phần tử cuối
+class _VectorBuffer:
+    def __init__(self, dim: int):
+        self.size = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.sq_norms = np.empty(0, dtype=np.float32)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids), 16)
+            self.ids = np.resize(self.ids, capacity)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            self.sq_norms = np.resize(self.sq_norms, capacity)
+        self.ids[self.size:needed] = ids
+        self.vectors[self.size:needed] = vectors
+        self.sq_norms[self.size:needed] = matching.squared_norms(vectors)
+        self.size = needed
+
+    def remove(self, id_value: int) -> bool:
+        positions = np.flatnonzero(self.ids[:self.size] == id_value)
+        if positions.size == 0:
+            return False
+        position, last = positions[0], self.size - 1
+        self.ids[position] = self.ids[last]
+        self.vectors[position] = self.vectors[last]
+        self.sq_norms[position] = self.sq_norms[last]
+        self.size = last
+        return True
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        distances = matching.batch_distances(query, self.vectors[:self.size], self.sq_norms[:self.size])
+        top = matching.top_k(distances, k)
+        return self.ids[top], distances[top]
+
+
+# Tìm kiếm chính xác (duyệt toàn bộ) bằng một phép nhân ma trận
+class ExactIndex(ANNIndex):
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self._buffer = _VectorBuffer(dim)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._buffer.size
+
+    def add(self, ids, vectors):
+        with self._lock:
+            self._buffer.add(np.asarray(ids, dtype=np.int64), np.asarray(vectors, dtype=np.float32))
+
+    def remove(self, ids):
+        with self._lock:
+            for id_value in np.asarray(ids, dtype=np.int64):
+                self._buffer.remove(int(id_value))
+
+    def search(self, query, k):
+        with self._lock:
+            return self._buffer.search(query, k)
+
+
+# IVF thuần NumPy: phân cụm k-means thành nlist danh sách, khi tìm kiếm chỉ duyệt nprobe cụm gần nhất.
+# Khi số vector còn ít (chưa đủ để huấn luyện), chỉ mục hoạt động như tìm kiếm chính xác.
+# Tự huấn luyện lại khi số vector tăng gấp retrain_factor lần so với lúc huấn luyện.
+# background_training=True: k-means chạy ở thread nền trên bản sao dữ liệu, trong lúc đó chỉ mục vẫn
+# phục vụ (tìm kiếm chính xác hoặc theo các cụm cũ); thêm / xóa trong lúc huấn luyện vẫn được giữ nguyên.
+class IVFIndex(ANNIndex):
+    def __init__(self, dim: int, nlist: int = 0, nprobe: int = 16, min_train_size: int = 2048,
+                 retrain_factor: float = 4.0, seed: int = 0, background_training: bool = False):
+        super().__init__(dim)
+        self.nlist = nlist  # 0: tự chọn theo số vector (~sqrt(N))
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.background_training = background_training
+        self._training: Optional[threading.Thread] = None
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._flat = _VectorBuffer(dim)  # Dữ liệu trước khi huấn luyện
+        self._centroids = None
+        self._centroid_sq_norms = None
+        self._lists = []
+        self._list_of = {}  # id -> số thứ tự cụm
+        self._trained_size = 0
+
+    def __len__(self):
+        return self._flat.size if self._centroids is None else len(self._list_of)
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def _kmeans(self, vectors: np.ndarray, nlist: int, iterations: int = 10) -> np.ndarray:
+        sample_size = min(len(vectors), max(nlist * 64, 10000))
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[self._rng.choice(sample_size, nlist, replace=False)].copy()
+        sample_sq = matching.squared_norms(sample)
+        for _ in range(iterations):
+            assignment = self._assign(sample, centroids)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(centroids)
+            non_empty = counts > 0
+            sums[non_empty] = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+            # Cụm rỗng: khởi tạo lại bằng điểm xa tâm nhất
+            if not non_empty.all():
+                distances = sample_sq - 2.0 * np.einsum("ij,ij->i", sample, centroids[assignment]) + \
+                            matching.squared_norms(centroids[assignment])
+                farthest = np.argsort(distances)[::-1][:int((~non_empty).sum())]
+                centroids[~non_empty] = sample[farthest]
+        return centroids
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+        centroid_sq = matching.squared_norms(centroids)
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            chunk = vectors[start:start + block]
+            # ||x - c||^2 = ||c||^2 - 2 x.c (+ ||x||^2 không ảnh hưởng argmin)
+            assignment[start:start + block] = np.argmin(centroid_sq[None, :] - 2.0 * (chunk @ centroids.T), axis=1)
+        return assignment
+
+    def _fit(self, vectors: np.ndarray) -> np.ndarray:
+        nlist = self.nlist or max(16, int(np.sqrt(len(vectors))))
+        return self._kmeans(vectors, min(nlist, len(vectors)))
+
+    def _install(self, centroids: np.ndarray):
+        # Chia lại toàn bộ vector hiện có (kể cả các vector thêm vào trong lúc huấn luyện) theo tâm mới
+        ids, vectors = self._all_vectors()
+        self._centroids = centroids
+        self._centroid_sq_norms = matching.squared_norms(centroids)
+        self._lists = [_VectorBuffer(self.dim) for _ in range(len(centroids))]
+        self._list_of = {}
+        self._flat = _VectorBuffer(self.dim)
+        self._trained_size = len(vectors)
+        self._add_to_lists(ids, vectors)
+
+    def _maybe_train(self):
+        # Gọi khi đang giữ self._lock
+        if self._training is not None:
+            return
+        if self._centroids is None:
+            due = self._flat.size >= self.min_train_size
+        else:
+            due = len(self._list_of) >= self.retrain_factor * self._trained_size
+        if not due:
+            return
+        _, vectors = self._all_vectors()
+        if not self.background_training:
+            self._install(self._fit(vectors))
+            return
+        self._training = threading.Thread(target=self._train_in_background, args=(vectors,),
+                                          name="ivf-train", daemon=True)
+        self._training.start()
+
+    def _train_in_background(self, vectors: np.ndarray):
+        try:
+            centroids = self._fit(vectors)
+            with self._lock:
+                self._install(centroids)
+        except Exception:
+            logger.exception("Huấn luyện chỉ mục IVF thất bại", extra={"size": len(vectors)})
+        finally:
+            with self._lock:
+                self._training = None
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> bool:
+        # Chờ lần huấn luyện nền đang chạy (nếu có); trả về False khi hết thời gian chờ
+        training = self._training
+        if training is not None:
+            training.join(timeout)
+            return not training.is_alive()
+        return True
+
+    def _add_to_lists(self, ids: np.ndarray, vectors: np.ndarray):
+        assignment = self._assign(vectors, self._centroids)
+        order = np.argsort(assignment, kind="stable")
+        boundaries = np.flatnonzero(np.diff(assignment[order])) + 1
+        for group in np.split(order, boundaries):
+            if group.size == 0:
+                continue
+            list_no = int(assignment[group[0]])
+            self._lists[list_no].add(ids[group], vectors[group])
+            for id_value in ids[group]:
+                self._list_of[int(id_value)] = list_no
+
+    def _all_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._centroids is None:
+            return self._flat.ids[:self._flat.size].copy(), self._flat.vectors[:self._flat.size].copy()
+        ids = np.concatenate([bucket.ids[:bucket.size] for bucket in self._lists])
+        vectors = np.concatenate([bucket.vectors[:bucket.size] for bucket in self._lists])
+        return ids, vectors
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._centroids is None:
+                self._flat.add(ids, vectors)
+            else:
+                self._add_to_lists(ids, vectors)
+            self._maybe_train()
+
+    def remove(self, ids):
+        with self._lock:
+            for id_value in np.asarray(ids, dtype=np.int64):
+                id_value = int(id_value)
+                if self._centroids is None:
+                    self._flat.remove(id_value)
+                    continue
+                list_no = self._list_of.pop(id_value, None)
+                if list_no is not None:
+                    self._lists[list_no].remove(id_value)
+
+    def search(self, query, k):
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if self._centroids is None:
+                return self._flat.search(query, k)
+
+            nprobe = min(self.nprobe, len(self._lists))
+            centroid_distances = self._centroid_sq_norms - 2.0 * (self._centroids @ query)
+            probes = matching.top_k(centroid_distances, nprobe)
+
+            buckets = [self._lists[list_no] for list_no in probes if self._lists[list_no].size]
+            if not buckets:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            ids = np.concatenate([bucket.ids[:bucket.size] for bucket in buckets])
+            vectors = np.concatenate([bucket.vectors[:bucket.size] for bucket in buckets])
+            sq_norms = np.concatenate([bucket.sq_norms[:bucket.size] for bucket in buckets])
+
+        distances = matching.batch_distances(query, vectors, sq_norms)
+        top = matching.top_k(distances, k)
+        return ids[top], distances[top]
+
+
+# HNSW dùng thư viện hnswlib (tùy chọn, cài bằng: pip install hnswlib)
+class HNSWIndex(ANNIndex):
+    def __init__(self, dim: int, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        import hnswlib
+
+        super().__init__(dim)
+        self._index = hnswlib.Index(space="l2", dim=dim)
+        self._index.init_index(max_elements=1024, M=m, ef_construction=ef_construction, allow_replace_deleted=True)
+        self._index.set_ef(ef_search)
+        self._ef_search = ef_search
+        self._ids = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            needed = self._index.get_current_count() + len(ids)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+            self._index.add_items(np.asarray(vectors, dtype=np.float32), ids, replace_deleted=True)
+            self._ids.update(int(id_value) for id_value in ids)
+
+    def remove(self, ids):
+        with self._lock:
+            for id_value in np.asarray(ids, dtype=np.int64):
+                if int(id_value) in self._ids:
+                    self._index.mark_deleted(int(id_value))
+                    self._ids.discard(int(id_value))
+
+    def search(self, query, k):
+        with self._lock:
+            k = min(k, len(self._ids))
+            if k == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            self._index.set_ef(max(self._ef_search, k))
+            labels, distances = self._index.knn_query(np.asarray(query, dtype=np.float32).reshape(1, -1), k=k)
+        # hnswlib trả về bình phương khoảng cách Euclid
+        return labels[0].astype(np.int64), np.sqrt(np.maximum(distances[0], 0.0))
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+# MATCH_METRIC="cosine": chỉ mục bên trong lưu vector đã chuẩn hóa L2. Với vector đơn vị
+# ||a - b||^2 = 2 - 2cos(a, b) nên k vector gần nhất theo Euclid cũng là k vector gần nhất theo cosine;
+# khoảng cách trả về được đổi lại thành khoảng cách cosine (1 - cos) như matching.batch_distances
+class CosineIndex(ANNIndex):
+    def __init__(self, index: ANNIndex):
+        super().__init__(index.dim)
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, ids, vectors):
+        self.index.add(ids, _unit_rows(vectors))
+
+    def remove(self, ids):
+        self.index.remove(ids)
+
+    def search(self, query, k):
+        ids, distances = self.index.search(_unit_rows(query), k)
+        return ids, np.square(distances) / 2.0
+
+
+def _create_l2_index(kind: str, dim: int, ivf_options: Optional[dict], options: dict) -> ANNIndex:
+    if kind == "exact":
+        return ExactIndex(dim)
+    if kind == "ivf":
+        return IVFIndex(dim, **options)
+    if kind == "hnsw":
+        try:
+            return HNSWIndex(dim, **options)
+        except ImportError:
+            logger.warning("Chưa cài hnswlib, dùng chỉ mục IVF thay cho HNSW", extra={"ivf_options": ivf_options})
+            return IVFIndex(dim, **(ivf_options or {}))
+    raise ValueError(f"Loại chỉ mục không hợp lệ: {kind}")
+
+
+# ivf_options: tùy chọn của IVFIndex khi kind="hnsw" nhưng không có hnswlib
+def create_index(kind: str, dim: int, metric: str = matching.EUCLIDEAN, ivf_options: Optional[dict] = None,
+                 **options) -> ANNIndex:
+    if metric not in matching.METRICS:
+        raise ValueError(f"Metric không hợp lệ: {metric}")
+    index = _create_l2_index(kind, dim, ivf_options, options)
+    return CosineIndex(index) if metric == matching.COSINE else index
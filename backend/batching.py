@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Callable, List, Optional, Set
+
+from backend.config import settings
+from backend.inference import InferenceExecutor, inference_executor, represent_batch
+from backend.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+WAIT_TIME_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+logger = logging.getLogger(__name__)
+
+
+# Gom các yêu cầu trích xuất vector đến gần nhau (nhiều camera cùng lúc) thành một batch:
+# chờ tối đa window_ms hoặc đến khi đủ max_batch ảnh, chạy một lần forward pass
+# rồi trả kết quả về đúng yêu cầu đang chờ.
+class MicroBatcher:
+    def __init__(self, batch_fn: Callable[[list], list], executor: InferenceExecutor,
+                 window_ms: float = 10.0, max_batch: int = 8):
+        self._batch_fn = batch_fn
+        self._executor = executor
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Giữ tham chiếu tới các batch đang chạy để task không bị thu hồi giữa chừng
+        self._tasks: Set[asyncio.Task] = set()
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_time_histogram = Histogram(WAIT_TIME_BUCKETS_MS)
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, time.perf_counter()))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(partial(self._batch_done, batch))
+
+    def _batch_done(self, batch: List[tuple], task: asyncio.Task):
+        self._tasks.discard(task)
+        error = None if task.cancelled() else task.exception()
+        if error is not None:
+            logger.error("Lỗi khi chạy batch trích xuất vector",
+                         exc_info=(type(error), error, error.__traceback__), extra={"batch_size": len(batch)})
+        elif not task.cancelled():
+            return
+        # Không để yêu cầu nào chờ mãi khi batch dừng giữa chừng
+        for _, future, _ in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    async def _run(self, batch: List[tuple]):
+        # Bỏ các yêu cầu đã bị hủy (client ngắt kết nối) trước khi chạy mô hình
+        batch = [entry for entry in batch if not entry[1].done()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        self.batch_size_histogram.observe(len(batch))
+        for _, _, submitted in batch:
+            self.wait_time_histogram.observe((started - submitted) * 1000.0)
+
+        try:
+            results = await self._executor.run(self._batch_fn, [item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def metrics(self) -> dict:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "pending": len(self._pending),
+            "running": len(self._tasks),
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "wait_time_ms": self.wait_time_histogram.snapshot(),
+        }
+
+
+embedding_batcher = MicroBatcher(
+    partial(represent_batch, model_name=settings.EMBEDDING_MODEL, detector_backend=settings.FACE_DETECTOR),
+    inference_executor,
+    window_ms=settings.INFERENCE_BATCH_WINDOW_MS,
+    max_batch=settings.INFERENCE_MAX_BATCH,
+)
+
+# Khuôn mặt đã được cắt sẵn (hộp do trình duyệt phát hiện): bỏ qua bước phát hiện, chỉ chạy mô hình
+face_embedding_batcher = MicroBatcher(
+    partial(represent_batch, model_name=settings.EMBEDDING_MODEL, detector_backend="skip"),
+    inference_executor,
+    window_ms=settings.INFERENCE_BATCH_WINDOW_MS,
+    max_batch=settings.INFERENCE_MAX_BATCH,
+)
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from backend import analytics, models
+from backend.config import settings
+
+# Hiệu chỉnh ngưỡng so khớp từ các embedding đã lưu trong PhuHuynh_Images.
+# Khoảng cách cùng người (genuine) / khác người (impostor) được cộng dồn vào histogram cố định;
+# mỗi lần chạy chỉ tính các cặp có ảnh mới (id_image > last_image_id) nên chi phí tỉ lệ với số ảnh mới.
+# Ảnh bị xóa vẫn nằm trong histogram cho đến lần chạy lại toàn bộ (--full).
+# Sử dụng: python -m backend.calibration [--full]
+
+logger = logging.getLogger(__name__)
+
+
+# =======================
+# FAR / FRR / EER
+# =======================
+def error_rates(genuine: np.ndarray, impostor: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Tỉ lệ lỗi tại từng cạnh bin (bins + 1 giá trị), chấp nhận khi khoảng cách < cạnh bin:
+    # FAR = tỉ lệ cặp khác người bị chấp nhận, FRR = tỉ lệ cặp cùng người bị từ chối
+    accepted_impostor = np.concatenate([[0], np.cumsum(impostor)])
+    accepted_genuine = np.concatenate([[0], np.cumsum(genuine)])
+    far = accepted_impostor / max(int(impostor.sum()), 1)
+    frr = 1.0 - accepted_genuine / max(int(genuine.sum()), 1)
+    return far, frr
+
+
+def choose_threshold(far: np.ndarray, frr: np.ndarray, edges: np.ndarray,
+                     target_far: float = 0.0) -> Tuple[float, float, int]:
+    # Trả về (ngưỡng, EER, vị trí cạnh bin của ngưỡng).
+    # target_far > 0: ngưỡng lớn nhất có FAR không vượt target_far; ngược lại dùng điểm EER (FAR ≈ FRR)
+    gap = np.abs(far - frr)
+    # Khi hai phân phối tách rời, nhiều ngưỡng liên tiếp cùng đạt EER: chọn điểm giữa của khoảng đó
+    ties = np.flatnonzero(gap == gap.min())
+    eer_index = int(ties[len(ties) // 2])
+    eer = float((far[eer_index] + frr[eer_index]) / 2.0)
+    if target_far > 0:
+        allowed = np.flatnonzero(far <= target_far)
+        index = int(allowed[-1]) if allowed.size else 0
+    else:
+        index = eer_index
+    return float(edges[index]), eer, index
+
+
+def parent_threshold(global_threshold: float, genuine_pairs: int, genuine_max: Optional[float],
+                     impostor_min: Optional[float]) -> float:
+    # Nới ngưỡng (có giới hạn) cho phụ huynh có ảnh khác nhau nhiều, siết ngưỡng cho phụ huynh
+    # có người khác rất giống, luôn giữ khoảng an toàn so với ảnh khác người gần nhất
+    threshold = global_threshold
+    if genuine_max is not None and genuine_pairs >= settings.CALIBRATION_MIN_GENUINE_PAIRS:
+        max_threshold = global_threshold * (1.0 + settings.CALIBRATION_PARENT_MAX_RAISE)
+        threshold = min(max(threshold, genuine_max), max_threshold)
+    if impostor_min is not None:
+        threshold = min(threshold, impostor_min * (1.0 - settings.CALIBRATION_PARENT_MARGIN))
+    return float(threshold)
+
+
+# =======================
+# Tác vụ hiệu chỉnh
+# =======================
+def _load_state(db: Session, full: bool) -> models.HieuChinhNguong:
+    metric = settings.MATCH_METRIC
+    state = db.query(models.HieuChinhNguong).filter(
+        models.HieuChinhNguong.embedding_model == settings.EMBEDDING_MODEL,
+        models.HieuChinhNguong.metric == metric
+    ).first()
+    if state is not None and not full:
+        return state
+
+    if state is None:
+        state = models.HieuChinhNguong(embedding_model=settings.EMBEDDING_MODEL, metric=metric)
+        db.add(state)
+    else:
+        state.nguong_phu_huynh.clear()
+    bins = settings.CALIBRATION_BINS
+    empty = np.zeros(bins, dtype=np.int64).tobytes()
+    state.last_image_id = 0
+    state.bins = bins
+    state.genuine_counts = empty
+    state.impostor_counts = empty
+    return state
+
+
+def run_calibration(db: Session, full: bool = False) -> dict:
+    image_ids, parent_ids, vectors = analytics.load_embeddings(db)
+    state = _load_state(db, full)
+    genuine = np.frombuffer(state.genuine_counts, dtype=np.int64).copy()
+    impostor = np.frombuffer(state.impostor_counts, dtype=np.int64).copy()
+    if not genuine.any() and not impostor.any():
+        # Thang khoảng cách được cố định từ lần đầu có dữ liệu; khoảng cách vượt quá được dồn vào bin cuối
+        state.max_distance = settings.CALIBRATION_MAX_DISTANCE or \
+            analytics.default_max_distance(vectors, state.metric)
+    bins, max_distance = state.bins, state.max_distance
+
+    # Ảnh đã sắp theo id_image: các ảnh mới nằm cuối ma trận
+    first_new = int(np.searchsorted(image_ids, state.last_image_id, side="right"))
+    new_images = len(image_ids) - first_new
+
+    # Thống kê theo phụ huynh (chỉ số gọn 0..P-1), khởi tạo từ lần chạy trước
+    parents, parent_index = np.unique(parent_ids, return_inverse=True)
+    pair_counts = np.zeros(len(parents), dtype=np.int64)
+    genuine_max = np.full(len(parents), -np.inf)
+    impostor_min = np.full(len(parents), np.inf)
+    previous = {row.id_ph: row for row in state.nguong_phu_huynh}
+    for position, id_ph in enumerate(parents.tolist()):
+        row = previous.get(id_ph)
+        if row is not None:
+            pair_counts[position] = row.genuine_pairs
+            genuine_max[position] = row.genuine_max if row.genuine_max is not None else -np.inf
+            impostor_min[position] = row.impostor_min if row.impostor_min is not None else np.inf
+
+    started = time.perf_counter()
+    if new_images:
+        for start, col_start, block, valid in analytics.pair_blocks(vectors, state.metric, first_new):
+            rows = parent_index[start:start + block.shape[0]]
+            cols = parent_index[col_start:col_start + block.shape[1]]
+            is_same = rows[:, None] == cols[None, :]
+            same_mask, diff_mask = is_same & valid, ~is_same & valid
+
+            index = analytics.bin_index(block, bins, max_distance)
+            genuine += np.bincount(index[same_mask], minlength=bins)
+            impostor += np.bincount(index[diff_mask], minlength=bins)
+
+            # Hai ảnh của một cặp cùng người có cùng phụ huynh: chỉ cần cộng theo dòng
+            np.add.at(pair_counts, rows, same_mask.sum(axis=1))
+            np.maximum.at(genuine_max, rows, np.where(same_mask, block, -np.inf).max(axis=1))
+            diff_distances = np.where(diff_mask, block, np.inf)
+            np.minimum.at(impostor_min, rows, diff_distances.min(axis=1))
+            np.minimum.at(impostor_min, cols, diff_distances.min(axis=0))
+    elapsed = time.perf_counter() - started
+
+    edges = np.linspace(0.0, max_distance, bins + 1)
+    far, frr = error_rates(genuine, impostor)
+    threshold = eer = None
+    state.far = state.frr = None
+    if genuine.sum() and impostor.sum():
+        threshold, eer, index = choose_threshold(far, frr, edges, settings.CALIBRATION_TARGET_FAR)
+        state.far, state.frr = float(far[index]), float(frr[index])
+    state.threshold, state.eer = threshold, eer
+
+    # Ghi lại thống kê và ngưỡng của từng phụ huynh
+    image_counts = np.bincount(parent_index, minlength=len(parents))
+    for position, id_ph in enumerate(parents.tolist()):
+        row = previous.pop(id_ph, None)
+        if row is None:
+            row = models.PhuHuynh_Nguong(id_ph=id_ph)
+            state.nguong_phu_huynh.append(row)
+        row.images = int(image_counts[position])
+        row.genuine_pairs = int(pair_counts[position])
+        row.genuine_max = float(genuine_max[position]) if np.isfinite(genuine_max[position]) else None
+        row.impostor_min = float(impostor_min[position]) if np.isfinite(impostor_min[position]) else None
+        row.threshold = None if threshold is None else \
+            parent_threshold(threshold, row.genuine_pairs, row.genuine_max, row.impostor_min)
+    # Phụ huynh không còn ảnh nào
+    for row in previous.values():
+        state.nguong_phu_huynh.remove(row)
+
+    state.genuine_counts = genuine.tobytes()
+    state.impostor_counts = impostor.tobytes()
+    if len(image_ids):
+        state.last_image_id = int(image_ids[-1])
+    state.updated_at = datetime.now()
+    db.commit()
+
+    return {
+        "new_images": new_images,
+        "images": len(image_ids),
+        "parents": len(parents),
+        "seconds": elapsed,
+        **calibration_summary(state),
+    }
+
+
+def calibration_summary(state: models.HieuChinhNguong, curve: bool = False) -> dict:
+    summary = {
+        "embedding_model": state.embedding_model,
+        "metric": state.metric,
+        "threshold": state.threshold,
+        "eer": state.eer,
+        "far": state.far,
+        "frr": state.frr,
+        "last_image_id": state.last_image_id,
+        "updated_at": state.updated_at.isoformat() if state.updated_at else None,
+    }
+    if curve:
+        genuine = np.frombuffer(state.genuine_counts, dtype=np.int64)
+        impostor = np.frombuffer(state.impostor_counts, dtype=np.int64)
+        far, frr = error_rates(genuine, impostor)
+        summary["curve"] = {
+            "thresholds": np.linspace(0.0, state.max_distance, state.bins + 1).tolist(),
+            "far": far.tolist(),
+            "frr": frr.tolist(),
+        }
+    return summary
+
+
+def get_calibration(db: Session) -> Optional[models.HieuChinhNguong]:
+    return db.query(models.HieuChinhNguong).filter(
+        models.HieuChinhNguong.embedding_model == settings.EMBEDDING_MODEL,
+        models.HieuChinhNguong.metric == settings.MATCH_METRIC
+    ).first()
+
+
+# =======================
+# Ngưỡng áp dụng khi nhận dạng
+# =======================
+CALIBRATED = "calibrated"
+CLIENT = "client"
+
+
+# Bản sao trong bộ nhớ của ngưỡng đã hiệu chỉnh, được đọc lại định kỳ từ CSDL
+# (tác vụ hiệu chỉnh có thể chạy ở tiến trình khác). Việc đọc chạy trong threadpool, không chặn event loop.
+class ThresholdStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = asyncio.Lock()
+        self.threshold: Optional[float] = None
+        self._parent_ids = np.empty(0, dtype=np.int64)
+        self._parent_thresholds = np.empty(0, dtype=np.float64)
+        self._loaded_at: Optional[float] = None
+        self.unavailable = False  # Không đọc được bảng hiệu chỉnh (thường do chưa chạy migrate)
+
+    def load(self, db: Session):
+        try:
+            state = get_calibration(db)
+            rows = [] if state is None or state.threshold is None else db.query(
+                models.PhuHuynh_Nguong.id_ph, models.PhuHuynh_Nguong.threshold
+            ).filter(
+                models.PhuHuynh_Nguong.id_hieu_chinh == state.id,
+                models.PhuHuynh_Nguong.threshold.isnot(None)
+            ).order_by(models.PhuHuynh_Nguong.id_ph).all()
+        except SQLAlchemyError as e:
+            # Bảng hiệu chỉnh chưa được tạo (chưa chạy migrate): dùng ngưỡng từ client.
+            # Chỉ ghi log khi chuyển sang trạng thái lỗi, không lặp lại ở mỗi chu kỳ đọc lại
+            db.rollback()
+            if not self.unavailable:
+                logger.warning("Không đọc được ngưỡng hiệu chỉnh, dùng ngưỡng từ client",
+                               extra={"error": str(e).splitlines()[0]})
+            self.unavailable = True
+            state, rows = None, []
+        else:
+            if self.unavailable:
+                logger.info("Đã đọc được ngưỡng hiệu chỉnh")
+            self.unavailable = False
+
+        with self._lock:
+            self.threshold = state.threshold if state is not None else None
+            self._parent_ids = np.array([row[0] for row in rows], dtype=np.int64)
+            self._parent_thresholds = np.array([row[1] for row in rows], dtype=np.float64)
+            self._loaded_at = time.monotonic()
+
+    def _stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > settings.CALIBRATION_REFRESH_SECONDS
+
+    async def refresh(self, db: Session):
+        if not self._stale():
+            return
+        # Chỉ một yêu cầu đọc lại; các yêu cầu đồng thời chờ kết quả đó
+        async with self._refresh_lock:
+            if self._stale():
+                await run_in_threadpool(self.load, db)
+
+    def parent_thresholds(self, id_ph: np.ndarray) -> np.ndarray:
+        # Ngưỡng cho từng phần tử của id_ph; phụ huynh chưa có ngưỡng riêng dùng ngưỡng toàn cục
+        with self._lock:
+            parent_ids, thresholds, default = self._parent_ids, self._parent_thresholds, self.threshold
+        id_ph = np.asarray(id_ph, dtype=np.int64)
+        result = np.full(id_ph.shape, default, dtype=np.float64)
+        if parent_ids.size:
+            positions = np.minimum(np.searchsorted(parent_ids, id_ph), parent_ids.size - 1)
+            found = parent_ids[positions] == id_ph
+            result[found] = thresholds[positions[found]]
+        return result
+
+    async def resolve(self, db: Session, client_threshold: Optional[float]) \
+            -> Tuple[Optional[float], Optional[Callable[[np.ndarray], np.ndarray]], str]:
+        # Trả về (ngưỡng toàn cục, hàm ngưỡng theo phụ huynh, nguồn ngưỡng) dùng cho một lần nhận dạng.
+        # Ngưỡng từ client chỉ được dùng khi cấu hình yêu cầu hoặc chưa có kết quả hiệu chỉnh.
+        if settings.THRESHOLD_SOURCE == CALIBRATED:
+            await self.refresh(db)
+            threshold = self.threshold
+            if threshold is not None:
+                return threshold, self.parent_thresholds, CALIBRATED
+        return client_threshold, None, CLIENT
+
+
+threshold_store = ThresholdStore()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.calibration",
+                                     description="Hiệu chỉnh ngưỡng so khớp từ các ảnh phụ huynh đã lưu")
+    parser.add_argument("--full", action="store_true", help="Tính lại từ đầu thay vì chỉ tính ảnh mới")
+    args = parser.parse_args(argv)
+
+    db = models.SessionLocal()
+    try:
+        print(json.dumps(run_calibration(db, args.full), ensure_ascii=False))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
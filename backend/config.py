@@ -11,6 +11,80 @@ class Settings(BaseSettings):
     REDIS_PORT: int
     REDIS_DB: int
 
+    # Nhận dạng khuôn mặt
+    EMBEDDING_MODEL: str = "Facenet"
+    FACE_DETECTOR: str = "opencv"  # detector_backend của DeepFace
+    EMBEDDING_BACKEND: str = "deepface"  # "deepface" (TensorFlow), "onnx" (ONNX Runtime CPU) hoặc "stub" (test)
+    ONNX_MODEL_PATH: str = "models/facenet.onnx"  # Tạo bằng: python scripts/export_onnx.py
+    ONNX_INTRA_OP_THREADS: int = 0  # Số thread trong một phép toán, 0 để ONNX Runtime tự chọn
+    ONNX_INTER_OP_THREADS: int = 1
+    MATCH_METRIC: str = "euclidean"  # "euclidean" hoặc "cosine"
+    MATCH_MODE: str = "raw"  # "raw": so với mọi ảnh; "template": so với mẫu đại diện của từng phụ huynh
+    TEMPLATE_MEDOIDS: int = 3  # Số medoid trong mẫu đại diện (ngoài tâm), 0 để chỉ dùng tâm
+    TEMPLATE_TIE_MARGIN: float = 0.05  # Chênh lệch (tỉ lệ theo ngưỡng) để coi hai phụ huynh là sát nhau
+    SAVE_FLIPPED_IMAGES: bool = False  # Lưu ảnh lật (tăng cường dữ liệu) ra đĩa; chỉ vector là bắt buộc
+    CLIENT_FACE_MARGIN: float = 0.2  # Mở rộng hộp khuôn mặt mỗi phía (tỉ lệ theo kích thước hộp)
+    FRAME_DECODE_MIN_SIDE: int = 480  # Cạnh ngắn tối thiểu khi giải mã frame camera (đủ cho phát hiện khuôn mặt)
+
+    # Chuẩn hóa ảnh khi tải lên (giáo viên, học sinh, phụ huynh)
+    UPLOAD_MAX_SIDE: int = 1024  # Cạnh dài tối đa của ảnh được lưu và dùng để trích xuất vector
+    UPLOAD_JPEG_QUALITY: int = 90
+    THUMBNAIL_SIZE: int = 160  # Ảnh thu nhỏ vuông cho ảnh đại diện trên giao diện
+    THUMBNAIL_FORMAT: str = "webp"  # "webp" hoặc "jpeg"
+    THUMBNAIL_QUALITY: int = 80
+
+    # Kiểm tra chất lượng frame trước khi chạy mô hình
+    QUALITY_GATE: bool = True
+    QUALITY_MIN_BLUR_VARIANCE: float = 15.0  # Phương sai Laplacian tối thiểu (đo trên ảnh thu nhỏ về cạnh ngắn 160px)
+    QUALITY_MIN_LUMINANCE: float = 40.0  # Độ sáng trung bình 0-255
+    QUALITY_MAX_LUMINANCE: float = 225.0
+    QUALITY_MIN_FACE_SIZE: int = 60  # Cạnh ngắn tối thiểu của khuôn mặt (px) khi client gửi hộp / ảnh cắt, nhỏ hơn thì yêu cầu thử lại
+    QUALITY_MIN_FACE_RATIO: float = 0.01  # Tỉ lệ diện tích khuôn mặt / frame tối thiểu khi có hộp khuôn mặt
+
+    # Bộ nhớ đệm frame liên tiếp gần giống nhau (theo phiên camera)
+    FRAME_CACHE_SIZE: int = 8  # Số frame gần nhất được lưu mỗi phiên, 0 để tắt
+    FRAME_CACHE_MAX_DISTANCE: int = 4  # Khoảng cách Hamming tối đa giữa hai hash (trên 64 bit)
+    FRAME_CACHE_TTL_SECONDS: float = 2.0
+    FRAME_CACHE_SESSIONS: int = 64  # Số phiên HTTP (session_id) tối đa được giữ
+
+    # Bộ thực thi suy luận mô hình
+    INFERENCE_EXECUTOR: str = "thread"  # "thread" hoặc "process"
+    INFERENCE_WORKERS: int = 1
+    INFERENCE_QUEUE_SIZE: int = 16  # Số yêu cầu được phép chờ ngoài các worker đang chạy
+    INFERENCE_BATCH_WINDOW_MS: float = 10.0  # Thời gian tối đa gom ảnh thành một batch
+    INFERENCE_MAX_BATCH: int = 8
+    MODEL_RETRY_SECONDS: float = 5.0  # Chờ trước khi thử nạp lại mô hình sau lỗi, tăng gấp đôi sau mỗi lần lỗi
+    MODEL_RETRY_MAX_SECONDS: float = 300.0
+
+    # Bộ nhớ đệm vector theo nội dung ảnh (SHA-256 + mô hình + bộ phát hiện + phiên bản tiền xử lý)
+    EMBEDDING_CACHE_SIZE: int = 1024  # Số vector giữ trong bộ nhớ tiến trình, 0 để tắt tầng này
+    EMBEDDING_CACHE_BACKEND: str = ""  # Tầng lâu dài: "" (không dùng), "sqlite" hoặc "redis"
+    EMBEDDING_CACHE_PATH: str = "embedding_cache.sqlite3"
+    EMBEDDING_CACHE_TTL_SECONDS: int = 0  # Thời gian sống của khóa Redis, 0 là không hết hạn
+
+    # Hiệu chỉnh ngưỡng so khớp (python -m backend.calibration)
+    # "calibrated": dùng ngưỡng đã hiệu chỉnh khi có (bỏ qua euclid_threshold); "client": luôn dùng euclid_threshold
+    THRESHOLD_SOURCE: str = "calibrated"
+    CALIBRATION_BINS: int = 1000
+    CALIBRATION_MAX_DISTANCE: float = 0.0  # Khoảng cách ứng với bin cuối, 0 để tự ước lượng
+    CALIBRATION_TARGET_FAR: float = 0.0  # FAR mục tiêu khi chọn ngưỡng toàn cục, 0 để dùng điểm EER
+    CALIBRATION_MIN_GENUINE_PAIRS: int = 3  # Số cặp ảnh tối thiểu để nới ngưỡng riêng của phụ huynh
+    CALIBRATION_PARENT_MAX_RAISE: float = 0.2  # Ngưỡng riêng không vượt quá ngưỡng toàn cục * (1 + giá trị này)
+    CALIBRATION_PARENT_MARGIN: float = 0.1  # Khoảng an toàn (tỉ lệ) so với ảnh khác người gần nhất
+    CALIBRATION_REFRESH_SECONDS: float = 60.0  # Chu kỳ đọc lại ngưỡng từ CSDL ở mỗi worker
+
+    # Logging của server (ghi qua hàng đợi bởi thread nền, token được che trước khi ghi)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (mỗi bản ghi một dòng JSON) hoặc "text"
+    LOG_QUEUE_SIZE: int = 10000  # Số bản ghi chờ ghi tối đa, vượt quá thì bỏ bản ghi thay vì chặn yêu cầu
+    LOG_MATCH_SAMPLE_RATE: float = 1.0  # Tỉ lệ lần nhận dạng ghi top kết quả (chỉ khi LOG_LEVEL=DEBUG)
+
+    # Chỉ mục tìm kiếm toàn trường (nhận dạng không giới hạn theo danh sách học sinh)
+    ANN_INDEX: str = "ivf"  # "exact", "ivf" (thuần NumPy) hoặc "hnsw" (cần hnswlib)
+    ANN_NPROBE: int = 16  # Số cụm được duyệt mỗi truy vấn với chỉ mục IVF
+    ANN_MIN_TRAIN_SIZE: int = 2048  # Dưới số vector này IVF tìm kiếm chính xác
+    ANN_CANDIDATES: int = 50  # Số vector gần nhất lấy từ chỉ mục trước khi so khớp và bỏ phiếu
+
     class Config:
         env_file = os.path.join(os.path.dirname(__file__), '.env')
         env_file_encoding = 'utf-8'
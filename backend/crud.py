@@ -1,17 +1,26 @@
+from sqlalchemy import and_, false, or_, true
 from sqlalchemy.orm import Session, joinedload
 from fastapi import HTTPException, UploadFile, File, Depends
 from backend import models, schemas
+from backend.config import settings
+from backend.gallery import gallery
+from backend.batching import embedding_batcher, face_embedding_batcher
+from backend.embedding_backends import cache_model_name
+from backend.embedding_cache import cache_key, cache_keys, embedding_cache
+from backend import imaging
+from backend.metrics import span
 from passlib.context import CryptContext
-from typing import List, Optional, Tuple
-from deepface import DeepFace
+from typing import List, Optional, Tuple, Union
+import asyncio
 import json
+import logging
 import os
 from datetime import datetime, date, time
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 from PIL import Image
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
 
 
 def hash_password(password):
@@ -21,6 +30,7 @@ def hash_password(password):
 # =======================
 # Teacher CRUD Functions
 # =======================
+@span("crud.get_all_teachers")
 def get_all_teachers(db: Session) -> List[schemas.GiaoVienResponse]:
     # Query bảng GiaoVien và join với TaiKhoan và LopHoc
     teachers = db.query(models.GiaoVien).options(
@@ -154,9 +164,6 @@ def update_teacher(db: Session, teacher_id: int, teacher: schemas.GiaoVienUpdate
     if not db_teacher:
         raise HTTPException(status_code=404, detail="Giáo viên không tồn tại.")
 
-    # Hiển thị thông tin hiện tại
-    print(f"Thông tin giáo viên trước khi cập nhật: {db_teacher}")
-
     # Cập nhật thông tin giáo viên từ thông tin nhận được
     updated_fields = []  # Danh sách các trường đã được cập nhật
 
@@ -198,9 +205,7 @@ def update_teacher(db: Session, teacher_id: int, teacher: schemas.GiaoVienUpdate
     if updated_fields:
         # Lưu thay đổi vào cơ sở dữ liệu
         db.commit()
-        print(f"Các trường đã được cập nhật: {updated_fields}")
-    else:
-        print("Không có trường nào được cập nhật.")
+        logger.info("Đã cập nhật giáo viên", extra={"id_gv": teacher_id, "fields": updated_fields})
 
     # Chuyển đổi đối tượng giáo viên thành dạng dữ liệu trả về
     teacher_data = schemas.GiaoVienResponse(
@@ -248,6 +253,7 @@ def delete_teacher(db: Session, teacher_id: int):
     # =======================
 
 
+@span("crud.get_all_students")
 def get_all_students(db: Session) -> List[schemas.HocSinhResponse]:
     students = db.query(models.HocSinh).options(
         joinedload(models.HocSinh.tai_khoan),
@@ -291,6 +297,7 @@ def get_all_students(db: Session) -> List[schemas.HocSinhResponse]:
     return result
 
 
+@span("crud.get_students_by_teacher")
 def get_students_by_teacher(db: Session, id_gv: int) -> List[schemas.HocSinhResponse]:
     students = db.query(models.HocSinh).join(models.HocSinh.lop_hoc).join(models.LopHoc.giao_viens).options(
         joinedload(models.HocSinh.tai_khoan),
@@ -427,6 +434,9 @@ def create_student_with_parents(db: Session, student_data: schemas.HocSinhCreate
 
     db.commit()
 
+    # Đồng bộ ánh xạ học sinh -> phụ huynh trong gallery nhận dạng
+    gallery.set_student_parents(new_student.id_hs, _get_parent_ids_of_student(db, new_student.id_hs))
+
     return new_student
 
 
@@ -503,9 +513,17 @@ def update_student_with_parents(db: Session, student_id: int, student_data: sche
 
     db.commit()  # Lưu tất cả các thay đổi
     db.refresh(student)  # Làm mới đối tượng học sinh để đảm bảo phản ánh thay đổi
+
+    # Đồng bộ ánh xạ học sinh -> phụ huynh trong gallery nhận dạng
+    gallery.set_student_parents(student.id_hs, _get_parent_ids_of_student(db, student.id_hs))
     return student  # Trả về đối tượng học sinh đã cập nhật
 
 
+def _get_parent_ids_of_student(db: Session, id_hs: int) -> List[int]:
+    relations = db.query(models.PhuHuynh_HocSinh.id_ph).filter(models.PhuHuynh_HocSinh.id_hs == id_hs).all()
+    return [relation.id_ph for relation in relations]
+
+
 def delete_student(db: Session, student_id: int):
     # Lấy thông tin học sinh
     db_student = db.query(models.HocSinh).filter(models.HocSinh.id_hs == student_id).first()
@@ -540,11 +558,17 @@ def delete_student(db: Session, student_id: int):
     db.delete(db_student)
     db.commit()
 
+    # Xóa học sinh và phụ huynh liên quan khỏi gallery nhận dạng
+    gallery.remove_student(student_id)
+    for id_ph in parent_ids:
+        gallery.remove_parent(id_ph)
+
     # =======================
     # Class CRUD Functions
     # =======================
 
 
+@span("crud.get_all_classes")
 def get_all_classes(db: Session):
     classes = db.query(models.LopHoc).options(
         joinedload(models.LopHoc.giao_viens),
@@ -669,6 +693,7 @@ def delete_class(db: Session, class_id: int):
     # =======================
 
 
+@span("crud.get_academic_years")
 def get_academic_years(db: Session):
     academic_years = db.query(models.NamHoc).all()
     if not academic_years:
@@ -719,6 +744,7 @@ def delete_academic_year(db: Session, year_id: int):
     # =======================
 
 
+@span("crud.get_all_parents")
 def get_all_parents(db: Session):
     return db.query(models.PhuHuynh).all()
 
@@ -827,12 +853,19 @@ def delete_parent(db: Session, id_ph: int):
 
     db.query(models.DiemDanh).filter(models.DiemDanh.id_ph_don == id_ph).delete()
     db.query(models.PhuHuynh_HocSinh).filter(models.PhuHuynh_HocSinh.id_ph == id_ph).delete()
+    db.query(models.PhuHuynh_Nguong).filter(models.PhuHuynh_Nguong.id_ph == id_ph).delete()
+    # Xóa ảnh lật trước ảnh gốc mà chúng tham chiếu (source_image_id)
+    db.query(models.PhuHuynh_Images).filter(models.PhuHuynh_Images.id_ph == id_ph,
+                                            models.PhuHuynh_Images.is_augmented == true()).delete()
     db.query(models.PhuHuynh_Images).filter(models.PhuHuynh_Images.id_ph == id_ph).delete()
 
     db.delete(db_ph)
 
     db.commit()
 
+    # Loại bỏ vector và quan hệ của phụ huynh khỏi gallery nhận dạng
+    gallery.remove_parent(id_ph)
+
     return {"message": "Xóa phụ huynh thành công!"}
 
 
@@ -841,6 +874,7 @@ def delete_parent(db: Session, id_ph: int):
 # =======================
 
 
+@span("crud.get_all_accounts")
 def get_all_accounts(db: Session):
     return db.query(models.TaiKhoan).all()
 
@@ -906,12 +940,14 @@ async def upload_teacher_image(db: Session, id_gv: int, file: UploadFile):
 
     # Tạo tên file mới với timestamp để đảm bảo không trùng
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    file_location = f"{directory}/{timestamp}_{file.filename}"
+    file_location = f"{directory}/{timestamp}_{imaging.upload_file_name(file.filename)}"
 
+    # Xoay theo EXIF, thu nhỏ về kích thước chuẩn và tạo ảnh thu nhỏ
+    normalized = await normalize_upload(await file.read())
     try:
         # Lưu file lên server
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
+        with span("file_write"):
+            imaging.save_upload(normalized, file_location)
     except Exception as e:
         raise Exception(f"Không thể lưu hình ảnh: {str(e)}")
 
@@ -919,9 +955,9 @@ async def upload_teacher_image(db: Session, id_gv: int, file: UploadFile):
     teacher_image = db.query(models.GiaoVienImages).filter(models.GiaoVienImages.id_gv == id_gv).first()
 
     if teacher_image:
-        # Nếu đã có ảnh, xóa file ảnh cũ
-        if os.path.exists(teacher_image.image_path):
-            os.remove(teacher_image.image_path)
+        # Nếu đã có ảnh, xóa file ảnh cũ cùng ảnh thu nhỏ
+        if teacher_image.image_path != file_location:
+            imaging.remove_upload(teacher_image.image_path)
         teacher_image.image_path = file_location  # Cập nhật đường dẫn ảnh mới
     else:
         # Nếu chưa có ảnh, thêm mới
@@ -957,6 +993,9 @@ async def update_student_image(db: Session, id_hs: int, image_path: str):
         student_image = models.HocSinhImages(id_hs=id_hs, image_path=image_path)
         db.add(student_image)
     else:
+        # Xóa file ảnh cũ cùng ảnh thu nhỏ
+        if student_image.image_path != image_path:
+            imaging.remove_upload(student_image.image_path)
         student_image.image_path = image_path
 
     try:
@@ -969,86 +1008,175 @@ async def update_student_image(db: Session, id_hs: int, image_path: str):
     return student_image
 
 
-async def calculate_vector(image_path: str) -> np.ndarray:
-    result = DeepFace.represent(image_path, model_name='Facenet', enforce_detection=False)
-    vector = result[0]['embedding']
-    return np.array(vector)  # Chuyển đổi thành numpy array
+async def normalize_upload(image_bytes: bytes) -> imaging.NormalizedUpload:
+    try:
+        with span("normalize"):
+            return await asyncio.to_thread(imaging.normalize_upload, image_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Ảnh không hợp lệ: {str(e)}")
 
 
-async def calculate_facial_and_vector(image_path: str) -> Tuple[dict, List[float]]:
-    result = DeepFace.represent(image_path, model_name='Facenet', enforce_detection=False)
+def _lookup_embedding(image_path: Union[str, bytes]) -> Tuple[bytes, str, Optional[np.ndarray]]:
+    if isinstance(image_path, str):
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = image_path
+    key = cache_key(image_bytes, cache_model_name(), settings.FACE_DETECTOR)
+    return image_bytes, key, embedding_cache.get(key)
+
+
+async def calculate_vector(image_path: Union[str, bytes, np.ndarray]) -> np.ndarray:
+    # image_path có thể là đường dẫn file, nội dung file ảnh hoặc ảnh BGR đã giải mã sẵn trong bộ nhớ.
+    # Với file / bytes, vector được tra trong bộ nhớ đệm theo SHA-256 nội dung trước khi chạy mô hình.
+    key = None
+    if not isinstance(image_path, np.ndarray):
+        # Đọc file, tính SHA-256 và tra tầng lâu dài (SQLite / Redis) đều chặn, nên chạy ngoài event loop
+        with span("embedding_cache"):
+            image_bytes, key, cached = await asyncio.to_thread(_lookup_embedding, image_path)
+        if cached is not None:
+            return cached.copy()
+        if isinstance(image_path, bytes):
+            try:
+                with span("decode"):
+                    image_path = imaging.decode_image(image_bytes)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Ảnh không hợp lệ: {str(e)}")
+
+    # Gom vào batch và chạy mô hình trong bộ thực thi suy luận để không chặn event loop
+    # ("model" gồm cả thời gian chờ gom batch và chờ trong hàng đợi suy luận)
+    with span("model"):
+        result = await embedding_batcher.submit(image_path)
+    vector = np.array(result[0]['embedding'], dtype=np.float32)  # Chuyển đổi thành numpy array
+    if key is not None:
+        await asyncio.to_thread(embedding_cache.put, key, vector.copy())
+    return vector
+
+
+async def calculate_face_vector(face: np.ndarray) -> np.ndarray:
+    # Ảnh khuôn mặt đã cắt sẵn: chạy mô hình với detector_backend="skip" (không phát hiện lại)
+    with span("model"):
+        result = await face_embedding_batcher.submit(face)
+    return np.array(result[0]['embedding'], dtype=np.float32)
+
+
+async def calculate_facial_and_vector(image_path: Union[str, np.ndarray]) -> Tuple[dict, List[float]]:
+    result = await embedding_batcher.submit(image_path)
     vector = result[0]['embedding']
     facial_area = result[0]['facial_area'] if 'facial_area' in result[0] else None
 
     return facial_area, vector
 
 
+def _lookup_variants(image_bytes: bytes, variants: Tuple[str, ...]) -> Tuple[List[str], List[Optional[np.ndarray]]]:
+    keys = cache_keys(image_bytes, cache_model_name(), settings.FACE_DETECTOR, variants)
+    return keys, [embedding_cache.get(key) for key in keys]
+
+
+def _store_embeddings(entries: List[Tuple[str, np.ndarray]]):
+    for key, vector in entries:
+        embedding_cache.put(key, vector)
+
+
+async def calculate_original_and_flipped_vectors(image_bytes: bytes, image: Optional[np.ndarray] = None
+                                                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Giải mã ảnh một lần (hoặc dùng ảnh BGR đã giải mã sẵn), lật mảng ngay trong bộ nhớ
+    # và gửi cả hai ảnh vào cùng một batch của mô hình. Trả về (ảnh BGR, vector ảnh gốc, vector ảnh lật)
+    if image is None:
+        try:
+            with span("decode"):
+                image = await asyncio.to_thread(imaging.decode_image, image_bytes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Ảnh không hợp lệ: {str(e)}")
+    views = [image, np.ascontiguousarray(image[:, ::-1])]
+
+    # Băm một lần cho cả hai biến thể và tra bộ nhớ đệm (kể cả tầng SQLite / Redis) ngoài event loop
+    with span("embedding_cache"):
+        keys, vectors = await asyncio.to_thread(_lookup_variants, image_bytes, ("", "flipped"))
+    missing = [index for index, vector in enumerate(vectors) if vector is None]
+
+    # Hai yêu cầu được gửi cùng lúc nên bộ gom batch chạy chung một lần forward pass
+    with span("model"):
+        results = await asyncio.gather(*(embedding_batcher.submit(views[index]) for index in missing))
+    for index, result in zip(missing, results):
+        vectors[index] = np.array(result[0]['embedding'], dtype=np.float32)
+    if missing:
+        await asyncio.to_thread(_store_embeddings, [(keys[index], vectors[index].copy()) for index in missing])
+
+    return image, np.array(vectors[0], dtype=np.float32), np.array(vectors[1], dtype=np.float32)
+
+
 async def upload_parent_image(db: Session, id_ph: int, file: UploadFile):
     directory = "images/phu_huynh"
     os.makedirs(directory, exist_ok=True)
 
     # Tạo tên file với timestamp
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    file_location = f"{directory}/{timestamp}_{file.filename}"
+    file_name = imaging.upload_file_name(file.filename)
+    file_location = f"{directory}/{timestamp}_{file_name}"
 
-    # Lưu file vào ổ đĩa
+    # Xoay theo EXIF và thu nhỏ về kích thước chuẩn: ảnh lưu trên đĩa cũng là ảnh dùng để trích xuất vector
+    normalized = await normalize_upload(await file.read())
+
+    # Lưu file và ảnh thu nhỏ vào ổ đĩa
     try:
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
+        with span("file_write"):
+            imaging.save_upload(normalized, file_location)
     except Exception as e:
         raise Exception(f"Không thể lưu hình ảnh: {str(e)}")
 
-    # Tính toán vector từ ảnh gốc
-    vector = await calculate_vector(file_location)
-
-    # Chuyển vector từ ndarray thành JSON string
-    vector_json = json.dumps(vector.tolist())
+    # Tính vector cho ảnh gốc và ảnh lật trong một batch, dùng lại ảnh đã giải mã khi chuẩn hóa
+    image, vector, flipped_vector = await calculate_original_and_flipped_vectors(normalized.data, normalized.image)
 
-    # Lưu ảnh gốc và vector vào cơ sở dữ liệu
-    new_image = models.PhuHuynh_Images(id_ph=id_ph, image_path=file_location, vector=vector_json)
+    # Lưu ảnh gốc và vector (dạng nhị phân float32) vào cơ sở dữ liệu
+    new_image = models.PhuHuynh_Images(id_ph=id_ph, image_path=file_location, is_augmented=False)
+    new_image.set_embedding(vector, settings.EMBEDDING_MODEL)
     db.add(new_image)
 
-    # Tạo ảnh lật
     try:
-        # Mở ảnh gốc
-        image = Image.open(file_location)
-        # Lật ảnh theo chiều ngang
-        flipped_image = image.transpose(Image.FLIP_LEFT_RIGHT)
+        # Lấy id_image của ảnh gốc để liên kết ảnh lật
+        db.flush()
 
-        # Kiểm tra chế độ màu và chuyển đổi sang RGB nếu cần
-        if flipped_image.mode == 'RGBA':
-            flipped_image = flipped_image.convert('RGB')
-
-        # Lưu ảnh lật
-        flipped_image_location = f"{directory}/{timestamp}_flipped_{file.filename}"
-        flipped_image.save(flipped_image_location, format='JPEG')  # Đảm bảo lưu dưới định dạng JPEG
-
-        # Tính toán vector cho ảnh lật
-        flipped_vector = await calculate_vector(flipped_image_location)
-
-        # Chuyển vector lật thành JSON string
-        flipped_vector_json = json.dumps(flipped_vector.tolist())
+        # Ảnh lật chỉ được ghi ra đĩa khi bật SAVE_FLIPPED_IMAGES, nếu không lưu đường dẫn suy ra từ ảnh gốc
+        flipped_image_location = imaging.derived_image_path(file_location)
+        if settings.SAVE_FLIPPED_IMAGES:
+            flipped_image_location = f"{directory}/{timestamp}_flipped_{file_name}"
+            Image.fromarray(np.ascontiguousarray(image[:, ::-1, ::-1])).save(flipped_image_location, format='JPEG')
 
         # Lưu ảnh lật và vector vào cơ sở dữ liệu
         new_flipped_image = models.PhuHuynh_Images(id_ph=id_ph, image_path=flipped_image_location,
-                                                   vector=flipped_vector_json)
+                                                   source_image_id=new_image.id_image, is_augmented=True)
+        new_flipped_image.set_embedding(flipped_vector, settings.EMBEDDING_MODEL)
         db.add(new_flipped_image)
 
     except Exception as e:
+        db.rollback()
         raise Exception(f"Không thể xử lý ảnh lật: {str(e)}")
 
     # Commit các bản ghi vào cơ sở dữ liệu
     try:
-        db.commit()
-        db.refresh(new_image)
-        db.refresh(new_flipped_image)
+        with span("db_write"):
+            db.commit()
+            db.refresh(new_image)
+            db.refresh(new_flipped_image)
     except Exception as e:
         db.rollback()
         raise Exception(f"Không thể thêm hình ảnh vào cơ sở dữ liệu: {str(e)}")
 
+    # Thêm vector mới vào gallery nhận dạng
+    with span("gallery_update"):
+        gallery.add_images([new_image, new_flipped_image])
+
     return new_image, new_flipped_image
 
 
+def legacy_flipped_path(image_path: str) -> str:
+    # images/phu_huynh/<timestamp>_<tên> -> images/phu_huynh/<timestamp>_flipped_<tên>
+    directory, name = os.path.split(image_path)
+    timestamp, separator, rest = name.partition("_")
+    return f"{directory}/{timestamp}_flipped_{rest}" if separator else f"{directory}/flipped_{name}"
+
+
 async def remove_parent_image(db: Session, id_image: int):
     # Truy vấn ảnh gốc
     image_record = db.query(models.PhuHuynh_Images).filter(models.PhuHuynh_Images.id_image == id_image).first()
@@ -1061,31 +1189,45 @@ async def remove_parent_image(db: Session, id_image: int):
         raise HTTPException(status_code=404, detail="Tệp ảnh gốc không tồn tại trên hệ thống")
 
     try:
-        os.remove(image_record.image_path)
-        print(f"Đã xóa ảnh gốc: {image_record.image_path}")
+        imaging.remove_upload(image_record.image_path)
+        logger.info("Đã xóa ảnh gốc", extra={"image_path": image_record.image_path})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Không thể xóa tệp ảnh gốc: {str(e)}")
 
-    # Truy vấn ảnh lật dựa trên id_image
-    flipped_image_record = db.query(models.PhuHuynh_Images).filter(
-        models.PhuHuynh_Images.id_image == id_image + 1).first()
-
-    # Nếu ảnh lật tồn tại, xóa ảnh lật
-    if flipped_image_record:
-        if not os.path.exists(flipped_image_record.image_path):
-            raise HTTPException(status_code=404, detail="Tệp ảnh lật không tồn tại trên hệ thống")
-
-        try:
-            os.remove(flipped_image_record.image_path)
-            print(f"Đã xóa ảnh lật: {flipped_image_record.image_path}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Không thể xóa tệp ảnh lật: {str(e)}")
+    # Truy vấn các ảnh lật được tạo từ ảnh gốc, kể cả ảnh lật cũ chưa được liên kết (source_image_id NULL):
+    # nhận biết qua tên tệp "<timestamp>_flipped_<tên>" hoặc dùng chung đường dẫn với ảnh gốc
+    Images = models.PhuHuynh_Images
+    legacy_paths = [legacy_flipped_path(image_record.image_path),
+                    imaging.derived_image_path(image_record.image_path)]
+    flipped_image_records = db.query(Images).filter(
+        Images.id_image != id_image,
+        or_(
+            and_(Images.source_image_id == id_image, Images.is_augmented == true()),
+            and_(Images.source_image_id.is_(None), Images.id_ph == image_record.id_ph,
+                 or_(Images.image_path.in_(legacy_paths),
+                     and_(Images.image_path == image_record.image_path, Images.is_augmented == true())))
+        )).all()
+
+    for flipped_image_record in flipped_image_records:
+        # Ảnh lật không được lưu riêng thì không có tệp (hoặc dùng chung tệp với ảnh gốc, đã xóa ở trên)
+        flipped_path = flipped_image_record.image_path
+        if flipped_path != image_record.image_path and not imaging.is_derived_path(flipped_path):
+            if not os.path.exists(flipped_path):
+                # Ảnh gốc đã bị xóa: vẫn xóa bản ghi để không còn vector mồ côi trong gallery
+                logger.warning("Tệp ảnh lật không tồn tại", extra={"image_path": flipped_path})
+            else:
+                try:
+                    imaging.remove_upload(flipped_path)
+                    logger.info("Đã xóa ảnh lật", extra={"image_path": flipped_path})
+                except Exception as e:
+                    raise HTTPException(status_code=500, detail=f"Không thể xóa tệp ảnh lật: {str(e)}")
 
         # Xóa bản ghi ảnh lật trong cơ sở dữ liệu
         db.delete(flipped_image_record)
 
     # Xóa ảnh gốc trong cơ sở dữ liệu
     db.delete(image_record)
+    removed_ids = [image_record.id_image] + [record.id_image for record in flipped_image_records]
 
     # Commit các thay đổi vào cơ sở dữ liệu
     try:
@@ -1094,26 +1236,27 @@ async def remove_parent_image(db: Session, id_image: int):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Không thể xóa ảnh trong cơ sở dữ liệu: {str(e)}")
 
+    # Xóa vector tương ứng khỏi gallery nhận dạng
+    gallery.remove_images(removed_ids)
+
     return {"detail": "Cả ảnh gốc và ảnh lật đã được xóa thành công"}
 
 
+@span("crud.get_all_images_for_parent")
 def get_all_images_for_parent(db: Session, id_ph: int):
     try:
-        # Truy vấn tất cả ảnh nhưng loại trừ ảnh lật (bằng cách kiểm tra tên tệp)
+        # Truy vấn tất cả ảnh nhưng loại trừ ảnh lật (dùng chỉ mục (id_ph, is_augmented))
         images = db.query(models.PhuHuynh_Images).filter(
             models.PhuHuynh_Images.id_ph == id_ph,
-            models.PhuHuynh_Images.image_path.notlike("%_flipped%")
+            models.PhuHuynh_Images.is_augmented == false()
         ).all()
 
         if not images:
             raise HTTPException(status_code=404, detail="Không tìm thấy ảnh nào cho phụ huynh này")
 
-        # Tạo URL cho tất cả ảnh và chuyển đổi vector nếu cần
+        # Tạo URL cho tất cả ảnh và ảnh thu nhỏ (vector được đọc qua get_embedding khi trả về)
         for image in images:
-            if isinstance(image.vector, str):
-                # Chuyển đổi chuỗi JSON thành danh sách
-                image.vector = json.loads(image.vector) if image.vector else []
-
+            image.thumbnail_path = f"http://localhost:8000/{imaging.existing_thumbnail(image.image_path)}"
             # Tạo URL cho ảnh
             image.image_path = f"http://localhost:8000/{image.image_path}"
 
@@ -1131,15 +1274,18 @@ async def get_vectors_by_student_id(db: Session, id_hs: int):
         # Lấy hình ảnh phụ huynh từ PhuHuynh_Images
         images = db.query(models.PhuHuynh_Images).filter(models.PhuHuynh_Images.id_ph == parent.id_ph).all()
         for image in images:
+            if not image.has_embedding():
+                continue
             vectors.append({
                 "id_ph": parent.id_ph,
                 "image_path": image.image_path,
-                "vector": image.vector
+                "vector": image.get_embedding()
             })
 
     return vectors
 
 
+@span("crud.get_diem_danh")
 def get_diem_danh(db: Session, id_lh: int, ngay: date):
     results = db.query(
         models.DiemDanh,
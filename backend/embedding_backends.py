@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from backend.config import settings
+
+# Các backend trích xuất vector khuôn mặt. Mọi backend nhận danh sách ảnh BGR (uint8) và trả về
+# kết quả cùng định dạng với DeepFace.represent(): mỗi ảnh là [{"embedding", "facial_area", "face_confidence"}]
+# hoặc một Exception tại đúng vị trí của ảnh lỗi. Thư viện nặng chỉ được import khi backend được nạp.
+# Chọn backend bằng EMBEDDING_BACKEND: "deepface" (TensorFlow), "onnx" (ONNX Runtime CPU) hoặc "stub".
+
+logger = logging.getLogger(__name__)
+
+
+# Thu nhỏ giữ tỉ lệ rồi đệm 0 cho vừa target_size (cao, rộng), đưa về [0, 1] -
+# giống preprocessing.resize_image của DeepFace để vector của các backend so sánh được với nhau
+def resize_face(face: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
+    import cv2
+
+    if face.dtype == np.uint8:
+        face = face.astype(np.float32) / 255.0
+    height, width = target_size
+    factor = min(height / face.shape[0], width / face.shape[1])
+    resized = cv2.resize(face, (int(face.shape[1] * factor), int(face.shape[0] * factor)))
+    pad_h, pad_w = height - resized.shape[0], width - resized.shape[1]
+    resized = np.pad(resized, ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)),
+                     "constant")
+    if resized.shape[:2] != (height, width):
+        resized = cv2.resize(resized, (width, height))
+    return resized.astype(np.float32, copy=False)
+
+
+def _whole_image_area(img: np.ndarray) -> dict:
+    return {"x": 0, "y": 0, "w": int(img.shape[1]), "h": int(img.shape[0])}
+
+
+class EmbeddingBackend(ABC):
+    name = ""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @abstractmethod
+    def load(self):
+        # Nạp mô hình (gọi trong bộ thực thi suy luận khi khởi động worker)
+        ...
+
+    @abstractmethod
+    def represent_batch(self, images: list, detector_backend: str) -> list:
+        ...
+
+
+# =======================
+# DeepFace / TensorFlow
+# =======================
+class DeepFaceBackend(EmbeddingBackend):
+    name = "deepface"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        self._batch_supported = True
+
+    def load(self):
+        from deepface import DeepFace
+
+        DeepFace.build_model(self.model_name)
+
+    def represent(self, img, detector_backend: str) -> list:
+        from deepface import DeepFace
+
+        return DeepFace.represent(img, model_name=self.model_name, enforce_detection=False,
+                                  detector_backend=detector_backend)
+
+    def represent_batch(self, images: list, detector_backend: str) -> list:
+        if self._batch_supported:
+            try:
+                return self._represent_batch(images, detector_backend)
+            except (ImportError, AttributeError, TypeError) as e:
+                # Đường batch dùng API nội bộ của DeepFace (preprocessing.resize_image, model.model,
+                # model.input_shape); phiên bản DeepFace khác API: chuyển hẳn sang chạy lần lượt từng ảnh
+                self._batch_supported = False
+                logger.warning("DeepFace không hỗ trợ trích xuất theo batch, chạy lần lượt từng ảnh",
+                               extra={"error": f"{type(e).__name__}: {e}"})
+        return [self._represent_or_error(img, detector_backend) for img in images]
+
+    # Một lần forward pass cho cả batch. Phát hiện khuôn mặt vẫn chạy riêng từng ảnh, sau đó
+    # các khuôn mặt được tiền xử lý giống hệt DeepFace.represent và ghép thành một batch.
+    def _represent_batch(self, images: list, detector_backend: str) -> list:
+        from deepface import DeepFace
+        from deepface.modules import preprocessing
+
+        model = DeepFace.build_model(self.model_name)
+        keras_model = model.model
+        target_size = model.input_shape
+
+        results = [None] * len(images)
+        faces, regions, positions = [], [], []
+        for position, img in enumerate(images):
+            try:
+                face_objs = DeepFace.extract_faces(img, detector_backend=detector_backend, enforce_detection=False,
+                                                   align=True)
+            except Exception as e:
+                results[position] = e
+                continue
+            face_obj = face_objs[0]
+            # extract_faces trả về ảnh RGB [0, 1]; represent() chuyển lại sang BGR trước khi resize
+            face = preprocessing.resize_image(img=face_obj["face"][:, :, ::-1],
+                                              target_size=(target_size[1], target_size[0]))
+            faces.append(face[0])
+            regions.append((face_obj["facial_area"], face_obj.get("confidence")))
+            positions.append(position)
+
+        if faces:
+            embeddings = np.asarray(keras_model(np.stack(faces), training=False))
+            for position, embedding, (facial_area, confidence) in zip(positions, embeddings, regions):
+                results[position] = [{
+                    "embedding": embedding.tolist(),
+                    "facial_area": facial_area,
+                    "face_confidence": confidence,
+                }]
+
+        return results
+
+    def _represent_or_error(self, img, detector_backend: str):
+        try:
+            return self.represent(img, detector_backend)
+        except Exception as e:
+            return e
+
+
+# =======================
+# ONNX Runtime (CPU)
+# =======================
+# Dùng đồ thị Facenet đã chuyển đổi sẵn (scripts/export_onnx.py) thay cho TensorFlow khi chạy mô hình.
+# Tiền xử lý giống DeepFace. Với detector khác "skip", khuôn mặt được phát hiện và xoay theo mắt bằng chính
+# DeepFace.extract_faces(align=True) để cùng hình học với ảnh phụ huynh trong gallery (cần cài deepface);
+# chỉ detector "skip" (ảnh đã là khuôn mặt) chạy được mà không cần DeepFace.
+# Cần cài: pip install onnxruntime
+class OnnxBackend(EmbeddingBackend):
+    name = "onnx"
+
+    def __init__(self, model_name: str, model_path: Optional[str] = None, intra_op_threads: Optional[int] = None,
+                 inter_op_threads: Optional[int] = None):
+        super().__init__(model_name)
+        self.model_path = model_path or settings.ONNX_MODEL_PATH
+        self.intra_op_threads = settings.ONNX_INTRA_OP_THREADS if intra_op_threads is None else intra_op_threads
+        self.inter_op_threads = settings.ONNX_INTER_OP_THREADS if inter_op_threads is None else inter_op_threads
+        self._session = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            # 0: để ONNX Runtime tự chọn theo số nhân CPU
+            options.intra_op_num_threads = self.intra_op_threads
+            options.inter_op_num_threads = self.inter_op_threads
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = onnxruntime.InferenceSession(self.model_path, sess_options=options,
+                                                   providers=["CPUExecutionProvider"])
+            model_input = session.get_inputs()[0]
+            # Đồ thị chuyển từ Keras giữ thứ tự NHWC; hỗ trợ cả NCHW
+            self._channels_first = model_input.shape[1] == 3
+            self._target_size = tuple(model_input.shape[2:4] if self._channels_first else model_input.shape[1:3])
+            self._input_name = model_input.name
+            self._session = session
+
+    def _extract(self, img: np.ndarray, detector_backend: str) -> Tuple[np.ndarray, dict, Optional[float]]:
+        if detector_backend == "skip":
+            return img, _whole_image_area(img), 0.0
+
+        from deepface import DeepFace
+
+        face_obj = DeepFace.extract_faces(img, detector_backend=detector_backend, enforce_detection=False,
+                                          align=True)[0]
+        return face_obj["face"][:, :, ::-1], face_obj["facial_area"], face_obj.get("confidence")
+
+    def represent_batch(self, images: list, detector_backend: str) -> list:
+        self.load()
+        results = [None] * len(images)
+        faces, regions, positions = [], [], []
+        for position, img in enumerate(images):
+            try:
+                face, facial_area, confidence = self._extract(img, detector_backend)
+                faces.append(resize_face(face, self._target_size))
+            except Exception as e:
+                results[position] = e
+                continue
+            regions.append((facial_area, confidence))
+            positions.append(position)
+
+        if faces:
+            batch = np.stack(faces)
+            if self._channels_first:
+                batch = batch.transpose(0, 3, 1, 2)
+            embeddings = self._session.run(None, {self._input_name: np.ascontiguousarray(batch)})[0]
+            for position, embedding, (facial_area, confidence) in zip(positions, embeddings, regions):
+                results[position] = [{
+                    "embedding": embedding.tolist(),
+                    "facial_area": facial_area,
+                    "face_confidence": confidence,
+                }]
+
+        return results
+
+
+# =======================
+# Stub (test / benchmark)
+# =======================
+# Vector xác định theo nội dung ảnh (cùng ảnh luôn cho cùng vector), không cần mô hình
+class StubBackend(EmbeddingBackend):
+    name = "stub"
+
+    def __init__(self, model_name: str, dim: int = 128):
+        super().__init__(model_name)
+        self.dim = dim
+
+    def load(self):
+        pass
+
+    def embed(self, img: np.ndarray) -> np.ndarray:
+        digest = hashlib.sha256(np.ascontiguousarray(img).tobytes()).digest()
+        rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+        return rng.normal(0.0, 1.0, self.dim).astype(np.float32)
+
+    def represent_batch(self, images: list, detector_backend: str) -> list:
+        return [[{"embedding": self.embed(img).tolist(), "facial_area": _whole_image_area(img),
+                  "face_confidence": 0.0}] for img in images]
+
+
+BACKENDS = {
+    DeepFaceBackend.name: DeepFaceBackend,
+    OnnxBackend.name: OnnxBackend,
+    StubBackend.name: StubBackend,
+}
+
+# Mỗi tiến trình (kể cả tiến trình con của ProcessPoolExecutor) giữ một instance cho mỗi (backend, mô hình)
+_instances: Dict[Tuple[str, str], EmbeddingBackend] = {}
+_instances_lock = threading.Lock()
+
+
+def get_backend(name: Optional[str] = None, model_name: Optional[str] = None) -> EmbeddingBackend:
+    name = name or settings.EMBEDDING_BACKEND
+    model_name = model_name or settings.EMBEDDING_MODEL
+    if name not in BACKENDS:
+        raise ValueError(f"Backend trích xuất vector không hợp lệ: {name}")
+    key = (name, model_name)
+    backend = _instances.get(key)
+    if backend is None:
+        with _instances_lock:
+            backend = _instances.setdefault(key, BACKENDS[name](model_name))
+    return backend
+
+
+def cache_model_name(name: Optional[str] = None, model_name: Optional[str] = None) -> str:
+    # Tên mô hình trong khóa bộ nhớ đệm vector: backend khác DeepFace có tiền xử lý / phát hiện khác một chút
+    # nên không dùng lại vector đã lưu của backend khác
+    name = name or settings.EMBEDDING_BACKEND
+    model_name = model_name or settings.EMBEDDING_MODEL
+    return model_name if name == DeepFaceBackend.name else f"{model_name}+{name}"
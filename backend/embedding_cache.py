@@ -0,0 +1,161 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from backend.config import settings
+from backend.models import EMBEDDING_DTYPE
+
+# Tăng khi thay đổi cách giải mã / tiền xử lý ảnh trước khi đưa vào mô hình,
+# để vector cũ trong bộ nhớ đệm lâu dài không còn được dùng lại
+PREPROCESSING_VERSION = 1
+
+
+# variant phân biệt các biến thể tạo ra từ cùng một ảnh (ví dụ "flipped" cho ảnh lật)
+def cache_key(image_bytes: bytes, model_name: str, detector: str, variant: str = "",
+              version: int = PREPROCESSING_VERSION) -> str:
+    return cache_keys(image_bytes, model_name, detector, (variant,), version)[0]
+
+
+def cache_keys(image_bytes: bytes, model_name: str, detector: str, variants: Sequence[str] = ("",),
+               version: int = PREPROCESSING_VERSION) -> List[str]:
+    # Các biến thể của cùng một ảnh dùng chung một lần băm SHA-256
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return [f"{digest}:{model_name}:{detector}{f':{variant}' if variant else ''}:v{version}" for variant in variants]
+
+
+# Tầng lưu trữ lâu dài: file SQLite cục bộ
+class SQLiteEmbeddingStore:
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache (cache_key TEXT PRIMARY KEY, embedding BLOB NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT embedding FROM embedding_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, value: bytes):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO embedding_cache (cache_key, embedding) VALUES (?, ?)", (key, value)
+            )
+            self._connection.commit()
+
+
+# Tầng lưu trữ lâu dài dùng chung giữa các worker: Redis
+class RedisEmbeddingStore:
+    name = "redis"
+
+    def __init__(self, ttl_seconds: int = 0):
+        import redis
+
+        self._client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB)
+        self.ttl = ttl_seconds
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(f"embedding:{key}")
+
+    def put(self, key: str, value: bytes):
+        self._client.set(f"embedding:{key}", value, ex=self.ttl or None)
+
+
+# Bộ nhớ đệm vector theo nội dung ảnh: cùng một ảnh (cùng bytes) với cùng mô hình, bộ phát hiện
+# và phiên bản tiền xử lý luôn cho cùng một vector, nên chỉ cần tra hash thay vì chạy lại mô hình.
+# Tầng LRU trong tiến trình có giới hạn; tầng lâu dài (SQLite / Redis) là tùy chọn.
+class EmbeddingCache:
+    def __init__(self, size: int = 1024, store=None):
+        self.size = size
+        self._store = store
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.store_errors = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return embedding
+
+        if self._store is not None:
+            try:
+                value = self._store.get(key)
+            except Exception:
+                # Tầng lâu dài lỗi (mất kết nối Redis...) không được làm hỏng việc trích xuất vector
+                value = None
+                with self._lock:
+                    self.store_errors += 1
+            if value is not None:
+                embedding = np.frombuffer(value, dtype=EMBEDDING_DTYPE).astype(np.float32)
+                self._remember(key, embedding)
+                with self._lock:
+                    self.store_hits += 1
+                return embedding
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, embedding: np.ndarray):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, embedding)
+        if self._store is not None:
+            try:
+                self._store.put(key, embedding.astype(EMBEDDING_DTYPE).tobytes())
+            except Exception:
+                with self._lock:
+                    self.store_errors += 1
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        if self.size <= 0:
+            return
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.store_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.size,
+                "backend": self._store.name if self._store is not None else "memory",
+                "memory_hits": self.memory_hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "store_errors": self.store_errors,
+                "hit_ratio": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+            }
+
+
+def create_embedding_cache() -> EmbeddingCache:
+    store = None
+    if settings.EMBEDDING_CACHE_BACKEND == "sqlite":
+        store = SQLiteEmbeddingStore(settings.EMBEDDING_CACHE_PATH)
+    elif settings.EMBEDDING_CACHE_BACKEND == "redis":
+        store = RedisEmbeddingStore(settings.EMBEDDING_CACHE_TTL_SECONDS)
+    elif settings.EMBEDDING_CACHE_BACKEND:
+        raise ValueError(f"Loại bộ nhớ đệm vector không hợp lệ: {settings.EMBEDDING_CACHE_BACKEND}")
+    return EmbeddingCache(settings.EMBEDDING_CACHE_SIZE, store)
+
+
+embedding_cache = create_embedding_cache()
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from backend.config import settings
+
+
+# Hash cảm quan (dHash 64 bit) của frame đã thu nhỏ: hai frame gần như giống hệt nhau
+# (phụ huynh đứng yên trước camera) có hash chỉ khác nhau vài bit.
+def frame_hash(image: np.ndarray) -> int:
+    height, width = image.shape[:2]
+    step = max(1, min(height, width) // 64)
+    gray = image[::step, ::step].mean(axis=2).astype(np.uint8)
+    thumb = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+# Bộ nhớ đệm ngắn hạn theo phiên: lưu vector của vài frame vừa xử lý,
+# frame mới đủ giống (khoảng cách Hamming nhỏ, chưa quá hạn) dùng lại vector mà không chạy mô hình.
+class FrameCache:
+    def __init__(self, max_distance: int = 4, ttl_seconds: float = 2.0, size: int = 8):
+        self.max_distance = max_distance
+        self.ttl = ttl_seconds
+        self._entries = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+
+    def lookup(self, hash_value: int) -> Optional[np.ndarray]:
+        now = time.monotonic()
+        with self._lock:
+            for index in range(len(self._entries) - 1, -1, -1):
+                cached_hash, embedding, created = self._entries[index]
+                if now - created > self.ttl:
+                    continue
+                if hamming_distance(hash_value, cached_hash) <= self.max_distance:
+                    frame_cache_stats.hit()
+                    return embedding
+        frame_cache_stats.miss()
+        return None
+
+    def store(self, hash_value: int, embedding: np.ndarray):
+        with self._lock:
+            self._entries.append((hash_value, embedding, time.monotonic()))
+
+
+class FrameCacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0}
+
+
+frame_cache_stats = FrameCacheStats()
+
+
+def new_frame_cache() -> FrameCache:
+    return FrameCache(settings.FRAME_CACHE_MAX_DISTANCE, settings.FRAME_CACHE_TTL_SECONDS, settings.FRAME_CACHE_SIZE)
+
+
+# Bộ nhớ đệm cho các yêu cầu HTTP, theo session_id do client gửi lên (mỗi camera một phiên)
+_session_caches: "OrderedDict[str, FrameCache]" = OrderedDict()
+_session_lock = threading.Lock()
+
+
+def get_session_cache(session_id: Optional[str]) -> Optional[FrameCache]:
+    if not session_id or settings.FRAME_CACHE_SIZE <= 0:
+        return None
+    with _session_lock:
+        cache = _session_caches.get(session_id)
+        if cache is None:
+            cache = new_frame_cache()
+            _session_caches[session_id] = cache
+            while len(_session_caches) > settings.FRAME_CACHE_SESSIONS:
+                _session_caches.popitem(last=False)
+        else:
+            _session_caches.move_to_end(session_id)
+        return cache
@@ -0,0 +1,287 @@
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+import numpy as np
+from sqlalchemy.orm import Session, defer
+
+from backend import imaging, matching, models
+from backend.ann import ANNIndex, create_index
+from backend.config import settings
+
+
+class GalleryCandidates(NamedTuple):
+    vectors: np.ndarray
+    sq_norms: np.ndarray  # Bình phương chuẩn của từng vector, tính sẵn cho phép so khớp
+    id_ph: np.ndarray
+    id_image: np.ndarray
+    image_paths: np.ndarray
+
+
+# Bộ nhớ đệm vector khuôn mặt phụ huynh dùng chung cho toàn tiến trình.
+# Ma trận float32 liên tục + các mảng song song id_ph / id_image / image_path,
+# cùng ánh xạ học sinh -> phụ huynh, để /admin/recognize không phải truy vấn CSDL.
+# Mỗi worker uvicorn giữ một bản riêng, được cập nhật bởi các hàm trong crud.
+class FaceGallery:
+    def __init__(self, dim: int = 128):
+        self._lock = threading.RLock()
+        self.dim = dim
+        self._size = 0
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._id_ph = np.empty(0, dtype=np.int64)
+        self._id_image = np.empty(0, dtype=np.int64)
+        self._image_paths = np.empty(0, dtype=object)
+        self._student_parents: Dict[int, Set[int]] = {}
+        self._row_of: Dict[int, int] = {}  # id_image -> vị trí dòng trong ma trận
+        # Mẫu đại diện theo phụ huynh: id_ph -> (vector mẫu, id_image nguồn, đường dẫn ảnh nguồn).
+        # Chỉ tính lại (khi cần) cho các phụ huynh có ảnh vừa thêm / xóa
+        self._templates: Dict[int, tuple] = {}
+        self._stale_templates: Set[int] = set()
+        self._template_pack: Optional[GalleryCandidates] = None
+        self._index = self._new_index()
+        self.loaded = False
+
+    def __len__(self):
+        return self._size
+
+    def _new_index(self) -> ANNIndex:
+        # Huấn luyện IVF chạy ở thread nền để việc nạp gallery lúc khởi động không bị chặn bởi k-means.
+        # Tùy chọn IVF cũng được dùng khi ANN_INDEX="hnsw" nhưng chưa cài hnswlib
+        ivf_options = {"nprobe": settings.ANN_NPROBE, "min_train_size": settings.ANN_MIN_TRAIN_SIZE,
+                       "background_training": True}
+        options = ivf_options if settings.ANN_INDEX == "ivf" else {}
+        return create_index(settings.ANN_INDEX, self.dim, metric=settings.MATCH_METRIC, ivf_options=ivf_options,
+                            **options)
+
+    # =======================
+    # Nạp toàn bộ dữ liệu
+    # =======================
+    def load(self, db: Session):
+        # Cột vector JSON chỉ được tải (trong cùng một truy vấn) cho các dòng chưa có embedding nhị phân
+        Images = models.PhuHuynh_Images
+        images = db.query(Images).options(defer(Images.vector)).filter(Images.embedding.isnot(None)).all()
+        images += db.query(Images).filter(Images.embedding.is_(None), Images.vector.isnot(None)).all()
+        relations = db.query(models.PhuHuynh_HocSinh.id_hs, models.PhuHuynh_HocSinh.id_ph).all()
+
+        student_parents: Dict[int, Set[int]] = {}
+        for id_hs, id_ph in relations:
+            student_parents.setdefault(id_hs, set()).add(id_ph)
+
+        with self._lock:
+            self._reset()
+            self._student_parents = student_parents
+            self._append(images)
+            self.loaded = True
+
+    def _reset(self):
+        self._size = 0
+        self._vectors = np.empty((0, self.dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._id_ph = np.empty(0, dtype=np.int64)
+        self._id_image = np.empty(0, dtype=np.int64)
+        self._image_paths = np.empty(0, dtype=object)
+        self._row_of = {}
+        self._index = self._new_index()
+        self._templates = {}
+        self._stale_templates = set()
+        self._template_pack = None
+
+    def _reserve(self, capacity: int):
+        # Tăng dung lượng theo cấp số nhân để việc thêm ảnh không phải cấp phát lại mỗi lần
+        if capacity <= len(self._vectors):
+            return
+        new_capacity = max(capacity, 2 * len(self._vectors), 64)
+
+        vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        id_ph = np.empty(new_capacity, dtype=np.int64)
+        id_ph[:self._size] = self._id_ph[:self._size]
+        id_image = np.empty(new_capacity, dtype=np.int64)
+        id_image[:self._size] = self._id_image[:self._size]
+        image_paths = np.empty(new_capacity, dtype=object)
+        image_paths[:self._size] = self._image_paths[:self._size]
+
+        self._vectors, self._sq_norms = vectors, sq_norms
+        self._id_ph, self._id_image, self._image_paths = id_ph, id_image, image_paths
+
+    def _append(self, images: Iterable[models.PhuHuynh_Images]):
+        rows = []
+        for image in images:
+            if image is None or not image.has_embedding():
+                continue
+            try:
+                embedding = image.get_embedding()
+            except ValueError:
+                # Bỏ qua vector hỏng để không làm hỏng toàn bộ gallery
+                continue
+            if embedding.shape != (self.dim,):
+                continue
+            rows.append((image, embedding))
+        if not rows:
+            return
+
+        self._reserve(self._size + len(rows))
+        start = self._size
+        for offset, (image, embedding) in enumerate(rows):
+            index = start + offset
+            self._vectors[index] = embedding
+            self._id_ph[index] = image.id_ph
+            self._id_image[index] = image.id_image
+            self._image_paths[index] = imaging.source_image_path(image.image_path)
+        end = start + len(rows)
+        new_rows = self._vectors[start:end]
+        self._sq_norms[start:end] = np.einsum("ij,ij->i", new_rows, new_rows)
+        self._row_of.update(zip(self._id_image[start:end].tolist(), range(start, end)))
+        self._index.add(self._id_image[start:end], new_rows)
+        self._size = end
+        self._mark_stale(self._id_ph[start:end])
+
+    def _keep(self, mask: np.ndarray):
+        # Loại bỏ các dòng không thỏa mask và dồn dữ liệu lại cho liên tục
+        kept = int(mask.sum())
+        if kept == self._size:
+            return
+        removed = self._id_image[:self._size][~mask]
+        self._mark_stale(self._id_ph[:self._size][~mask])
+        first_removed = int(np.argmin(mask))
+        self._vectors[:kept] = self._vectors[:self._size][mask]
+        self._sq_norms[:kept] = self._sq_norms[:self._size][mask]
+        self._id_ph[:kept] = self._id_ph[:self._size][mask]
+        self._id_image[:kept] = self._id_image[:self._size][mask]
+        self._image_paths[:kept] = self._image_paths[:self._size][mask]
+        self._image_paths[kept:self._size] = None
+        self._size = kept
+
+        # Chỉ các dòng sau vị trí bị xóa đầu tiên thay đổi vị trí
+        for id_image in removed.tolist():
+            self._row_of.pop(id_image, None)
+        self._row_of.update(zip(self._id_image[first_removed:kept].tolist(), range(first_removed, kept)))
+        self._index.remove(removed)
+
+    # =======================
+    # Cập nhật tại chỗ
+    # =======================
+    def add_images(self, images: Iterable[models.PhuHuynh_Images]):
+        with self._lock:
+            self._append(images)
+
+    def remove_images(self, id_images: Iterable[int]):
+        ids = np.fromiter(id_images, dtype=np.int64)
+        if ids.size == 0:
+            return
+        with self._lock:
+            self._keep(~np.isin(self._id_image[:self._size], ids))
+
+    def remove_parent(self, id_ph: int):
+        with self._lock:
+            self._keep(self._id_ph[:self._size] != id_ph)
+            for parent_ids in self._student_parents.values():
+                parent_ids.discard(id_ph)
+
+    def set_student_parents(self, id_hs: int, parent_ids: Iterable[int]):
+        with self._lock:
+            self._student_parents[id_hs] = set(parent_ids)
+
+    def remove_student(self, id_hs: int):
+        with self._lock:
+            self._student_parents.pop(id_hs, None)
+
+    # =======================
+    # Truy xuất ứng viên
+    # =======================
+    def parents_of(self, id_hs_list: Iterable[int]) -> Set[int]:
+        with self._lock:
+            parent_ids = set()
+            for id_hs in id_hs_list:
+                parent_ids.update(self._student_parents.get(id_hs, ()))
+            return parent_ids
+
+    def candidates(self, id_hs_list: List[int]) -> GalleryCandidates:
+        # Trả về bản sao vector của các phụ huynh thuộc danh sách học sinh
+        with self._lock:
+            parent_ids = self.parents_of(id_hs_list)
+            if not parent_ids:
+                mask = np.zeros(self._size, dtype=bool)
+            else:
+                mask = np.isin(self._id_ph[:self._size], np.fromiter(parent_ids, dtype=np.int64))
+            return self._rows(mask)
+
+    def search_all(self, query: np.ndarray, k: int) -> GalleryCandidates:
+        # Chế độ toàn trường: lấy k vector gần nhất trong toàn bộ gallery qua chỉ mục ANN
+        with self._lock:
+            ids, _ = self._index.search(query, k)
+            rows = np.fromiter((self._row_of[id_image] for id_image in ids.tolist() if id_image in self._row_of),
+                               dtype=np.int64)
+            return self._rows(rows)
+
+    # =======================
+    # Mẫu đại diện theo phụ huynh (MATCH_MODE="template")
+    # =======================
+    def _mark_stale(self, id_ph: np.ndarray):
+        self._stale_templates.update(np.unique(id_ph).tolist())
+        self._template_pack = None
+
+    def _refresh_templates(self):
+        if not self._stale_templates:
+            return
+        id_ph = self._id_ph[:self._size]
+        stale = np.fromiter(self._stale_templates, dtype=np.int64)
+        rows = np.flatnonzero(np.isin(id_ph, stale))
+        # Gom các dòng theo phụ huynh (ổn định) để tính mẫu cho từng người
+        rows = rows[np.argsort(id_ph[rows], kind="stable")]
+        groups = np.split(rows, np.flatnonzero(np.diff(id_ph[rows])) + 1) if rows.size else []
+
+        for parent_id in stale.tolist():
+            self._templates.pop(parent_id, None)
+        for group in groups:
+            vectors, sources = matching.parent_template(self._vectors[group], settings.TEMPLATE_MEDOIDS)
+            self._templates[int(id_ph[group[0]])] = (vectors, self._id_image[group][sources],
+                                                     self._image_paths[group][sources])
+        self._stale_templates = set()
+
+    def _pack_templates(self) -> GalleryCandidates:
+        self._refresh_templates()
+        if self._template_pack is None:
+            parents = list(self._templates)
+            if parents:
+                vectors = np.vstack([self._templates[parent_id][0] for parent_id in parents])
+                counts = [len(self._templates[parent_id][0]) for parent_id in parents]
+                self._template_pack = GalleryCandidates(
+                    vectors,
+                    matching.squared_norms(vectors),
+                    np.repeat(np.array(parents, dtype=np.int64), counts),
+                    np.concatenate([self._templates[parent_id][1] for parent_id in parents]),
+                    np.concatenate([self._templates[parent_id][2] for parent_id in parents]),
+                )
+            else:
+                self._template_pack = GalleryCandidates(
+                    np.empty((0, self.dim), dtype=np.float32), np.empty(0, dtype=np.float32),
+                    np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=object))
+        return self._template_pack
+
+    def template_candidates(self, id_hs_list: List[int]) -> GalleryCandidates:
+        # Mẫu đại diện của các phụ huynh thuộc danh sách học sinh (vài dòng mỗi người thay vì toàn bộ ảnh)
+        with self._lock:
+            pack = self._pack_templates()
+            parent_ids = np.fromiter(self.parents_of(id_hs_list), dtype=np.int64)
+            mask = np.isin(pack.id_ph, parent_ids)
+            return GalleryCandidates(*(column[mask] for column in pack))
+
+    def parent_candidates(self, parent_ids: np.ndarray) -> GalleryCandidates:
+        # Toàn bộ vector gốc của các phụ huynh cho trước (dùng để phân xử khi các mẫu quá sát nhau)
+        with self._lock:
+            return self._rows(np.isin(self._id_ph[:self._size], np.asarray(parent_ids, dtype=np.int64)))
+
+    def _rows(self, selector: np.ndarray) -> GalleryCandidates:
+        return GalleryCandidates(
+            self._vectors[:self._size][selector],
+            self._sq_norms[:self._size][selector],
+            self._id_ph[:self._size][selector],
+            self._id_image[:self._size][selector],
+            self._image_paths[:self._size][selector],
+        )
+
+
+gallery = FaceGallery()
@@ -0,0 +1,54 @@
+import redis
+from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from backend.config import settings
+from backend.gallery import gallery
+from backend.lifecycle import model_lifecycle
+from backend.models import engine
+
+router = APIRouter()
+
+# Kết nối riêng với thời gian chờ ngắn để kiểm tra sức khỏe không bị treo khi Redis không phản hồi
+_redis_client = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB,
+                            socket_connect_timeout=1, socket_timeout=1)
+
+
+def check_database() -> dict:
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as e:
+        return {"ok": False, "error": str(e), "pool": engine.pool.status()}
+    return {"ok": True, "pool": engine.pool.status()}
+
+
+def check_redis() -> dict:
+    try:
+        _redis_client.ping()
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True}
+
+
+@router.get("/live")
+async def live():
+    # Tiến trình còn chạy và event loop còn phản hồi
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    # Chỉ sẵn sàng khi mô hình đã khởi động, gallery đã nạp, CSDL và Redis đều kết nối được.
+    # Chỉ đọc trạng thái: việc thử nạp lại mô hình sau lỗi do ModelLifecycle tự thực hiện
+    checks = {
+        "model": {"ok": model_lifecycle.ready, **model_lifecycle.status()},
+        "gallery": {"ok": gallery.loaded, "vectors": len(gallery)},
+        "database": await run_in_threadpool(check_database),
+        "redis": await run_in_threadpool(check_redis),
+    }
+    is_ready = all(check["ok"] for check in checks.values())
+    return JSONResponse(status_code=200 if is_ready else 503,
+                        content={"status": "ready" if is_ready else "not_ready", "checks": checks})
@@ -0,0 +1,207 @@
+import math
+import os
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps, features
+
+from backend.config import settings
+
+
+# Giải mã ảnh trực tiếp trong bộ nhớ thành mảng numpy BGR (định dạng OpenCV mà DeepFace sử dụng).
+# Với ảnh JPEG lớn hơn nhiều so với kích thước cần thiết, dùng chế độ draft của PIL để
+# bộ giải mã JPEG thu nhỏ ngay khi giải mã (1/2, 1/4, 1/8), tiết kiệm thời gian và bộ nhớ.
+def decode_image(image_bytes: bytes, min_side: int = 0) -> np.ndarray:
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        if min_side and image.format == "JPEG":
+            width, height = image.size
+            # Chỉ thu nhỏ khi cạnh ngắn lớn hơn ít nhất 2 lần kích thước yêu cầu
+            if min(width, height) >= 2 * min_side:
+                scale = min_side / min(width, height)
+                image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        image = image.convert("RGB")
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Không thể giải mã ảnh: {str(e)}")
+
+    # RGB -> BGR
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+
+def image_size(image_bytes: bytes) -> Tuple[int, int]:
+    # Kích thước gốc (rộng, cao) của ảnh, chỉ đọc phần header
+    try:
+        return Image.open(BytesIO(image_bytes)).size
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Không thể giải mã ảnh: {str(e)}")
+
+
+def parse_face_box(value) -> Optional[Tuple[float, float, float, float]]:
+    # Hộp khuôn mặt do client gửi lên: "x,y,w,h", danh sách [x, y, w, h]
+    # hoặc đối tượng {"x", "y", "width", "height"} (định dạng detection.box của face-api.js)
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    if isinstance(value, dict):
+        value = [value.get("x"), value.get("y"), value.get("width"), value.get("height")]
+    try:
+        x, y, width, height = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise ValueError("Hộp khuôn mặt phải có dạng x,y,width,height")
+    if width <= 0 or height <= 0:
+        raise ValueError("Kích thước hộp khuôn mặt phải lớn hơn 0")
+    return x, y, width, height
+
+
+def scale_face_box(box: Tuple[float, float, float, float], source_size: Tuple[int, int],
+                   target_size: Tuple[int, int]) -> Tuple[float, float, float, float]:
+    # Đổi tọa độ hộp từ ảnh gốc sang ảnh đã giải mã (có thể đã được thu nhỏ bởi chế độ draft)
+    scale_x = target_size[0] / source_size[0]
+    scale_y = target_size[1] / source_size[1]
+    x, y, width, height = box
+    return x * scale_x, y * scale_y, width * scale_x, height * scale_y
+
+
+def crop_face(image: np.ndarray, box: Optional[Tuple[float, float, float, float]],
+              margin: float = 0.2) -> np.ndarray:
+    # Cắt khuôn mặt theo hộp (mở rộng thêm margin mỗi phía, giới hạn trong ảnh).
+    # box = None: ảnh đã là khuôn mặt được cắt sẵn. Chỉ loại hộp sai; khuôn mặt quá nhỏ do cổng chất lượng
+    # (quality.assess) xử lý.
+    height, width = image.shape[:2]
+    if box is not None:
+        x, y, box_width, box_height = box
+        left = max(0, int(math.floor(x - margin * box_width)))
+        top = max(0, int(math.floor(y - margin * box_height)))
+        right = min(width, int(math.ceil(x + box_width * (1 + margin))))
+        bottom = min(height, int(math.ceil(y + box_height * (1 + margin))))
+        if right <= left or bottom <= top:
+            raise ValueError("Hộp khuôn mặt nằm ngoài ảnh")
+        image = image[top:bottom, left:right]
+        height, width = image.shape[:2]
+
+    # Khuôn mặt người có tỉ lệ gần vuông, hộp quá dẹt là dấu hiệu phát hiện sai
+    if max(height, width) > 3 * min(height, width):
+        raise ValueError(f"Tỉ lệ hộp khuôn mặt không hợp lệ ({width}x{height})")
+    return np.ascontiguousarray(image)
+
+
+# =======================
+# Chuẩn hóa ảnh khi tải lên
+# =======================
+@dataclass
+class NormalizedUpload:
+    data: bytes  # Ảnh JPEG đã xoay theo EXIF và thu nhỏ về cạnh dài tối đa UPLOAD_MAX_SIDE
+    image: np.ndarray  # data đã giải mã (BGR), dùng trực tiếp để trích xuất vector
+    thumbnail: bytes  # Ảnh thu nhỏ kích thước cố định (THUMBNAIL_SIZE x THUMBNAIL_SIZE)
+
+
+def thumbnail_format() -> str:
+    # WebP khi bản PIL hỗ trợ, nếu không dùng JPEG
+    if settings.THUMBNAIL_FORMAT.lower() == "webp" and features.check("webp"):
+        return "webp"
+    return "jpeg"
+
+
+def thumbnail_path(image_path: str) -> str:
+    # images/phu_huynh/<tên>.jpg -> images/phu_huynh/thumbs/<tên>.webp
+    directory, name = os.path.split(image_path)
+    extension = "webp" if thumbnail_format() == "webp" else "jpg"
+    return os.path.join(directory, "thumbs", f"{os.path.splitext(name)[0]}.{extension}")
+
+
+def existing_thumbnail(image_path: str) -> str:
+    # Ảnh tải lên trước khi có ảnh thu nhỏ: trả về ảnh gốc
+    path = thumbnail_path(image_path)
+    return path if os.path.exists(path) else image_path
+
+
+# Ảnh tăng cường không có tệp riêng (SAVE_FLIPPED_IMAGES=False) lưu đường dẫn ảnh gốc kèm dấu này,
+# để mỗi tệp trên đĩa chỉ thuộc về đúng một dòng; phần "#..." bị trình duyệt bỏ qua khi tải ảnh
+DERIVED_PATH_MARKER = "#flipped"
+
+
+def derived_image_path(source_path: str) -> str:
+    return f"{source_path}{DERIVED_PATH_MARKER}"
+
+
+def is_derived_path(image_path: str) -> bool:
+    return image_path.endswith(DERIVED_PATH_MARKER)
+
+
+def source_image_path(image_path: str) -> str:
+    # Đường dẫn tệp thực sự chứa ảnh (ảnh gốc với ảnh tăng cường không lưu riêng)
+    return image_path[:-len(DERIVED_PATH_MARKER)] if is_derived_path(image_path) else image_path
+
+
+def upload_file_name(filename: Optional[str]) -> str:
+    # Ảnh sau chuẩn hóa luôn là JPEG; bỏ thư mục và phần mở rộng gốc của tên file client gửi lên
+    stem = os.path.splitext(os.path.basename(filename or ""))[0] or "image"
+    return f"{stem}.jpg"
+
+
+# Xoay ảnh theo EXIF (ảnh chụp điện thoại), thu nhỏ ảnh nhiều megapixel về kích thước chuẩn
+# và tạo ảnh thu nhỏ cho giao diện. Chạy trong threadpool vì giải mã / mã hóa ảnh lớn tốn CPU.
+def normalize_upload(image_bytes: bytes) -> NormalizedUpload:
+    max_side = settings.UPLOAD_MAX_SIDE
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        if image.format == "JPEG":
+            # Giải mã JPEG ở độ phân giải thấp hơn khi ảnh lớn hơn nhiều so với kích thước chuẩn
+            image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Không thể giải mã ảnh: {str(e)}")
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    stream = BytesIO()
+    image.save(stream, format="JPEG", quality=settings.UPLOAD_JPEG_QUALITY, optimize=True)
+    data = stream.getvalue()
+
+    return NormalizedUpload(
+        data=data,
+        # Giải mã lại từ JPEG đã lưu (không dùng điểm ảnh trước khi nén) để vector trích xuất ở đây trùng với
+        # vector tính lại từ chính các byte đó, cùng khóa trong bộ nhớ đệm vector
+        image=decode_image(data),
+        thumbnail=encode_thumbnail(image),
+    )
+
+
+def encode_thumbnail(image: Image.Image) -> bytes:
+    # Ảnh thu nhỏ vuông, cắt giữa để ảnh đại diện không bị méo
+    size = settings.THUMBNAIL_SIZE
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    stream = BytesIO()
+    thumbnail.save(stream, format=thumbnail_format(), quality=settings.THUMBNAIL_QUALITY)
+    return stream.getvalue()
+
+
+def create_thumbnail(image_path: str) -> str:
+    # Tạo ảnh thu nhỏ cho ảnh đã lưu trước đây (python -m backend.migrate thumbnails)
+    image = Image.open(image_path)
+    if image.format == "JPEG":
+        image.draft("RGB", (4 * settings.THUMBNAIL_SIZE, 4 * settings.THUMBNAIL_SIZE))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    path = thumbnail_path(image_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(encode_thumbnail(image))
+    return path
+
+
+def save_upload(normalized: NormalizedUpload, image_path: str):
+    os.makedirs(os.path.dirname(thumbnail_path(image_path)), exist_ok=True)
+    with open(image_path, "wb") as f:
+        f.write(normalized.data)
+    with open(thumbnail_path(image_path), "wb") as f:
+        f.write(normalized.thumbnail)
+
+
+def remove_upload(image_path: str):
+    # Xóa ảnh và ảnh thu nhỏ (nếu có)
+    for path in (image_path, thumbnail_path(image_path)):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,136 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+
+from backend.config import settings
+from backend.embedding_backends import get_backend
+
+
+# Trích xuất vector cho nhiều ảnh bằng backend đã cấu hình (EMBEDDING_BACKEND), thường với một lần
+# forward pass cho cả batch. Đặt ở cấp module để có thể gửi sang tiến trình con khi dùng ProcessPoolExecutor.
+# Kết quả có cùng định dạng với DeepFace.represent(); ảnh lỗi được trả về dưới dạng Exception
+# tại đúng vị trí để không ảnh hưởng các ảnh khác.
+def represent_batch(images: list, model_name: str, detector_backend: str = "opencv",
+                    backend: Optional[str] = None) -> list:
+    return get_backend(backend, model_name).represent_batch(images, detector_backend)
+
+
+# Barrier dùng chung giữa các tiến trình con của ProcessPoolExecutor (gán bởi initializer)
+_worker_barrier = None
+
+
+def _init_process_worker(barrier):
+    global _worker_barrier
+    _worker_barrier = barrier
+
+
+# Chạy fn rồi chờ ở barrier: tiến trình đang chờ không nhận thêm tác vụ, nên `workers` tác vụ này
+# chỉ hoàn tất khi mỗi tiến trình con đã chạy fn đúng một lần
+def _run_and_wait(fn, timeout: float, *args):
+    try:
+        result = fn(*args)
+    except BaseException:
+        # Không để các tiến trình khác chờ tới hết thời gian; barrier được đặt lại ở lượt chạy sau
+        _worker_barrier.abort()
+        raise
+    _worker_barrier.wait(timeout)
+    return result
+
+
+# Bộ thực thi riêng cho suy luận mô hình: các lời gọi mô hình chạy trong thread/process pool
+# thay vì trên event loop của uvicorn. Hàng đợi có giới hạn: khi đầy, yêu cầu mới bị từ chối (503)
+# thay vì làm chậm mọi camera khác.
+class InferenceExecutor:
+    def __init__(self, kind: str = "thread", workers: int = 1, queue_size: int = 16):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Loại executor không hợp lệ: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor: Optional[Executor] = None
+        self._barrier = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._barrier = multiprocessing.Barrier(self.workers)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_process_worker,
+                                                     initargs=(self._barrier,))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._executor
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    async def run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise HTTPException(status_code=503, detail="Hệ thống nhận dạng đang quá tải, vui lòng thử lại sau.")
+            self._pending += 1
+            self._submitted += 1
+            executor = self._get_executor()
+
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self._failed += 1
+            raise
+
+        # Giải phóng chỗ trong hàng đợi khi tác vụ thực sự kết thúc (kể cả khi client đã ngắt kết nối)
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    async def run_on_each_worker(self, fn, *args, timeout: float = 600.0) -> list:
+        # Thread pool: mọi worker dùng chung bộ nhớ tiến trình nên chạy một lần là đủ.
+        # Process pool: mỗi tiến trình con có bản mô hình riêng, chạy fn trong từng tiến trình
+        if self.kind == "thread":
+            return [await self.run(fn, *args)]
+        with self._lock:
+            self._get_executor()
+            self._barrier.reset()
+        return list(await asyncio.gather(*(self.run(_run_and_wait, fn, timeout, *args)
+                                           for _ in range(self.workers))))
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending = self._pending
+            return {
+                "executor": self.kind,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": min(pending, self.workers),
+                "queue_depth": max(0, pending - self.workers),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor(settings.INFERENCE_EXECUTOR, settings.INFERENCE_WORKERS,
+                                       settings.INFERENCE_QUEUE_SIZE)
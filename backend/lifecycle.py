@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+import numpy as np
+
+from backend.config import settings
+from backend.embedding_backends import get_backend
+from backend.inference import InferenceExecutor, inference_executor, represent_batch
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_image(size: int = 160) -> np.ndarray:
+    # Ảnh BGR tổng hợp cố định (gradient + nhiễu có seed) để khởi động mô hình mà không cần file trên đĩa
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, size, dtype=np.float32)
+    image = (gradient[None, :, None] + gradient[:, None, None]) / 2.0
+    image = image + rng.normal(0.0, 8.0, (size, size, 3))
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+# Chạy trong bộ thực thi suy luận (cùng thread/process sẽ xử lý yêu cầu thật).
+# Backend được giữ trong bộ nhớ của tiến trình nên mô hình chỉ nạp một lần.
+def load_and_warmup(backend_name: str, model_name: str, detector_backend: str) -> dict:
+    started = time.perf_counter()
+    get_backend(backend_name, model_name).load()
+    loaded = time.perf_counter()
+
+    # Lượt chạy đầu tiên khởi tạo bộ phát hiện và biên dịch / tối ưu đồ thị tính toán của mô hình
+    result = represent_batch([synthetic_image()], model_name, detector_backend, backend_name)[0]
+    if isinstance(result, Exception):
+        raise result
+    warmed = time.perf_counter()
+
+    return {"load_seconds": loaded - started, "warmup_seconds": warmed - loaded}
+
+
+# Vòng đời mô hình của một worker: nạp và khởi động đúng một lần, ghi lại thời gian,
+# và cung cấp trạng thái cho /health/ready để bộ cân bằng tải chỉ gửi yêu cầu tới worker đã sẵn sàng.
+# Khi lỗi, tự thử lại ở nền với thời gian chờ tăng dần (retry_seconds, gấp đôi, tối đa retry_max_seconds).
+# Với process pool, mô hình được nạp và khởi động trong từng tiến trình con trước khi báo READY.
+class ModelLifecycle:
+    def __init__(self, executor: InferenceExecutor, backend_name: str, model_name: str, detector_backend: str,
+                 retry_seconds: float = 5.0, retry_max_seconds: float = 300.0):
+        self._executor = executor
+        self.backend_name = backend_name
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.state = NOT_LOADED
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.next_retry_seconds: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    async def start(self):
+        if self.state in (LOADING, READY):
+            return
+        self.state = LOADING
+        self.error = None
+        logger.info("Đang nạp và khởi động mô hình",
+                    extra={"backend": self.backend_name, "model": self.model_name,
+                           "detector": self.detector_backend})
+        self.attempts += 1
+        try:
+            results = await self._executor.run_on_each_worker(load_and_warmup, self.backend_name, self.model_name,
+                                                              self.detector_backend)
+        except asyncio.CancelledError:
+            self.state = NOT_LOADED
+            raise
+        except Exception as e:
+            self.state = FAILED
+            self.error = str(e)
+            logger.error("Không thể khởi động mô hình", extra={"error": self.error, "attempts": self.attempts})
+            return
+        # Worker chậm nhất quyết định thời điểm sẵn sàng
+        self.load_seconds = max(timings["load_seconds"] for timings in results)
+        self.warmup_seconds = max(timings["warmup_seconds"] for timings in results)
+        self.state = READY
+        logger.info("Mô hình đã sẵn sàng",
+                    extra={"load_seconds": round(self.load_seconds, 3),
+                           "warmup_seconds": round(self.warmup_seconds, 3), "workers": len(results)})
+
+    async def _start_with_retry(self):
+        delay = self.retry_seconds
+        await self.start()
+        while self.state == FAILED:
+            self.next_retry_seconds = delay
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.retry_max_seconds)
+            await self.start()
+        self.next_retry_seconds = None
+
+    def start_background(self):
+        # Không chặn sự kiện startup: worker nhận kết nối ngay, /health/ready báo chưa sẵn sàng cho đến khi xong
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._start_with_retry())
+
+    def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "backend": self.backend_name,
+            "model": self.model_name,
+            "detector": self.detector_backend,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+            "attempts": self.attempts,
+            "next_retry_seconds": self.next_retry_seconds,
+        }
+
+
+model_lifecycle = ModelLifecycle(inference_executor, settings.EMBEDDING_BACKEND, settings.EMBEDDING_MODEL,
+                                 settings.FACE_DETECTOR, settings.MODEL_RETRY_SECONDS, settings.MODEL_RETRY_MAX_SECONDS)
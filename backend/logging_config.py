@@ -0,0 +1,129 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import threading
+from typing import Optional
+
+from backend.config import settings
+
+# Cấu hình logging cho server: các luồng xử lý yêu cầu chỉ đưa bản ghi vào hàng đợi (QueueHandler),
+# việc định dạng, che token và ghi ra stdout do một thread nền (QueueListener) đảm nhận.
+
+# Thuộc tính có sẵn của LogRecord; các thuộc tính khác (truyền qua extra=...) là trường có cấu trúc
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# JWT (ba đoạn base64url, phần header bắt đầu bằng "eyJ") và giá trị sau "Bearer"
+_TOKEN_PATTERN = re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+|(?<=Bearer )[\w.~+/-]+=*")
+_SECRET_FIELDS = {"token", "access_token", "password", "matkhau", "authorization"}
+REDACTED = "[REDACTED]"
+
+
+def redact(text: str) -> str:
+    return _TOKEN_PATTERN.sub(REDACTED, text)
+
+
+# Che token trong nội dung và trong các trường có cấu trúc trước khi ghi ra ngoài
+class RedactingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in vars(record).items():
+            if key in _RECORD_ATTRIBUTES:
+                continue
+            if key.lower() in _SECRET_FIELDS:
+                setattr(record, key, REDACTED)
+            elif isinstance(value, str):
+                setattr(record, key, redact(value))
+        return True
+
+
+# Mỗi bản ghi là một dòng JSON: thời gian, mức, logger, nội dung và các trường truyền qua extra
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Không định dạng ở luồng gọi: chuỗi được ghép ở thread nền.
+        # Chỉ chuyển exception thành văn bản ngay vì traceback có thể thay đổi sau đó
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # Hàng đợi đầy (đầu ra bị nghẽn): bỏ bản ghi thay vì chặn yêu cầu đang xử lý
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[_NonBlockingQueueHandler] = None
+_lock = threading.Lock()
+
+
+def setup_logging():
+    # Gọi một lần khi khởi động server; các lần gọi sau không làm gì
+    global _listener, _queue_handler
+    with _lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stdout)
+        if settings.LOG_FORMAT == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        output.addFilter(RedactingFilter())
+
+        log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+        _queue_handler = _NonBlockingQueueHandler(log_queue)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        root.setLevel(settings.LOG_LEVEL.upper())
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    # Ghi nốt các bản ghi còn trong hàng đợi
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def dropped_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def sampled(rate: float) -> bool:
+    # Lấy mẫu các bản ghi chi tiết trên đường nóng (ví dụ top kết quả của từng lần nhận dạng)
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
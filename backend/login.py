@@ -14,8 +14,8 @@ from passlib.context import CryptContext
 import logging
 from typing import Optional
 
-# Cấu hình logging
-logging.basicConfig(level=logging.INFO)
+# Handler được cấu hình một lần khi khởi động (backend.logging_config.setup_logging).
+# Không ghi token, payload hay đối tượng người dùng ra log.
 logger = logging.getLogger(__name__)
 
 # Cấu hình cơ sở dữ liệu
@@ -74,9 +74,8 @@ def get_password_hash(password):
 def get_user(db: Session, taikhoan: str) -> TaiKhoan:
     user = db.query(TaiKhoan).filter(TaiKhoan.taikhoan == taikhoan).first()
     if user is None:
-        logger.warning(f"Không tìm thấy người dùng với tài khoản: {taikhoan}")
+        logger.warning("Không tìm thấy người dùng", extra={"taikhoan": taikhoan})
         return None
-    logger.info(f"Đã truy xuất người dùng từ cơ sở dữ liệu: {user}")
     return user
 
 
@@ -98,7 +97,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    logger.info(f"Đã tạo token truy cập cho người dùng: {data.get('sub')}")
+    logger.info("Đã tạo token truy cập", extra={"taikhoan": data.get("sub")})
     return encoded_jwt
 
 
@@ -109,9 +108,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        logger.info(f"Đang cố gắng giải mã token: {token}")
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        logger.info(f"Payload giải mã: {payload}")
 
         taikhoan: str = payload.get("sub")
         if taikhoan is None:
@@ -119,22 +116,17 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
 
         stored_token = redis_client.get(taikhoan)
-        logger.info(f"Token đã lưu cho {taikhoan}: {stored_token}")
-        logger.info(f"Token nhận được: {token}")
-
         if stored_token != token:
-            logger.warning(f"Token không khớp cho người dùng {taikhoan}")
+            logger.warning("Token không khớp với token đã lưu", extra={"taikhoan": taikhoan})
             raise credentials_exception
 
         token_data = TokenData(taikhoan=taikhoan, quyen=payload.get("quyen"))
-        logger.info(f"Đã tạo TokenData: {token_data}")
     except JWTError as e:
-        logger.error(f"Lỗi giải mã JWT: {str(e)}")
+        logger.warning("Lỗi giải mã JWT", extra={"error": str(e)})
         raise credentials_exception
 
     user = get_user(db, taikhoan=token_data.taikhoan)
     if user is None:
-        logger.warning(f"Không tìm thấy người dùng trong cơ sở dữ liệu: {token_data.taikhoan}")
         raise credentials_exception
 
     return UserInDB(
@@ -173,41 +165,37 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
 @router.post("/logout")
 async def logout(current_user: UserInDB = Depends(get_current_user)):
     redis_client.delete(current_user.taikhoan)
-    logger.info(f"Người dùng đã đăng xuất: {current_user.taikhoan}")
+    logger.info("Người dùng đã đăng xuất", extra={"taikhoan": current_user.taikhoan})
     return {"message": "Đăng xuất thành công"}
 
 
 @router.get("/admin")
 async def admin_only(current_user: UserInDB = Depends(get_current_user)):
-    logger.info(f"Yêu cầu truy cập admin từ người dùng: {current_user.taikhoan}")
     if current_user.quyen != 0:
-        logger.warning(f"Từ chối truy cập: Người dùng {current_user.taikhoan} không có quyền admin")
+        logger.warning("Từ chối truy cập: không có quyền admin",
+                       extra={"taikhoan": current_user.taikhoan})
         raise HTTPException(status_code=403, detail="Không có quyền truy cập")
-    logger.info(f"Cấp quyền truy cập admin cho người dùng: {current_user.taikhoan}")
     return {"message": "Chào mừng, Admin!"}
 
 
 @router.get("/giaovien")
 async def giaovien_only(current_user: UserInDB = Depends(get_current_user)):
-    logger.info(f"Yêu cầu truy cập giáo viên từ người dùng: {current_user.taikhoan}")
     if current_user.quyen != 1:
-        logger.warning(f"Từ chối truy cập: Người dùng {current_user.taikhoan} không có quyền giáo viên")
+        logger.warning("Từ chối truy cập: không có quyền giáo viên",
+                       extra={"taikhoan": current_user.taikhoan})
         raise HTTPException(status_code=403, detail="Không có quyền truy cập")
-    logger.info(f"Cấp quyền truy cập giáo viên cho người dùng: {current_user.taikhoan}")
     return {"message": "Chào mừng, Giáo viên!"}
 
 
 @router.get("/user")
 async def user_only(current_user: UserInDB = Depends(get_current_user)):
-    logger.info(f"Yêu cầu truy cập người dùng từ: {current_user.taikhoan}")
     if current_user.quyen != 2:
-        logger.warning(f"Từ chối truy cập: {current_user.taikhoan} không có quyền người dùng thông thường")
+        logger.warning("Từ chối truy cập: không có quyền người dùng thông thường",
+                       extra={"taikhoan": current_user.taikhoan})
         raise HTTPException(status_code=403, detail="Không có quyền truy cập")
-    logger.info(f"Cấp quyền truy cập người dùng cho: {current_user.taikhoan}")
     return {"message": "Chào mừng, Người dùng!"}
 
 
 @router.get("/admin/me", response_model=UserInDB)
 async def read_users_me(current_user: UserInDB = Depends(get_current_user)):
-    logger.info(f"Yêu cầu thông tin người dùng: {current_user.taikhoan}")
     return current_user
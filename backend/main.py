@@ -1,11 +1,26 @@
+import logging
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from backend.config import settings
+from backend.logging_config import setup_logging, shutdown_logging
 from backend.login import router as auth_router
 from backend.admin import router as admin_router
-from backend.middleware import TokenExpiryMiddleware
-from deepface import DeepFace
+from backend.health import router as health_router
+from backend.middleware import TimingMiddleware, TokenExpiryMiddleware
+from backend import metrics
+from backend.quality import quality_stats
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from backend.models import SessionLocal
+from backend.gallery import gallery
+from backend.inference import inference_executor
+from backend.lifecycle import model_lifecycle
+
+# Cấu hình logging trước khi xử lý yêu cầu: ghi qua hàng đợi bởi thread nền
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -18,9 +33,12 @@ app.add_middleware(
 )
 
 app.add_middleware(TokenExpiryMiddleware)
+# Thêm sau cùng để bao ngoài các middleware khác và đo toàn bộ thời gian xử lý
+app.add_middleware(TimingMiddleware)
 
 app.include_router(auth_router, prefix="/auth", tags=["auth"])
 app.include_router(admin_router, prefix="/admin", tags=["admin"])
+app.include_router(health_router, prefix="/health", tags=["health"])
 
 app.mount("/images", StaticFiles(directory="images"), name="images")
 
@@ -33,21 +51,45 @@ def get_db():
         db.close()
 
 
-def warmup_deepface_model():
-    print("Warming up DeepFace model...")
-    dummy_image = "temp_image.jpg"  # Sử dụng một ảnh dummy có sẵn
-    DeepFace.represent(img_path=dummy_image, model_name="Facenet", enforce_detection=False)
-    print("DeepFace model is warmed up and ready!")
+# Chỉ số dạng văn bản Prometheus: histogram theo giai đoạn và theo endpoint, số frame bị loại vì chất lượng
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    quality = quality_stats.snapshot()
+    body = metrics.render_prometheus()
+    body += metrics.render_counter("face_reco_quality_checked_total", "Số frame đã kiểm tra chất lượng",
+                                   {(): quality["checked"]})
+    body += metrics.render_counter("face_reco_quality_rejected_total", "Số frame bị loại vì chất lượng",
+                                   {(reason,): count for reason, count in quality["rejected"].items()}, ("reason",))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+def load_face_gallery():
+    db = SessionLocal()
+    try:
+        gallery.load(db)
+        logger.info("Đã nạp vector khuôn mặt phụ huynh vào bộ nhớ", extra={"vectors": len(gallery)})
+    except Exception as e:
+        # /health/ready báo gallery chưa sẵn sàng; /admin/recognize sẽ nạp lại (hoặc trả 503)
+        logger.error("Không thể nạp gallery khuôn mặt phụ huynh", extra={"error": str(e)})
+    finally:
+        db.close()
 
 
 @app.on_event("startup")
 async def on_startup():
-    warmup_deepface_model()
+    await run_in_threadpool(load_face_gallery)
+    # Nạp và khởi động mô hình ở nền (qua bộ thực thi suy luận), theo dõi tại /health/ready
+    model_lifecycle.start_background()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    model_lifecycle.stop()
+    inference_executor.shutdown()
+    shutdown_logging()
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    warmup_deepface_model()
-
     uvicorn.run(app, host="0.0.0.0", port=8000)
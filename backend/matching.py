@@ -0,0 +1,177 @@
+from typing import Callable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+EUCLIDEAN = "euclidean"
+COSINE = "cosine"
+METRICS = (EUCLIDEAN, COSINE)
+
+# Luật chọn phụ huynh: trong top 5 kết quả gần nhất, phụ huynh xuất hiện >= 2 lần được ưu tiên
+TOP_K = 5
+MIN_VOTES = 2
+
+
+class MatchResult(NamedTuple):
+    index: int  # Vị trí của ảnh khớp nhất trong tập ứng viên
+    id_ph: int
+    id_image: int
+    image_path: str
+    distance: float
+    top_indices: np.ndarray  # Chỉ số top k (đã sắp xếp tăng dần theo khoảng cách)
+    top_distances: np.ndarray
+
+
+def squared_norms(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return np.einsum("ij,ij->i", vectors, vectors)
+
+
+def batch_distances(queries: np.ndarray, vectors: np.ndarray, sq_norms: np.ndarray,
+                    metric: str = EUCLIDEAN) -> np.ndarray:
+    # Tính khoảng cách từ một (D,) hoặc nhiều (Q, D) vector truy vấn tới toàn bộ gallery
+    # bằng một phép nhân ma trận duy nhất: ||q - v||^2 = ||v||^2 - 2 q.v + ||q||^2
+    if metric not in METRICS:
+        raise ValueError(f"Độ đo khoảng cách không hợp lệ: {metric}")
+
+    queries = np.asarray(queries, dtype=np.float32)
+    single = queries.ndim == 1
+    queries = np.atleast_2d(queries)
+
+    dots = queries @ vectors.T
+    query_sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+
+    if metric == COSINE:
+        denom = np.sqrt(query_sq) * np.sqrt(sq_norms)[None, :]
+        distances = 1.0 - dots / np.maximum(denom, np.finfo(np.float32).tiny)
+    else:
+        distances = sq_norms[None, :] - 2.0 * dots + query_sq
+        np.maximum(distances, 0.0, out=distances)
+        np.sqrt(distances, out=distances)
+
+    return distances[0] if single else distances
+
+
+def top_k(distances: np.ndarray, k: int = TOP_K) -> np.ndarray:
+    # Chọn k phần tử nhỏ nhất bằng argpartition (O(n)), chỉ sắp xếp k phần tử đó
+    n = distances.shape[0]
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    k = min(k, n)
+    indices = np.argpartition(distances, k - 1)[:k] if k < n else np.arange(n)
+    return indices[np.argsort(distances[indices], kind="stable")]
+
+
+def vote(top_id_ph: np.ndarray, min_votes: int = MIN_VOTES) -> int:
+    # Trả về vị trí (trong danh sách top) của kết quả được chọn:
+    # phụ huynh đầu tiên có >= min_votes lần xuất hiện, nếu không có thì lấy kết quả gần nhất
+    if top_id_ph.size == 0:
+        raise ValueError("Danh sách top rỗng")
+    _, first_positions, counts = np.unique(top_id_ph, return_index=True, return_counts=True)
+    winners = first_positions[counts >= min_votes]
+    return int(winners.min()) if winners.size else 0
+
+
+def match(query: np.ndarray, vectors: np.ndarray, sq_norms: np.ndarray, id_ph: np.ndarray,
+          id_image: np.ndarray, image_paths: np.ndarray, threshold: float,
+          metric: str = EUCLIDEAN, k: int = TOP_K, min_votes: int = MIN_VOTES,
+          parent_thresholds: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> Optional[MatchResult]:
+    # parent_thresholds: hàm trả về ngưỡng riêng cho từng id_ph, thay cho threshold chung
+    if vectors.shape[0] == 0:
+        return None
+
+    distances = batch_distances(query, vectors, sq_norms, metric)
+
+    # Chỉ giữ các ảnh có khoảng cách dưới ngưỡng
+    limits = threshold if parent_thresholds is None else parent_thresholds(id_ph)
+    below = np.flatnonzero(distances < limits)
+    if below.size == 0:
+        return None
+
+    top = below[top_k(distances[below], k)]
+    chosen = top[vote(id_ph[top], min_votes)]
+
+    return MatchResult(
+        index=int(chosen),
+        id_ph=int(id_ph[chosen]),
+        id_image=int(id_image[chosen]),
+        image_path=image_paths[chosen],
+        distance=float(distances[chosen]),
+        top_indices=top,
+        top_distances=distances[top],
+    )
+
+
+# =======================
+# Mẫu đại diện (template) theo phụ huynh
+# =======================
+def parent_template(vectors: np.ndarray, n_medoids: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Mẫu gồm tâm đã chuẩn hóa (hướng trung bình của các vector đơn vị, độ dài bằng độ dài trung bình
+    # để cùng thang đo với ngưỡng Euclid) và tối đa n_medoids medoid: medoid thứ nhất có tổng khoảng cách
+    # nhỏ nhất, các medoid sau được chọn xa nhất so với các medoid đã chọn để phủ các góc chụp khác nhau.
+    # Trả về (vector mẫu, vị trí ảnh nguồn trong vectors); tâm dùng ảnh của medoid thứ nhất.
+    # n_medoids=0: mẫu chỉ gồm tâm.
+    if n_medoids < 0:
+        raise ValueError(f"Số medoid không hợp lệ: {n_medoids}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.sqrt(squared_norms(vectors))
+    directions = vectors / np.maximum(norms, np.finfo(np.float32).tiny)[:, None]
+    mean_direction = directions.mean(axis=0)
+    centroid = mean_direction / max(float(np.linalg.norm(mean_direction)), np.finfo(np.float32).tiny) * norms.mean()
+
+    pairwise = batch_distances(vectors, vectors, squared_norms(vectors))
+    # Medoid thứ nhất luôn được tính để làm ảnh nguồn của tâm, nhưng chỉ nằm trong mẫu khi n_medoids >= 1
+    first = int(np.argmin(pairwise.sum(axis=1)))
+    medoids = [first]
+    while len(medoids) < min(n_medoids, len(vectors)):
+        nearest = pairwise[:, medoids].min(axis=1)
+        farthest = int(np.argmax(nearest))
+        if nearest[farthest] <= 0.0:
+            break
+        medoids.append(farthest)
+
+    medoids = medoids[:n_medoids]
+    sources = np.array([first] + medoids, dtype=np.int64)
+    return np.vstack([centroid[None, :].astype(np.float32), vectors[medoids]]), sources
+
+
+def match_templates(query: np.ndarray, templates: tuple, raw_candidates: Callable[[np.ndarray], tuple],
+                    threshold: float, metric: str = EUCLIDEAN, tie_margin: float = 0.05, k: int = TOP_K,
+                    parent_thresholds: Optional[Callable[[np.ndarray], np.ndarray]] = None
+                    ) -> Tuple[Optional[MatchResult], tuple]:
+    # So khớp với mẫu đại diện của từng phụ huynh. Chỉ khi các phụ huynh gần nhất cách nhau không quá
+    # tie_margin * threshold mới so khớp lại với toàn bộ vector gốc của những phụ huynh đó.
+    # Trả về (kết quả, tập ứng viên mà các chỉ số trong kết quả tham chiếu tới).
+    vectors, sq_norms, id_ph, id_image, image_paths = templates
+    if vectors.shape[0] == 0:
+        return None, templates
+
+    distances = batch_distances(query, vectors, sq_norms, metric)
+    limits = threshold if parent_thresholds is None else parent_thresholds(id_ph)
+    below = np.flatnonzero(distances < limits)
+    if below.size == 0:
+        return None, templates
+
+    # Mẫu gần nhất của mỗi phụ huynh, sắp xếp tăng dần theo khoảng cách
+    ordered = below[np.argsort(distances[below], kind="stable")]
+    _, first_positions = np.unique(id_ph[ordered], return_index=True)
+    ranked = ordered[np.sort(first_positions)]
+
+    best = ranked[0]
+    tied = ranked[distances[ranked] - distances[best] <= tie_margin * threshold]
+    if tied.size > 1:
+        candidates = raw_candidates(id_ph[tied])
+        result = match(query, *candidates, threshold=threshold, metric=metric, k=k,
+                       parent_thresholds=parent_thresholds)
+        if result is not None:
+            return result, candidates
+
+    top = ranked[:k]
+    return MatchResult(
+        index=int(best),
+        id_ph=int(id_ph[best]),
+        id_image=int(id_image[best]),
+        image_path=image_paths[best],
+        distance=float(distances[best]),
+        top_indices=top,
+        top_distances=distances[top],
+    ), templates
@@ -0,0 +1,178 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+# Ngưỡng (giây) cho histogram thời gian xử lý
+LATENCY_BUCKETS_SECONDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Histogram với các ngưỡng (bucket) cố định, dùng để theo dõi phân phối kích thước batch, thời gian chờ...
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # Bucket cuối cùng là +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+
+        # Số lượng tích lũy theo từng ngưỡng "<= le"
+        cumulative = []
+        running = 0
+        for le, bucket_count in zip(list(self.buckets) + ["+Inf"], counts):
+            running += bucket_count
+            cumulative.append({"le": le, "count": running})
+
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": cumulative,
+        }
+
+
+# Nhóm histogram theo nhãn (giai đoạn, endpoint...), mỗi tổ hợp nhãn được tạo khi gặp lần đầu
+class HistogramFamily:
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._histograms: Dict[Tuple[str, ...], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> Histogram:
+        histogram = self._histograms.get(values)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(values, Histogram(self.buckets))
+        return histogram
+
+    def items(self):
+        with self._lock:
+            return list(self._histograms.items())
+
+
+stage_latency = HistogramFamily("face_reco_stage_seconds", "Thời gian của từng giai đoạn xử lý",
+                                ("stage",), LATENCY_BUCKETS_SECONDS)
+request_latency = HistogramFamily("face_reco_http_request_seconds", "Thời gian xử lý yêu cầu HTTP theo endpoint",
+                                  ("method", "route", "status"), LATENCY_BUCKETS_SECONDS)
+
+
+# Đo thời gian từng giai đoạn của một yêu cầu theo kiểu bấm giờ vòng:
+# lap(name) ghi lại thời gian kể từ lần lap trước (hoặc từ lúc tạo).
+# Mỗi giai đoạn cũng được ghi vào histogram stage_latency và vào bộ đếm của yêu cầu HTTP hiện tại.
+class StageTimer:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._started = time.perf_counter()
+        self._last = self._started
+
+    def lap(self, name: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        record_stage(name, elapsed, origin=self)
+        return elapsed
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @property
+    def total(self) -> float:
+        return self._last - self._started
+
+
+# =======================
+# Span theo yêu cầu
+# =======================
+# StageTimer của yêu cầu HTTP đang xử lý (do TimingMiddleware gắn), dùng để tạo header Server-Timing
+_request_timer: ContextVar[Optional[StageTimer]] = ContextVar("request_timer", default=None)
+
+
+def start_request_timer() -> Tuple[StageTimer, object]:
+    timer = StageTimer()
+    return timer, _request_timer.set(timer)
+
+
+def end_request_timer(token):
+    _request_timer.reset(token)
+
+
+def record_stage(name: str, seconds: float, origin: Optional[StageTimer] = None):
+    stage_latency.labels(name).observe(seconds)
+    if origin is not None:
+        origin.add(name, seconds)
+    timer = _request_timer.get()
+    if timer is not None and timer is not origin:
+        timer.add(name, seconds)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    # Đo một đoạn mã (dùng với "with span(...)" hoặc làm decorator cho hàm đồng bộ)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing_header(timer: StageTimer, total: float) -> str:
+    # Các giai đoạn lồng nhau (ví dụ "model" nằm trong "embed") được liệt kê riêng
+    entries = [f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in timer.stages.items()]
+    entries.append(f"total;dur={total * 1000.0:.2f}")
+    return ", ".join(entries)
+
+
+# =======================
+# Định dạng văn bản Prometheus
+# =======================
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render_histograms(family: HistogramFamily) -> str:
+    lines = [f"# HELP {family.name} {family.description}", f"# TYPE {family.name} histogram"]
+    for values, histogram in sorted(family.items()):
+        snapshot = histogram.snapshot()
+        for bucket in snapshot["buckets"]:
+            le = bucket["le"] if bucket["le"] == "+Inf" else repr(float(bucket["le"]))
+            labels = _labels(family.label_names, values, 'le="' + le + '"')
+            lines.append(f"{family.name}_bucket{labels} {bucket['count']}")
+        lines.append(f"{family.name}_sum{_labels(family.label_names, values)} {snapshot['sum']}")
+        lines.append(f"{family.name}_count{_labels(family.label_names, values)} {snapshot['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def render_counter(name: str, description: str, samples: Dict[Tuple[str, ...], float],
+                   label_names: Tuple[str, ...] = ()) -> str:
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+    for values, value in sorted(samples.items()):
+        lines.append(f"{name}{_labels(label_names, values)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def render_prometheus() -> str:
+    return render_histograms(stage_latency) + render_histograms(request_latency)
@@ -3,7 +3,9 @@ from starlette.requests import Request
 from starlette.responses import Response
 from jose import JWTError, jwt
 from backend.config import settings
+from backend import metrics
 from datetime import datetime
+import time
 
 class TokenExpiryMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -17,4 +19,23 @@ class TokenExpiryMiddleware(BaseHTTPMiddleware):
                     return Response("Token đã hết hạn", status_code=401)
             except JWTError:
                 return Response("Token không hợp lệ", status_code=401)
-        return await call_next(request)
\ No newline at end of file
+        return await call_next(request)
+
+
+# Đo thời gian mỗi yêu cầu HTTP: ghi histogram theo endpoint (mẫu đường dẫn, không phải đường dẫn thực)
+# và trả về header Server-Timing gồm các giai đoạn đã ghi trong lúc xử lý yêu cầu.
+class TimingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        started = time.perf_counter()
+        timer, token = metrics.start_request_timer()
+        try:
+            response = await call_next(request)
+        finally:
+            metrics.end_request_timer(token)
+        elapsed = time.perf_counter() - started
+
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", None) or "unmatched"
+        metrics.request_latency.labels(request.method, route_path, str(response.status_code)).observe(elapsed)
+        response.headers["Server-Timing"] = metrics.server_timing_header(timer, elapsed)
+        return response
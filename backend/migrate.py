@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+
+from sqlalchemy import false, func, inspect, or_, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import AddConstraint
+
+from backend import imaging, models
+from backend.config import settings
+
+
+# Các lệnh chuyển đổi dữ liệu cho cơ sở dữ liệu đang chạy.
+# Sử dụng: python -m backend.migrate <lệnh> [tùy chọn]
+
+def add_missing_columns(table, columns):
+    # Thêm các cột mới vào bảng nếu chưa có (ALTER TABLE ... ADD COLUMN), kèm khóa ngoại khai báo trong models
+    engine = models.engine
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    preparer = engine.dialect.identifier_preparer
+    # SQLite không hỗ trợ ALTER TABLE ... ADD CONSTRAINT: khóa ngoại được khai báo ngay trong ADD COLUMN
+    inline_foreign_keys = engine.dialect.name == "sqlite"
+
+    with engine.begin() as connection:
+        for column in columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            # Cột có giá trị mặc định phía CSDL: các dòng đã có được điền luôn giá trị này
+            default = ""
+            if column.server_default is not None:
+                arg = column.server_default.arg
+                default = f" DEFAULT {repr(arg) if isinstance(arg, str) else arg.compile(dialect=engine.dialect)}"
+            references = ""
+            if inline_foreign_keys:
+                for foreign_key in column.foreign_keys:
+                    target = foreign_key.column
+                    references += f" REFERENCES {preparer.quote(target.table.name)} ({preparer.quote(target.name)})"
+                    if foreign_key.ondelete:
+                        references += f" ON DELETE {foreign_key.ondelete}"
+            connection.execute(text(
+                f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)} "
+                f"{column_type}{default}{references}"
+            ))
+            print(f"Đã thêm cột {table.name}.{column.name}")
+
+    if not inline_foreign_keys:
+        add_missing_foreign_keys(table, columns)
+
+
+def add_missing_foreign_keys(table, columns):
+    # Thêm khóa ngoại còn thiếu cho các cột cho trước, kể cả cột đã được thêm bởi phiên bản cũ của lệnh này
+    engine = models.engine
+    constrained = {tuple(foreign_key["constrained_columns"])
+                   for foreign_key in inspect(engine).get_foreign_keys(table.name)}
+    names = {column.name for column in columns}
+    for constraint in table.foreign_key_constraints:
+        if not names & set(constraint.column_keys) or tuple(constraint.column_keys) in constrained:
+            continue
+        try:
+            with engine.begin() as connection:
+                connection.execute(AddConstraint(constraint))
+        except DBAPIError as e:
+            # Thường do dữ liệu cũ trỏ tới dòng không còn tồn tại: cần dọn dữ liệu rồi chạy lại lệnh
+            print(f"Không thể thêm khóa ngoại {table.name}({', '.join(constraint.column_keys)}): {e.orig}")
+            continue
+        print(f"Đã thêm khóa ngoại {table.name}({', '.join(constraint.column_keys)})")
+
+
+def add_missing_indexes(table, columns):
+    # Tạo các chỉ mục khai báo trong models có chứa các cột cho trước (nếu chưa có)
+    names = {column.name for column in columns}
+    for index in table.indexes:
+        if names & {column.name for column in index.columns}:
+            index.create(models.engine, checkfirst=True)
+
+
+def ensure_image_columns():
+    # Các lệnh bên dưới truy vấn toàn bộ cột của PhuHuynh_Images qua ORM nên cần đủ cột trước
+    image_table = models.PhuHuynh_Images.__table__
+    add_missing_columns(image_table, image_table.columns)
+    add_missing_indexes(image_table, image_table.columns)
+
+
+# =======================
+# PhuHuynh_Images.vector (JSON) -> PhuHuynh_Images.embedding (float32 nhị phân)
+# =======================
+def migrate_embeddings(batch_size: int, model_name: str, clear_json: bool):
+    ensure_image_columns()
+
+    db = models.SessionLocal()
+    converted = 0
+    failed = 0
+    last_id = 0
+    try:
+        # Chỉ chọn các dòng chưa có embedding nên có thể chạy lại lệnh để tiếp tục khi bị gián đoạn
+        while True:
+            rows = db.query(models.PhuHuynh_Images).filter(
+                models.PhuHuynh_Images.embedding.is_(None),
+                models.PhuHuynh_Images.vector.isnot(None),
+                models.PhuHuynh_Images.id_image > last_id
+            ).order_by(models.PhuHuynh_Images.id_image).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            for row in rows:
+                try:
+                    vector = json.loads(row.vector)
+                except ValueError:
+                    failed += 1
+                    print(f"Bỏ qua ảnh {row.id_image}: vector không hợp lệ")
+                    continue
+
+                row.set_embedding(vector, model_name)
+                if clear_json:
+                    row.vector = None
+                converted += 1
+
+            db.commit()
+            last_id = rows[-1].id_image
+            print(f"Đã chuyển đổi {converted} ảnh (id_image <= {last_id})")
+
+        if clear_json:
+            # Xóa vector JSON của các dòng đã chuyển đổi ở những lần chạy trước
+            db.query(models.PhuHuynh_Images).filter(
+                models.PhuHuynh_Images.embedding.isnot(None),
+                models.PhuHuynh_Images.vector.isnot(None)
+            ).update({models.PhuHuynh_Images.vector: None}, synchronize_session=False)
+            db.commit()
+    finally:
+        db.close()
+
+    print(f"Hoàn tất: {converted} ảnh đã chuyển đổi, {failed} ảnh lỗi.")
+
+
+# =======================
+# PhuHuynh_Images.source_image_id: liên kết ảnh lật với ảnh gốc
+# =======================
+def migrate_flipped_links(batch_size: int):
+    ensure_image_columns()
+
+    Images = models.PhuHuynh_Images
+    db = models.SessionLocal()
+    linked = 0
+    unmatched = 0
+    last_id = 0
+    try:
+        # Ảnh lật cũ được nhận biết qua tên tệp "<timestamp>_flipped_<tên>", ảnh gốc là "<timestamp>_<tên>"
+        while True:
+            rows = db.query(Images).filter(
+                Images.source_image_id.is_(None),
+                Images.image_path.like("%\\_flipped\\_%", escape="\\"),
+                Images.id_image > last_id
+            ).order_by(Images.id_image).limit(batch_size).all()
+
+            if not rows:
+                break
+
+            for row in rows:
+                original_path = row.image_path.replace("_flipped_", "_", 1)
+                original = db.query(Images.id_image).filter(
+                    Images.id_ph == row.id_ph,
+                    Images.image_path == original_path,
+                    Images.source_image_id.is_(None)
+                ).order_by(Images.id_image.desc()).first()
+
+                if original is None:
+                    unmatched += 1
+                    print(f"Bỏ qua ảnh {row.id_image}: không tìm thấy ảnh gốc {original_path}")
+                    continue
+
+                row.source_image_id = original.id_image
+                linked += 1
+
+            db.commit()
+            last_id = rows[-1].id_image
+            print(f"Đã liên kết {linked} ảnh lật (id_image <= {last_id})")
+    finally:
+        db.close()
+
+    print(f"Hoàn tất: {linked} ảnh lật đã liên kết, {unmatched} ảnh không tìm thấy ảnh gốc.")
+
+
+# =======================
+# PhuHuynh_Images.is_augmented + chỉ mục (id_ph, is_augmented)
+# =======================
+def migrate_augmented_flag(batch_size: int):
+    ensure_image_columns()
+
+    Images = models.PhuHuynh_Images
+    db = models.SessionLocal()
+    updated = 0
+    try:
+        max_id = db.query(func.max(Images.id_image)).scalar() or 0
+        # Cột mới mặc định là false; chỉ cần đánh dấu ảnh lật (đã liên kết hoặc theo tên tệp cũ).
+        # Cập nhật theo từng khoảng id_image để không khóa cả bảng trong một giao dịch dài
+        for start in range(0, max_id, batch_size):
+            in_range = (Images.id_image > start, Images.id_image <= start + batch_size)
+            augmented = or_(Images.source_image_id.isnot(None),
+                            Images.image_path.like("%\\_flipped\\_%", escape="\\"))
+            updated += db.query(Images).filter(*in_range, Images.is_augmented == false(), augmented).update(
+                {Images.is_augmented: True}, synchronize_session=False)
+            db.commit()
+            print(f"Đã cập nhật đến id_image <= {min(start + batch_size, max_id)}")
+    finally:
+        db.close()
+
+    print(f"Hoàn tất: {updated} ảnh được đánh dấu là ảnh tăng cường.")
+
+
+# =======================
+# Bảng hiệu chỉnh ngưỡng: HieuChinhNguong, PhuHuynh_Nguong
+# =======================
+def migrate_calibration_tables():
+    for table in (models.HieuChinhNguong.__table__, models.PhuHuynh_Nguong.__table__):
+        table.create(models.engine, checkfirst=True)
+        print(f"Đã kiểm tra bảng {table.name}")
+
+
+# =======================
+# Ảnh thu nhỏ cho ảnh đã tải lên trước khi có bước chuẩn hóa ảnh
+# =======================
+def migrate_thumbnails(overwrite: bool):
+    db = models.SessionLocal()
+    try:
+        paths = set()
+        for table in (models.GiaoVienImages, models.HocSinhImages, models.PhuHuynh_Images):
+            paths.update(path for (path,) in db.query(table.image_path).distinct())
+    finally:
+        db.close()
+
+    created = skipped = failed = 0
+    for path in sorted(paths):
+        if not path or not os.path.exists(path):
+            skipped += 1
+            continue
+        if not overwrite and os.path.exists(imaging.thumbnail_path(path)):
+            skipped += 1
+            continue
+        try:
+            imaging.create_thumbnail(path)
+            created += 1
+        except (OSError, ValueError) as e:
+            print(f"Bỏ qua ảnh {path}: {e}")
+            failed += 1
+
+    print(f"Hoàn tất: {created} ảnh thu nhỏ đã tạo, {skipped} ảnh bỏ qua, {failed} ảnh lỗi.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend.migrate")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embeddings = subparsers.add_parser("embeddings", help="Chuyển vector JSON sang cột embedding nhị phân")
+    embeddings.add_argument("--batch-size", type=int, default=500)
+    embeddings.add_argument("--model", default=settings.EMBEDDING_MODEL, help="Tên mô hình ghi vào embedding_model")
+    embeddings.add_argument("--clear-json", action="store_true", help="Xóa cột vector JSON sau khi chuyển đổi")
+
+    flipped_links = subparsers.add_parser("flipped-links", help="Điền source_image_id cho các ảnh lật đã có")
+    flipped_links.add_argument("--batch-size", type=int, default=500)
+
+    augmented_flag = subparsers.add_parser("augmented-flag",
+                                           help="Thêm và điền cột is_augmented cùng chỉ mục (id_ph, is_augmented)")
+    augmented_flag.add_argument("--batch-size", type=int, default=5000)
+
+    subparsers.add_parser("calibration-tables", help="Tạo các bảng lưu kết quả hiệu chỉnh ngưỡng")
+
+    thumbnails = subparsers.add_parser("thumbnails", help="Tạo ảnh thu nhỏ cho các ảnh đã tải lên")
+    thumbnails.add_argument("--overwrite", action="store_true", help="Tạo lại cả ảnh thu nhỏ đã có")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "embeddings":
+        migrate_embeddings(args.batch_size, args.model, args.clear_json)
+    elif args.command == "flipped-links":
+        migrate_flipped_links(args.batch_size)
+    elif args.command == "augmented-flag":
+        migrate_augmented_flag(args.batch_size)
+    elif args.command == "calibration-tables":
+        migrate_calibration_tables()
+    elif args.command == "thumbnails":
+        migrate_thumbnails(args.overwrite)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Date, JSON, Time, Text
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Date, JSON, Time, Text, LargeBinary, \
+    Boolean, Index, false, Float, DateTime, UniqueConstraint
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
 from config import settings
 import numpy as np
@@ -8,6 +9,18 @@ engine = create_engine(settings.DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Vector khuôn mặt được lưu dưới dạng byte float32 little-endian (128 chiều = 512 byte)
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def encode_embedding(vector) -> bytes:
+    return np.ascontiguousarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    # Đọc trực tiếp từ bộ đệm, không cần phân tích cú pháp
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+
 
 # Mô hình GiaoVien
 class GiaoVien(Base):
@@ -119,15 +132,36 @@ class PhuHuynh_Images(Base):
     id_image = Column(Integer, primary_key=True, index=True)
     id_ph = Column(Integer, ForeignKey('PhuHuynh.id_ph'))
     image_path = Column(String(255), nullable=False)
-    vector = Column(Text, nullable=True)
+    vector = Column(Text, nullable=True)  # Định dạng cũ: danh sách JSON, được thay bằng cột embedding
+    embedding = Column(LargeBinary, nullable=True)  # Vector float32 dạng nhị phân
+    embedding_model = Column(String(50), nullable=True)  # Tên mô hình đã tạo ra vector
+    embedding_dim = Column(Integer, nullable=True)  # Số chiều của vector
+    # Ảnh tăng cường (ảnh lật) trỏ về ảnh gốc đã tạo ra nó; NULL với ảnh gốc
+    source_image_id = Column(Integer, ForeignKey('PhuHuynh_Images.id_image', ondelete='CASCADE'), nullable=True,
+                             index=True)
+    is_augmented = Column(Boolean, nullable=False, default=False, server_default=false())  # Ảnh tăng cường (ảnh lật), ẩn khỏi danh sách
+
+    # Danh sách ảnh của một phụ huynh (id_ph, is_augmented = false) là một lần quét theo chỉ mục
+    __table_args__ = (Index('ix_PhuHuynh_Images_id_ph_is_augmented', 'id_ph', 'is_augmented'),)
 
     # Quan hệ với bảng PhuHuynh
     phu_huynh = relationship("PhuHuynh", back_populates="images")
 
-    def get_embedding(self):
+    def has_embedding(self) -> bool:
+        return self.embedding is not None or bool(self.vector)
+
+    def set_embedding(self, vector, model_name: str):
+        self.embedding = encode_embedding(vector)
+        self.embedding_model = model_name
+        self.embedding_dim = len(self.embedding) // EMBEDDING_DTYPE.itemsize
+
+    def get_embedding(self) -> np.ndarray:
+        if self.embedding is not None:
+            return decode_embedding(self.embedding)
         if not self.vector:
             raise ValueError(f"Vector for image {self.id_image} is empty or None.")
-        return np.array(json.loads(self.vector))  # Chuyển chuỗi JSON thành mảng numpy
+        # Dòng chưa được chuyển đổi sang định dạng nhị phân
+        return np.asarray(json.loads(self.vector), dtype=EMBEDDING_DTYPE)
 
 
 # Mô hình GiaoVien_Images
@@ -169,3 +203,43 @@ class DiemDanh(Base):
     hoc_sinh = relationship("HocSinh", back_populates="diem_danhs")
     lop_hoc = relationship("LopHoc", back_populates="lop_diem_danhs")
     phu_huynh_don = relationship("PhuHuynh", back_populates="diem_danh_don")
+
+
+# Kết quả hiệu chỉnh ngưỡng so khớp (một dòng cho mỗi mô hình + độ đo khoảng cách).
+# Histogram khoảng cách cùng người / khác người được cộng dồn qua các lần chạy;
+# last_image_id đánh dấu ảnh mới nhất đã được tính để lần sau chỉ xử lý ảnh mới.
+class HieuChinhNguong(Base):
+    __tablename__ = 'HieuChinhNguong'
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    embedding_model = Column(String(50), nullable=False)
+    metric = Column(String(20), nullable=False)
+    last_image_id = Column(Integer, nullable=False, default=0)
+    bins = Column(Integer, nullable=False)
+    max_distance = Column(Float, nullable=False)  # Khoảng cách ứng với cạnh phải của bin cuối
+    genuine_counts = Column(LargeBinary, nullable=False)  # Histogram cùng người (int64 nhị phân)
+    impostor_counts = Column(LargeBinary, nullable=False)  # Histogram khác người (int64 nhị phân)
+    threshold = Column(Float, nullable=True)  # Ngưỡng toàn cục
+    eer = Column(Float, nullable=True)
+    far = Column(Float, nullable=True)  # Tỉ lệ chấp nhận nhầm tại ngưỡng toàn cục
+    frr = Column(Float, nullable=True)  # Tỉ lệ từ chối nhầm tại ngưỡng toàn cục
+    updated_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (UniqueConstraint('embedding_model', 'metric', name='uq_HieuChinhNguong_model_metric'),)
+
+    nguong_phu_huynh = relationship("PhuHuynh_Nguong", back_populates="hieu_chinh", cascade="all, delete-orphan")
+
+
+# Ngưỡng riêng của từng phụ huynh trong một lần hiệu chỉnh
+class PhuHuynh_Nguong(Base):
+    __tablename__ = 'PhuHuynh_Nguong'
+
+    id_hieu_chinh = Column(Integer, ForeignKey('HieuChinhNguong.id', ondelete='CASCADE'), primary_key=True)
+    id_ph = Column(Integer, ForeignKey('PhuHuynh.id_ph', ondelete='CASCADE'), primary_key=True, index=True)
+    images = Column(Integer, nullable=False, default=0)
+    genuine_pairs = Column(Integer, nullable=False, default=0)
+    genuine_max = Column(Float, nullable=True)  # Khoảng cách lớn nhất giữa hai ảnh của phụ huynh
+    impostor_min = Column(Float, nullable=True)  # Khoảng cách nhỏ nhất tới ảnh của phụ huynh khác
+    threshold = Column(Float, nullable=True)  # NULL: dùng ngưỡng toàn cục
+
+    hieu_chinh = relationship("HieuChinhNguong", back_populates="nguong_phu_huynh")
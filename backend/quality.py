@@ -0,0 +1,120 @@
+import threading
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from backend.config import settings
+
+BLURRY = "blurry"
+TOO_DARK = "too_dark"
+TOO_BRIGHT = "too_bright"
+FACE_TOO_SMALL = "face_too_small"
+INVALID_FACE = "invalid_face"
+
+REASON_MESSAGES = {
+    BLURRY: "Ảnh bị mờ, vui lòng giữ yên trước camera.",
+    TOO_DARK: "Ảnh quá tối, vui lòng đứng ở nơi đủ sáng.",
+    TOO_BRIGHT: "Ảnh quá sáng, vui lòng tránh nguồn sáng chiếu thẳng.",
+    FACE_TOO_SMALL: "Khuôn mặt quá nhỏ, vui lòng đến gần camera hơn.",
+    INVALID_FACE: "Không xác định được khuôn mặt, vui lòng nhìn thẳng vào camera.",
+}
+
+# Ảnh được thu nhỏ về đúng cạnh ngắn này trước khi đo để chi phí và ngưỡng mờ không phụ thuộc độ phân giải
+_ANALYSIS_SIDE = 160
+
+
+class QualityResult(NamedTuple):
+    ok: bool
+    reason: Optional[str]
+    blur: float  # Phương sai Laplacian (càng nhỏ càng mờ)
+    luminance: float  # Độ sáng trung bình 0-255
+    face_size: Optional[int]  # Cạnh ngắn của khuôn mặt (px, theo ảnh gốc)
+
+    def to_dict(self) -> dict:
+        return {"blur": round(self.blur, 2), "luminance": round(self.luminance, 2), "face_size": self.face_size}
+
+
+# Chỉ số phẳng (hàng * rộng + cột) của các điểm lấy mẫu sao cho cạnh ngắn đúng bằng _ANALYSIS_SIDE
+@lru_cache(maxsize=16)
+def _sample_indices(height: int, width: int) -> np.ndarray:
+    scale = min(1.0, _ANALYSIS_SIDE / min(height, width))
+    rows = np.linspace(0, height - 1, max(1, round(height * scale))).round().astype(np.intp)
+    cols = np.linspace(0, width - 1, max(1, round(width * scale))).round().astype(np.intp)
+    return rows[:, None] * width + cols[None, :]
+
+
+# Ảnh BGR -> độ sáng (Rec. 601)
+_LUMA_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+
+def _grayscale(image: np.ndarray) -> np.ndarray:
+    height, width = image.shape[:2]
+    # Gom các điểm mẫu (uint8) trước rồi mới đổi sang float, không nhân trên cả ảnh gốc
+    small = image.reshape(-1, 3).take(_sample_indices(height, width), axis=0)
+    return small.astype(np.float32) @ _LUMA_WEIGHTS
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    # Cộng dồn tại chỗ để không tạo thêm mảng tạm cho mỗi phép cộng
+    laplacian = gray[:-2, 1:-1] + gray[2:, 1:-1]
+    laplacian += gray[1:-1, :-2]
+    laplacian += gray[1:-1, 2:]
+    laplacian -= 4.0 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+
+# Kiểm tra nhanh chất lượng frame (hoặc khuôn mặt đã cắt) trước khi chạy mô hình.
+# frame_size: kích thước (rộng, cao) của frame gốc khi image là khuôn mặt cắt từ frame đó,
+# dùng để kiểm tra tỉ lệ diện tích khuôn mặt.
+def assess(image: np.ndarray, face_size: Optional[Tuple[int, int]] = None,
+           frame_size: Optional[Tuple[int, int]] = None) -> QualityResult:
+    gray = _grayscale(image)
+    blur = laplacian_variance(gray)
+    luminance = float(gray.mean())
+    face_side = min(face_size) if face_size is not None else None
+
+    reason = None
+    if luminance < settings.QUALITY_MIN_LUMINANCE:
+        reason = TOO_DARK
+    elif luminance > settings.QUALITY_MAX_LUMINANCE:
+        reason = TOO_BRIGHT
+    elif blur < settings.QUALITY_MIN_BLUR_VARIANCE:
+        reason = BLURRY
+    elif face_side is not None and face_side < settings.QUALITY_MIN_FACE_SIZE:
+        reason = FACE_TOO_SMALL
+    elif face_size is not None and frame_size is not None and \
+            face_size[0] * face_size[1] < settings.QUALITY_MIN_FACE_RATIO * frame_size[0] * frame_size[1]:
+        reason = FACE_TOO_SMALL
+
+    quality_stats.record(reason)
+    return QualityResult(reason is None, reason, blur, luminance, face_side)
+
+
+class QualityStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.rejected = {reason: 0 for reason in REASON_MESSAGES}
+
+    def record(self, reason: Optional[str]):
+        with self._lock:
+            self.checked += 1
+            if reason is not None:
+                self.rejected[reason] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            rejected = dict(self.rejected)
+            total = sum(rejected.values())
+            return {
+                "checked": self.checked,
+                "passed": self.checked - total,
+                "rejected": rejected,
+                "rejection_ratio": total / self.checked if self.checked else 0.0,
+            }
+
+
+quality_stats = QualityStats()
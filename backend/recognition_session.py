@@ -0,0 +1,58 @@
+import asyncio
+from typing import List, Optional
+
+from backend.config import settings
+from backend.frame_cache import new_frame_cache
+
+
+# Trạng thái của một kết nối WebSocket nhận dạng (một camera).
+# Chỉ giữ frame mới nhất: nếu server xử lý chậm hơn tốc độ gửi, frame cũ chưa xử lý bị bỏ qua
+# để kết quả luôn ứng với hình ảnh gần nhất thay vì dồn hàng đợi.
+class RecognitionSession:
+    def __init__(self):
+        self.id_hs_list: List[int] = []
+        self.euclid_threshold: Optional[float] = None
+        self.search_all = False
+        self.face_cropped = False  # Client chỉ gửi phần khuôn mặt đã cắt sẵn
+        self._configured = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.frame_cache = new_frame_cache() if settings.FRAME_CACHE_SIZE > 0 else None
+        self._frame: Optional[bytes] = None
+        self._frame_ready = asyncio.Event()
+
+    @property
+    def configured(self) -> bool:
+        # euclid_threshold có thể bỏ trống khi server đã có ngưỡng hiệu chỉnh
+        return self._configured
+
+    def configure(self, config: dict):
+        # Cấu hình được gửi một lần khi bắt đầu phiên, có thể gửi lại khi giáo viên đổi ngưỡng
+        if "id_hs_list" in config:
+            self.id_hs_list = [int(id_hs) for id_hs in config["id_hs_list"] or []]
+        if config.get("euclid_threshold") is not None:
+            self.euclid_threshold = float(config["euclid_threshold"])
+        if "search_all" in config:
+            self.search_all = bool(config["search_all"])
+        if "face_cropped" in config:
+            self.face_cropped = bool(config["face_cropped"])
+        self._configured = True
+
+    def put_frame(self, image_bytes: bytes):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = image_bytes
+        self.received += 1
+        self._frame_ready.set()
+
+    async def next_frame(self) -> bytes:
+        while self._frame is None:
+            self._frame_ready.clear()
+            await self._frame_ready.wait()
+        image_bytes, self._frame = self._frame, None
+        self.processed += 1
+        return image_bytes
+
+    def stats(self) -> dict:
+        return {"received": self.received, "processed": self.processed, "dropped": self.dropped}
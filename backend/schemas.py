@@ -87,6 +87,7 @@ class PhuHuynhFullResponse(BaseModel):
 class TeacherImageResponse(BaseModel):
     id_gv: int
     image_path: str
+    thumbnail_path: Optional[str] = None  # Ảnh thu nhỏ cho ảnh đại diện
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -94,6 +95,7 @@ class TeacherImageResponse(BaseModel):
 class StudentImageResponse(BaseModel):
     id_hs: int
     image_path: str
+    thumbnail_path: Optional[str] = None  # Ảnh thu nhỏ cho ảnh đại diện
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -111,6 +113,7 @@ class PhuHuynhImageResponse(BaseModel):
     id_image: int
     id_ph: int
     image_path: str
+    thumbnail_path: Optional[str] = None
     vector: List[float] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -166,6 +169,8 @@ class RecognitionResult(BaseModel):
     success: bool
     message: str
     data: Optional[BestMatch]
+    threshold: Optional[float] = None  # Ngưỡng toàn cục đã áp dụng
+    threshold_source: Optional[str] = None  # "calibrated" (ngưỡng hiệu chỉnh) hoặc "client" (euclid_threshold)
 
 
 class GiaoVienUpdate(BaseModel):
@@ -0,0 +1,106 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from backend import ann
+
+
+# Đo độ phủ (recall@k so với tìm kiếm chính xác) và độ trễ truy vấn của các chỉ mục ANN
+# trên vector tổng hợp mô phỏng gallery phụ huynh: mỗi người vài ảnh quanh một tâm ngẫu nhiên.
+# Chạy: python -m benchmarks.bench_ann --sizes 10000 100000 1000000
+def synthetic_gallery(size: int, dim: int, images_per_person: int, rng: np.random.Generator):
+    people = max(1, size // images_per_person)
+    centers = rng.normal(0.0, 1.0, (people, dim)).astype(np.float32)
+    labels = rng.integers(0, people, size)
+    vectors = centers[labels] + rng.normal(0.0, 0.35, (size, dim)).astype(np.float32)
+    return vectors.astype(np.float32), centers, labels
+
+
+def build(kind: str, dim: int, ids: np.ndarray, vectors: np.ndarray, nprobe: int, block: int = 100000):
+    index = ann.create_index(kind, dim, **({"nprobe": nprobe} if kind == "ivf" else {}))
+    started = time.perf_counter()
+    for start in range(0, len(ids), block):
+        index.add(ids[start:start + block], vectors[start:start + block])
+    return index, time.perf_counter() - started
+
+
+def percentile_ms(values, q):
+    return float(np.percentile(values, q) * 1000.0)
+
+
+def run(size: int, dim: int, queries: int, k: int, kinds, nprobe: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    vectors, centers, labels = synthetic_gallery(size, dim, 4, rng)
+    ids = np.arange(size, dtype=np.int64)
+    picked = rng.integers(0, len(centers), queries)
+    query_vectors = centers[picked] + rng.normal(0.0, 0.35, (queries, dim)).astype(np.float32)
+
+    exact, _ = build("exact", dim, ids, vectors, nprobe)
+    exact_results = [exact.search(query, k)[0] for query in query_vectors]
+    truth = [set(found.tolist()) for found in exact_results]
+    # Nhận dạng chỉ cần đúng người gần nhất: so sánh nhãn của kết quả đứng đầu với tìm kiếm chính xác
+    truth_labels = [labels[found[0]] for found in exact_results]
+
+    report = {"size": size, "dim": dim, "queries": queries, "k": k, "indexes": {}}
+    for kind in kinds:
+        if kind == "hnsw":
+            try:
+                import hnswlib  # noqa: F401
+            except ImportError:
+                report["indexes"][kind] = {"skipped": "hnswlib chưa được cài đặt"}
+                continue
+        index, build_seconds = (exact, 0.0) if kind == "exact" else build(kind, dim, ids, vectors, nprobe)
+
+        latencies, hits, same_person = [], 0, 0
+        for query, expected, expected_label in zip(query_vectors, truth, truth_labels):
+            started = time.perf_counter()
+            found, _ = index.search(query, k)
+            latencies.append(time.perf_counter() - started)
+            hits += len(expected & set(found.tolist()))
+            same_person += int(found.size > 0 and labels[found[0]] == expected_label)
+
+        report["indexes"][kind] = {
+            "build_seconds": round(build_seconds, 3),
+            "recall_at_k": round(hits / (k * queries), 4),
+            "top1_same_person": round(same_person / queries, 4),
+            "p50_ms": round(percentile_ms(latencies, 50), 3),
+            "p95_ms": round(percentile_ms(latencies, 95), 3),
+            "p99_ms": round(percentile_ms(latencies, 99), 3),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chỉ mục tìm kiếm khuôn mặt toàn trường")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--indexes", nargs="+", default=["exact", "ivf", "hnsw"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    reports = []
+    for size in args.sizes:
+        report = run(size, args.dim, args.queries, args.k, args.indexes, args.nprobe, args.seed)
+        reports.append(report)
+        for kind, result in report["indexes"].items():
+            if "skipped" in result:
+                print(f"{size:>9} {kind:<6} bỏ qua: {result['skipped']}")
+                continue
+            print(f"{size:>9} {kind:<6} recall@{args.k}={result['recall_at_k']:.4f} "
+                  f"top1={result['top1_same_person']:.4f} "
+                  f"p50={result['p50_ms']:.3f}ms p95={result['p95_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+                  f"build={result['build_seconds']:.2f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
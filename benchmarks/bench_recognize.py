@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+from PIL import Image
+
+# Đo độ trễ toàn bộ quy trình nhận dạng (admin.recognize_frame) trên SQLite với mô hình giả lập
+# có kết quả xác định: gallery tổng hợp (mỗi phụ huynh vài ảnh quanh một tâm ngẫu nhiên),
+# báo cáo p50/p95/p99 của từng giai đoạn và ghi JSON để so sánh giữa các nhánh.
+# Chạy: python -m benchmarks.bench_recognize --sizes 100 1000 10000 100000 --json result.json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# "detect" chỉ gồm bước cắt khuôn mặt do client xác định; phát hiện phía server nằm trong "embed" (DeepFace)
+STAGES = ["threshold", "decode", "detect", "quality", "embed", "gallery", "match", "attendance"]
+
+
+def configure_environment(database_path: str):
+    # Settings đọc biến môi trường khi import nên phải đặt trước khi import backend
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("REDIS_HOST", "localhost")
+    os.environ.setdefault("REDIS_PORT", "6379")
+    os.environ.setdefault("REDIS_DB", "0")
+    # models.py import "config" trực tiếp nên cần cả thư mục backend trong sys.path
+    for path in (ROOT, os.path.join(ROOT, "backend")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def synthetic_frames(count: int, size: tuple, rng: np.random.Generator) -> list:
+    # Frame JPEG có kết cấu (không bị bộ kiểm tra chất lượng loại vì mờ / tối)
+    frames = []
+    width, height = size
+    for _ in range(count):
+        base = rng.integers(60, 190, (height // 8, width // 8, 3), dtype=np.uint8)
+        image = np.kron(base, np.ones((8, 8, 1), dtype=np.uint8))
+        image = np.clip(image + rng.normal(0, 12, image.shape), 0, 255).astype(np.uint8)
+        stream = io.BytesIO()
+        Image.fromarray(image).save(stream, format="JPEG", quality=85)
+        frames.append(stream.getvalue())
+    return frames
+
+
+# Thay cho mô hình trích xuất vector: trả về vector gần tâm của phụ huynh đích với nhiễu có seed,
+# có thể giả lập thời gian chạy mô hình bằng delay_ms
+class StubEmbedder:
+    def __init__(self, centers: np.ndarray, noise: float, delay_ms: float, seed: int):
+        self.centers = centers
+        self.noise = noise
+        self.delay = delay_ms / 1000.0
+        self.rng = np.random.default_rng(seed)
+        self.target = 0
+
+    async def __call__(self, image, *args, **kwargs) -> np.ndarray:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        center = self.centers[self.target]
+        return (center + self.rng.normal(0.0, self.noise, center.shape)).astype(np.float32)
+
+
+def seed_database(models, size: int, images_per_parent: int, parents_per_student: int, class_size: int,
+                  noise: float, rng: np.random.Generator):
+    models.Base.metadata.drop_all(models.engine)
+    models.Base.metadata.create_all(models.engine)
+
+    parents = max(parents_per_student, size // images_per_parent)
+    students = max(1, parents // parents_per_student)
+    classes = max(1, -(-students // class_size))
+    dim = 128
+    centers = rng.normal(0.0, 1.0, (parents, dim)).astype(np.float32)
+
+    parent_ids = np.arange(1, parents + 1)
+    image_parents = np.repeat(parent_ids, images_per_parent)[:size]
+    vectors = centers[image_parents - 1] + rng.normal(0.0, noise, (len(image_parents), dim)).astype(np.float32)
+
+    with models.engine.begin() as connection:
+        connection.execute(models.LopHoc.__table__.insert(),
+                           [{"id_lh": id_lh, "lophoc": f"Lớp {id_lh}"} for id_lh in range(1, classes + 1)])
+        connection.execute(models.HocSinh.__table__.insert(), [
+            {"id_hs": id_hs, "ten_hs": f"Học sinh {id_hs}", "gioitinh_hs": "Nam", "ngaysinh_hs": date(2020, 1, 1),
+             "id_lh": (id_hs - 1) // class_size + 1}
+            for id_hs in range(1, students + 1)
+        ])
+        connection.execute(models.PhuHuynh.__table__.insert(), [
+            {"id_ph": int(id_ph), "ten_ph": f"Phụ huynh {id_ph}", "gioitinh_ph": "Nữ"} for id_ph in parent_ids
+        ])
+        connection.execute(models.PhuHuynh_HocSinh.__table__.insert(), [
+            {"id_ph": int(id_ph), "id_hs": min((int(id_ph) - 1) // parents_per_student + 1, students),
+             "quanhe": "Mẹ"}
+            for id_ph in parent_ids
+        ])
+        connection.execute(models.PhuHuynh_Images.__table__.insert(), [
+            {"id_ph": int(id_ph), "image_path": f"images/{id_ph}_{index}.jpg",
+             "embedding": models.encode_embedding(vector), "embedding_model": "stub", "embedding_dim": dim,
+             "is_augmented": False}
+            for index, (id_ph, vector) in enumerate(zip(image_parents, vectors))
+        ])
+
+    return centers, students, class_size
+
+
+def percentiles(values) -> dict:
+    values = np.asarray(values) * 1000.0
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+async def run_requests(admin, models, metrics, embedder: StubEmbedder, frames: list, students: int,
+                       class_size: int, parents_per_student: int, requests: int, warmup: int, search_all: bool,
+                       threshold: float, rng: np.random.Generator) -> dict:
+    timings = {stage: [] for stage in STAGES}
+    totals = []
+    correct = 0
+    db = models.SessionLocal()
+    try:
+        for iteration in range(warmup + requests):
+            id_hs = int(rng.integers(1, students + 1))
+            first_student = (id_hs - 1) // class_size * class_size + 1
+            id_hs_list = list(range(first_student, min(first_student + class_size, students + 1)))
+            expected = {(id_hs - 1) * parents_per_student + offset + 1 for offset in range(parents_per_student)}
+            embedder.target = min(expected) - 1
+
+            # Xóa điểm danh của học sinh để mỗi lượt đều ghi bản ghi mới (không tính thời gian)
+            db.query(models.DiemDanh).filter(models.DiemDanh.id_hs == id_hs).delete()
+            db.commit()
+
+            timer = metrics.StageTimer()
+            result = await admin.recognize_frame(frames[iteration % len(frames)], id_hs_list, threshold, db,
+                                                 search_all=search_all, timer=timer)
+            if iteration < warmup:
+                continue
+
+            totals.append(timer.total)
+            for stage in STAGES:
+                timings[stage].append(timer.stages.get(stage, 0.0))
+            data = getattr(result, "data", None)
+            correct += int(data is not None and data.id_ph in expected)
+    finally:
+        db.close()
+
+    return {
+        "requests": requests,
+        "correct": round(correct / max(requests, 1), 4),
+        "total": percentiles(totals),
+        "stages": {stage: percentiles(values) for stage, values in timings.items()},
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quy trình nhận dạng với mô hình giả lập")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000],
+                        help="Số vector trong gallery")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--modes", nargs="+", default=["scoped", "search_all"], choices=["scoped", "search_all"],
+                        help="scoped: so khớp trong lớp; search_all: tìm trong toàn trường qua chỉ mục ANN")
+    parser.add_argument("--images-per-parent", type=int, default=4)
+    parser.add_argument("--parents-per-student", type=int, default=2)
+    parser.add_argument("--class-size", type=int, default=30)
+    parser.add_argument("--frame-size", type=int, nargs=2, default=[640, 480], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--embed-ms", type=float, default=0.0, help="Thời gian giả lập của mô hình (ms)")
+    parser.add_argument("--noise", type=float, default=0.35, help="Độ lệch của ảnh quanh tâm mỗi phụ huynh")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", help="File SQLite (mặc định: file tạm)")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="bench_recognize_"), "bench.sqlite3")
+    configure_environment(database)
+
+    from backend import admin, crud, metrics, models
+    from backend.config import settings
+    from backend.gallery import gallery
+
+    # Dùng ngưỡng cố định của benchmark thay vì ngưỡng hiệu chỉnh
+    settings.THRESHOLD_SOURCE = "client"
+
+    rng = np.random.default_rng(args.seed)
+    frames = synthetic_frames(8, tuple(args.frame_size), rng)
+    reports = []
+    for size in args.sizes:
+        started = time.perf_counter()
+        centers, students, class_size = seed_database(models, size, args.images_per_parent, args.parents_per_student,
+                                                      args.class_size, args.noise, rng)
+        seed_seconds = time.perf_counter() - started
+
+        db = models.SessionLocal()
+        try:
+            started = time.perf_counter()
+            gallery.load(db)
+            load_seconds = time.perf_counter() - started
+        finally:
+            db.close()
+
+        embedder = StubEmbedder(centers, args.noise, args.embed_ms, args.seed)
+        crud.calculate_vector = embedder
+        crud.calculate_face_vector = embedder
+
+        for mode in args.modes:
+            result = asyncio.run(run_requests(admin, models, metrics, embedder, frames, students, class_size,
+                                              args.parents_per_student, args.requests, args.warmup,
+                                              mode == "search_all", args.threshold, rng))
+            report = {"size": size, "mode": mode, "seed_seconds": round(seed_seconds, 3),
+                      "gallery_load_seconds": round(load_seconds, 3), **result}
+            reports.append(report)
+
+            stages = " ".join(f"{stage}={values['p50_ms']:.2f}" for stage, values in result["stages"].items())
+            print(f"{size:>7} {mode:<10} p50={result['total']['p50_ms']:.2f}ms p95={result['total']['p95_ms']:.2f}ms "
+                  f"p99={result['total']['p99_ms']:.2f}ms đúng={result['correct']:.3f} | p50 {stages}")
+
+    if args.json:
+        output = {
+            "revision": git_revision(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "database")},
+            "results": reports,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -100,6 +100,77 @@ document.addEventListener('DOMContentLoaded', async function () {
         return;
     }
 
+    // Kênh WebSocket nhận dạng: gửi cấu hình một lần cho mỗi phiên, sau đó gửi liên tục frame JPEG nhị phân
+    let recognitionSocket = openRecognitionSocket();
+    let waitingForPopup = false; // Tạm dừng gửi frame khi đang hiển thị kết quả
+    // Mã phiên camera, để server dùng lại kết quả của các frame gần giống nhau khi gửi qua HTTP
+    const recognitionSessionId = `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    // Gửi khuôn mặt đã cắt sẵn (server bỏ qua bước phát hiện). Mặc định tắt: khuôn mặt cắt ở trình duyệt
+    // không được xoay theo mắt như ảnh phụ huynh lúc đăng ký, chỉ bật sau khi đã đo độ chính xác
+    const clientFaceCrop = false;
+
+    function openRecognitionSocket() {
+        const socket = new WebSocket('ws://localhost:8000/admin/recognize/ws');
+        socket.addEventListener('open', () => sendRecognitionConfig(socket));
+        socket.addEventListener('message', (event) => handleRecognitionEvent(JSON.parse(event.data)));
+        socket.addEventListener('close', () => {
+            // Kết nối lại sau 3 giây, trong lúc đó dùng API HTTP
+            recognitionSocket = null;
+            setTimeout(() => {
+                recognitionSocket = openRecognitionSocket();
+            }, 3000);
+        });
+        return socket;
+    }
+
+    function sendRecognitionConfig(socket) {
+        socket.send(JSON.stringify({
+            id_hs_list: id_hs_list,
+            euclid_threshold: parseFloat(matchSlider.value),
+            face_cropped: clientFaceCrop
+        }));
+    }
+
+    // Gửi lại cấu hình khi giáo viên thay đổi ngưỡng so khớp
+    matchSlider.addEventListener('change', () => {
+        if (recognitionSocket && recognitionSocket.readyState === WebSocket.OPEN) {
+            sendRecognitionConfig(recognitionSocket);
+        }
+    });
+
+    // Server cho biết ngưỡng thực sự được áp dụng: khi dùng ngưỡng đã hiệu chỉnh thì thanh trượt không có tác dụng
+    function showAppliedThreshold(result) {
+        if (!result.threshold_source) {
+            return;
+        }
+        const calibrated = result.threshold_source === 'calibrated';
+        matchSlider.disabled = calibrated;
+        if (calibrated) {
+            matchValue.textContent = `${result.threshold.toFixed(3)} (đã hiệu chỉnh)`;
+            matchSlider.title = 'Server đang dùng ngưỡng đã hiệu chỉnh, thanh trượt không được áp dụng';
+        } else {
+            matchValue.textContent = matchSlider.value;
+            matchSlider.title = '';
+        }
+    }
+
+    async function handleRecognitionEvent(event) {
+        if (event.type === 'result') {
+            showAppliedThreshold(event);
+            if (event.success) {
+                waitingForPopup = true;
+                await showPopup(event.message);
+                waitingForPopup = false;
+            } else {
+                console.log('Nhận dạng:', event.message);
+            }
+        } else if (event.type === 'error') {
+            waitingForPopup = true;
+            await showPopup(event.detail || 'Có lỗi xảy ra khi nhận dạng.');
+            waitingForPopup = false;
+        }
+    }
+
     // Hàm phát hiện khuôn mặt
     async function detectFace() {
         const options = new faceapi.SsdMobilenetv1Options({
@@ -113,28 +184,39 @@ document.addEventListener('DOMContentLoaded', async function () {
         faceapi.draw.drawDetections(canvas, detection ? [detection] : []); // Vẽ hộp bao quanh khuôn mặt
 
         // Nếu phát hiện khuôn mặt và đạt ngưỡng tin cậy
-        if (detection) {
-            // Chụp frame từ video
+        if (detection && !waitingForPopup) {
+            // Cả frame video, hoặc (khi bật clientFaceCrop) phần khuôn mặt mở rộng 20% mỗi phía
+            let left = 0, top = 0, right = video.videoWidth, bottom = video.videoHeight;
+            if (clientFaceCrop) {
+                const box = detection.box;
+                const margin = 0.2;
+                left = Math.max(0, Math.floor(box.x - margin * box.width));
+                top = Math.max(0, Math.floor(box.y - margin * box.height));
+                right = Math.min(video.videoWidth, Math.ceil(box.x + box.width * (1 + margin)));
+                bottom = Math.min(video.videoHeight, Math.ceil(box.y + box.height * (1 + margin)));
+            }
+
             const frame = document.createElement('canvas'); // Tạo một canvas tạm
-            frame.width = video.videoWidth;
-            frame.height = video.videoHeight;
+            frame.width = right - left;
+            frame.height = bottom - top;
             const frameContext = frame.getContext('2d');
-            frameContext.drawImage(video, 0, 0, frame.width, frame.height); // Vẽ khung hình gốc từ video
-
-            const base64Image = frame.toDataURL('image/jpeg').split(',')[1]; // Chuyển đổi frame sang base64 từ canvas tạm
+            frameContext.drawImage(video, left, top, frame.width, frame.height, 0, 0, frame.width, frame.height);
 
-            // Lấy danh sách ID học sinh
-            const id_hs_list = await fetchIdHsList(studentsApiUrl);
+            // Mã hóa frame thành JPEG nhị phân (không dùng base64 để giảm dung lượng gửi đi)
+            const jpegBlob = await new Promise(resolve => frame.toBlob(resolve, 'image/jpeg', 0.9));
 
-            // Tạo payload
-            const payload = {
-                frame: {
-                    frame: `data:image/jpeg;base64,${base64Image}`
-                }, id_hs_list: id_hs_list
-            };
+            if (recognitionSocket && recognitionSocket.readyState === WebSocket.OPEN) {
+                // Chỉ gửi khi frame trước đã ra khỏi bộ đệm; server tự bỏ frame cũ nếu xử lý chậm
+                if (recognitionSocket.bufferedAmount === 0) {
+                    recognitionSocket.send(jpegBlob);
+                }
+            } else {
+                // Lấy danh sách ID học sinh
+                const id_hs_list = await fetchIdHsList(studentsApiUrl);
 
-            // Gửi dữ liệu đến API
-            await sendFrameToApi(payload);
+                // Gửi dữ liệu đến API
+                await sendFrameToApi(jpegBlob, id_hs_list);
+            }
         }
 
         requestAnimationFrame(detectFace); // Gọi lại hàm phát hiện khuôn mặt
@@ -179,25 +261,35 @@ document.addEventListener('DOMContentLoaded', async function () {
     closePopupBtn.addEventListener("click", hidePopup);  // Khi người dùng bấm "Đóng", popup sẽ ẩn đi
 
 // Hàm gửi dữ liệu đến API
-    async function sendFrameToApi(payload) {
+    async function sendFrameToApi(jpegBlob, id_hs_list) {
         const euclidThreshold = matchSlider.value;  // Lấy giá trị từ matchSlider
-        const apiUrl = `http://localhost:8000/admin/recognize?euclid_threshold=${euclidThreshold}`;  // Thêm tham số vào URL
+        const params = new URLSearchParams({
+            euclid_threshold: euclidThreshold,
+            session_id: recognitionSessionId,
+            face_cropped: String(clientFaceCrop)
+        });
+        id_hs_list.forEach(id_hs => params.append('id_hs_list', id_hs));
+        const apiUrl = `http://localhost:8000/admin/recognize/raw?${params.toString()}`;  // Tham số truyền qua URL
 
         try {
             const response = await fetch(apiUrl, {
                 method: "POST",
                 headers: {
-                    "Content-Type": "application/json"
+                    "Content-Type": "application/octet-stream"
                 },
-                body: JSON.stringify(payload)
+                body: jpegBlob
             });
 
             if (response.ok) {
                 const result = await response.json();
+                showAppliedThreshold(result);
 
                 if (result.success) {
                     // Hiển thị thông báo và đợi người dùng bấm "Đóng"
                     await showPopup(result.message); // Sử dụng thông báo từ API
+                } else if (result.retry) {
+                    // Frame không đạt chất lượng (mờ, thiếu sáng, mặt quá nhỏ): bỏ qua và chờ frame sau
+                    console.log('Bỏ qua frame:', result.message);
                 } else {
                     // Hiển thị thông báo thất bại và đợi người dùng bấm "Đóng"
                     await showPopup("Nhận dạng thất bại! Không có phụ huynh nào được tìm thấy.");
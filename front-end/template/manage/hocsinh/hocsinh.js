@@ -44,7 +44,7 @@ document.addEventListener('DOMContentLoaded', async function () {
             });
             if (response.ok) {
                 const image = await response.json();
-                profilePicture.src = image.image_path; // Cập nhật src của hình ảnh đại diện
+                profilePicture.src = image.thumbnail_path || image.image_path; // Cập nhật src của hình ảnh đại diện (ảnh thu nhỏ)
             } else {
                 console.error("Không thể lấy ảnh học sinh.");
             }
@@ -65,7 +65,7 @@ document.addEventListener('DOMContentLoaded', async function () {
 
             if (response.ok) {
                 const data = await response.json();
-                document.getElementById('user-icon').src = data.image_path; // Cập nhật src cho thẻ img user-icon
+                document.getElementById('user-icon').src = data.thumbnail_path || data.image_path; // Cập nhật src cho thẻ img user-icon
             } else {
                 console.error('Không thể lấy ảnh người dùng.');
             }
@@ -342,7 +342,7 @@ function displayUploadedPictures(images) {
         imgWrapper.id = `image-${image.id_image}`;  // Dùng id_image cho đúng
 
         const imgElement = document.createElement("img");
-        imgElement.src = image.image_path;
+        imgElement.src = image.thumbnail_path || image.image_path;  // Ảnh thu nhỏ, ảnh cũ chưa có thì dùng ảnh gốc
         imgElement.alt = "Ảnh đại diện";
 
         const deleteButton = document.createElement("button");
@@ -0,0 +1,76 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Kiểm tra chi phí import của đường CRUD (API worker không nhận dạng khuôn mặt, CLI, test):
+# thất bại khi đường này kéo theo các thư viện nặng hoặc tổng thời gian import vượt ngân sách.
+# Chạy: python scripts/check_import_budget.py [--budget-ms 2500] [--module backend.crud ...]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ["backend.crud", "backend.admin", "backend.migrate"]
+FORBIDDEN = ["tensorflow", "keras", "tf_keras", "deepface", "onnxruntime", "matplotlib", "sklearn", "torch", "cv2"]
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(modules) -> tuple:
+    # Trả về (tổng thời gian import tính bằng ms, danh sách module đã import) cho một tiến trình mới
+    env = dict(os.environ)
+    # models.py import "config" trực tiếp nên cần cả thư mục backend trong PYTHONPATH
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, os.path.join(ROOT, "backend"), env.get("PYTHONPATH")]))
+    code = "; ".join(f"import {module}" for module in modules)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit(f"Không thể import {', '.join(modules)}:\n{process.stderr[-2000:]}")
+
+    total_us = 0
+    imported = []
+    for line in process.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        imported.append(name)
+        if len(indent) == 1:
+            # Chỉ cộng các import cấp cao nhất (thời gian tích lũy đã gồm các import con)
+            total_us += cumulative
+    return total_us / 1000.0, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra ngân sách thời gian import của đường CRUD")
+    parser.add_argument("--module", action="append", dest="modules", help="Module cần kiểm tra (lặp lại được)")
+    parser.add_argument("--budget-ms", type=float, default=2500.0)
+    parser.add_argument("--runs", type=int, default=3, help="Lấy thời gian nhỏ nhất sau nhiều lần chạy")
+    args = parser.parse_args()
+    modules = args.modules or DEFAULT_MODULES
+
+    timings = []
+    imported = []
+    for _ in range(max(1, args.runs)):
+        elapsed_ms, imported = measure(modules)
+        timings.append(elapsed_ms)
+    best_ms = min(timings)
+
+    heavy = sorted({name for name in imported if name.split(".")[0] in FORBIDDEN})
+    print(f"Import {', '.join(modules)}: {best_ms:.0f} ms (ngân sách {args.budget_ms:.0f} ms), "
+          f"{len(imported)} module")
+
+    failed = False
+    if heavy:
+        roots = sorted({name.split(".")[0] for name in heavy})
+        print(f"LỖI: đường CRUD import thư viện nặng: {', '.join(roots)}")
+        failed = True
+    if best_ms > args.budget_ms:
+        print(f"LỖI: thời gian import vượt ngân sách ({best_ms:.0f} ms > {args.budget_ms:.0f} ms)")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+# Kiểm tra vector của backend ONNX Runtime khớp với DeepFace / TensorFlow trong phạm vi sai số cho phép.
+# Mặc định so sánh với detector "skip" (chỉ đo sai khác của mô hình) và "opencv" (cả bước phát hiện / xoay
+# khuôn mặt như khi nhận dạng); --images dùng ảnh thật trong một thư mục thay cho ảnh tổng hợp.
+# Chạy: python scripts/check_onnx_parity.py [--onnx-model models/facenet.onnx] [--images images/phu_huynh]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def synthetic_faces(count: int, seed: int) -> list:
+    # Ảnh BGR có kết cấu, kích thước khác nhau để kiểm tra cả bước resize / đệm
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        height, width = (int(value) for value in rng.integers(80, 320, 2))
+        base = rng.integers(0, 256, (height // 4 + 1, width // 4 + 1, 3)).astype(np.float32)
+        image = np.kron(base, np.ones((4, 4, 1), dtype=np.float32))[:height, :width]
+        image = image + rng.normal(0.0, 10.0, image.shape)
+        images.append(np.clip(image, 0, 255).astype(np.uint8))
+    return images
+
+
+def load_images(directory: str, limit: int) -> list:
+    from backend import imaging
+
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), "rb") as f:
+                images.append(imaging.decode_image(f.read()))
+        if len(images) >= limit:
+            break
+    return images
+
+
+def embeddings(backend, images: list, detector: str) -> np.ndarray:
+    results = backend.represent_batch(images, detector)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return np.asarray([result[0]["embedding"] for result in results], dtype=np.float64)
+
+
+def relative_errors(candidate: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    # ||onnx - tf|| / ||tf|| của từng vector
+    return np.linalg.norm(candidate - reference, axis=1) / np.maximum(np.linalg.norm(reference, axis=1), 1e-12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh vector của backend ONNX với DeepFace")
+    parser.add_argument("--model", default="Facenet")
+    parser.add_argument("--onnx-model", default=os.path.join(ROOT, "models", "facenet.onnx"))
+    parser.add_argument("--images", help="Thư mục ảnh (mặc định: ảnh tổng hợp)")
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--detectors", nargs="+", default=["skip", "opencv"])
+    parser.add_argument("--tolerance", type=float, default=1e-3,
+                        help="Sai số tương đối tối đa ||onnx - tf|| / ||tf|| của mỗi vector")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # models.py import "config" trực tiếp nên cần cả thư mục backend trong sys.path
+    for path in (ROOT, os.path.join(ROOT, "backend")):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    from backend.embedding_backends import DeepFaceBackend, OnnxBackend
+
+    images = load_images(args.images, args.count) if args.images else synthetic_faces(args.count, args.seed)
+    if not images:
+        raise SystemExit("Không có ảnh để so sánh")
+
+    reference_backend = DeepFaceBackend(args.model)
+    candidate_backend = OnnxBackend(args.model, model_path=args.onnx_model)
+    failed = False
+    for detector in args.detectors:
+        reference = embeddings(reference_backend, images, detector)
+        candidate = embeddings(candidate_backend, images, detector)
+
+        errors = relative_errors(candidate, reference)
+        cosine = (candidate * reference).sum(axis=1) / np.maximum(
+            np.linalg.norm(candidate, axis=1) * np.linalg.norm(reference, axis=1), 1e-12)
+        print(f"{len(images)} ảnh, detector={detector}: sai số tương đối lớn nhất {errors.max():.2e} "
+              f"(trung bình {errors.mean():.2e}), cosine nhỏ nhất {cosine.min():.6f}")
+
+        if errors.max() > args.tolerance:
+            print(f"LỖI: {int((errors > args.tolerance).sum())} vector vượt sai số cho phép {args.tolerance:.0e}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import os
+
+# Chuyển mô hình Keras của DeepFace (mặc định Facenet) sang ONNX cho backend "onnx".
+# Cần TensorFlow, DeepFace và tf2onnx (pip install tf2onnx) - chỉ chạy một lần trên máy build,
+# server dùng backend "onnx" chỉ cần onnxruntime.
+# Chạy: python scripts/export_onnx.py [--model Facenet] [--output models/facenet.onnx]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def export(model_name: str, output: str, opset: int) -> str:
+    import tensorflow as tf
+    import tf2onnx
+    from deepface import DeepFace
+
+    keras_model = DeepFace.build_model(model_name).model
+    # Giữ thứ tự NHWC và kích thước batch động như mô hình gốc
+    signature = [tf.TensorSpec((None, *keras_model.input_shape[1:]), tf.float32, name="input")]
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    tf2onnx.convert.from_keras(keras_model, input_signature=signature, opset=opset, output_path=output)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển mô hình DeepFace sang ONNX")
+    parser.add_argument("--model", default="Facenet")
+    parser.add_argument("--output", default=os.path.join(ROOT, "models", "facenet.onnx"))
+    parser.add_argument("--opset", type=int, default=13)
+    args = parser.parse_args()
+
+    path = export(args.model, args.output, args.opset)
+    print(f"Đã ghi {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    print(f"Kiểm tra sai khác với TensorFlow: python scripts/check_onnx_parity.py --onnx-model {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+# Cấu hình tối thiểu để import backend.config khi chạy test (không cần file .env, MySQL hay Redis)
+_TMP_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TMP_DIR, 'test.sqlite3')}")
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("REDIS_PORT", "6379")
+os.environ.setdefault("REDIS_DB", "0")
+# Giống khi chạy server: một số module (models, database) import trực tiếp từ thư mục backend
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [_ROOT, os.path.join(_ROOT, "backend")]
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    from backend import models
+
+    models.Base.metadata.create_all(models.engine)
+    session = models.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.Base.metadata.drop_all(models.engine)
@@ -0,0 +1,106 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backend import calibration, models
+from backend.config import settings
+
+
+def test_error_rates():
+    far, frr = calibration.error_rates(np.array([2, 0, 0]), np.array([0, 0, 4]))
+    np.testing.assert_allclose(far, [0.0, 0.0, 0.0, 1.0])
+    np.testing.assert_allclose(frr, [1.0, 0.0, 0.0, 0.0])
+
+
+def test_choose_threshold_eer_takes_middle_of_tied_range():
+    far = np.array([0.0, 0.0, 0.0, 1.0])
+    frr = np.array([1.0, 0.0, 0.0, 0.0])
+    threshold, eer, index = calibration.choose_threshold(far, frr, np.linspace(0.0, 3.0, 4))
+    assert (threshold, eer, index) == (2.0, 0.0, 2)
+
+
+def test_choose_threshold_target_far():
+    far = np.array([0.0, 0.1, 0.5, 1.0])
+    frr = np.array([1.0, 0.6, 0.2, 0.0])
+    threshold, _, index = calibration.choose_threshold(far, frr, np.linspace(0.0, 3.0, 4), target_far=0.2)
+    assert (threshold, index) == (1.0, 1)
+
+
+def test_parent_threshold(monkeypatch):
+    monkeypatch.setattr(settings, "CALIBRATION_MIN_GENUINE_PAIRS", 3)
+    monkeypatch.setattr(settings, "CALIBRATION_PARENT_MAX_RAISE", 0.2)
+    monkeypatch.setattr(settings, "CALIBRATION_PARENT_MARGIN", 0.1)
+
+    # Nới ngưỡng nhưng không vượt global * (1 + MAX_RAISE)
+    assert calibration.parent_threshold(1.0, 5, 1.5, None) == pytest.approx(1.2)
+    # Chưa đủ cặp ảnh cùng người: giữ ngưỡng toàn cục
+    assert calibration.parent_threshold(1.0, 2, 1.5, None) == pytest.approx(1.0)
+    # Luôn giữ khoảng an toàn so với ảnh khác người gần nhất
+    assert calibration.parent_threshold(1.0, 5, 1.5, 1.1) == pytest.approx(0.99)
+    assert calibration.parent_threshold(1.0, 0, None, None) == pytest.approx(1.0)
+
+
+def _add_images(db, parent_vectors):
+    for id_ph, vectors in parent_vectors:
+        if db.get(models.PhuHuynh, id_ph) is None:
+            db.add(models.PhuHuynh(id_ph=id_ph, ten_ph=f"PH{id_ph}", gioitinh_ph="Nam"))
+        for k, vector in enumerate(vectors):
+            image = models.PhuHuynh_Images(id_ph=id_ph, image_path=f"images/{id_ph}_{k}.jpg")
+            image.set_embedding(vector, settings.EMBEDDING_MODEL)
+            db.add(image)
+    db.commit()
+
+
+def _snapshot(state):
+    parents = {row.id_ph: (row.images, row.genuine_pairs, row.genuine_max, row.impostor_min)
+               for row in state.nguong_phu_huynh}
+    return (np.frombuffer(state.genuine_counts, dtype=np.int64).copy(),
+            np.frombuffer(state.impostor_counts, dtype=np.int64).copy(), parents, state.threshold)
+
+
+def test_incremental_run_matches_full_run(db, monkeypatch):
+    # Thang khoảng cố định để lần chạy lại toàn bộ dùng cùng các bin với lần chạy tăng dần
+    monkeypatch.setattr(settings, "CALIBRATION_MAX_DISTANCE", 8.0)
+    monkeypatch.setattr(settings, "CALIBRATION_BINS", 64)
+    rng = np.random.default_rng(0)
+    centers = {id_ph: rng.normal(0.0, 1.0, 16) for id_ph in range(1, 6)}
+
+    def images(id_ph, count):
+        return [centers[id_ph] + rng.normal(0.0, 0.3, 16) for _ in range(count)]
+
+    _add_images(db, [(1, images(1, 3)), (2, images(2, 2)), (3, images(3, 4))])
+    first = calibration.run_calibration(db)
+    assert first["new_images"] == 9
+
+    # Ảnh mới của phụ huynh cũ và phụ huynh mới: chỉ các cặp có ảnh mới được tính (pair_blocks(first_new))
+    _add_images(db, [(2, images(2, 2)), (4, images(4, 3)), (5, images(5, 1))])
+    second = calibration.run_calibration(db)
+    assert second["new_images"] == 6
+    incremental = _snapshot(calibration.get_calibration(db))
+
+    calibration.run_calibration(db, full=True)
+    full = _snapshot(calibration.get_calibration(db))
+
+    n = 15
+    assert incremental[0].sum() + incremental[1].sum() == n * (n - 1) // 2
+    np.testing.assert_array_equal(incremental[0], full[0])
+    np.testing.assert_array_equal(incremental[1], full[1])
+    assert incremental[2].keys() == full[2].keys()
+    for id_ph, (images_count, pairs, genuine_max, impostor_min) in full[2].items():
+        assert incremental[2][id_ph][:2] == (images_count, pairs)
+        assert incremental[2][id_ph][2] == pytest.approx(genuine_max)
+        assert incremental[2][id_ph][3] == pytest.approx(impostor_min)
+    assert incremental[3] == pytest.approx(full[3])
+
+
+def test_threshold_store_falls_back_to_client_when_table_missing(monkeypatch):
+    monkeypatch.setattr(settings, "THRESHOLD_SOURCE", calibration.CALIBRATED)
+    store = calibration.ThresholdStore()
+    session = models.SessionLocal()
+    try:
+        threshold, parent_thresholds, source = asyncio.run(store.resolve(session, 0.7))
+    finally:
+        session.close()
+    assert (threshold, parent_thresholds, source) == (0.7, None, calibration.CLIENT)
+    assert store.unavailable
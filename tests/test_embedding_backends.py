@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from backend.embedding_backends import EmbeddingBackend, StubBackend, get_backend
+
+
+def _image(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 256, (48, 40, 3), dtype=np.uint8)
+
+
+def test_stub_backend_is_deterministic():
+    images = [_image(0), _image(1)]
+    first = StubBackend("Facenet").represent_batch(images, "skip")
+    second = StubBackend("Facenet").represent_batch([image.copy() for image in images], "opencv")
+
+    assert first == second
+    assert len(first[0][0]["embedding"]) == 128
+    assert first[0][0]["embedding"] != first[1][0]["embedding"]
+    assert first[0][0]["facial_area"] == {"x": 0, "y": 0, "w": 40, "h": 48}
+
+
+def test_embedding_backend_is_abstract():
+    with pytest.raises(TypeError):
+        EmbeddingBackend("Facenet")
+
+
+def test_get_backend_caches_instance_and_rejects_unknown_name():
+    assert get_backend("stub", "Facenet") is get_backend("stub", "Facenet")
+    with pytest.raises(ValueError):
+        get_backend("unknown", "Facenet")
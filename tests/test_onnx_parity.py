@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.config import settings
+
+# Vector của backend ONNX Runtime phải khớp DeepFace / TensorFlow, cả khi phát hiện và xoay khuôn mặt.
+# Cần onnxruntime, deepface và đồ thị đã xuất (python scripts/export_onnx.py); thiếu thì bỏ qua.
+pytest.importorskip("onnxruntime")
+pytest.importorskip("deepface")
+
+from backend.embedding_backends import DeepFaceBackend, OnnxBackend  # noqa: E402
+from scripts.check_onnx_parity import embeddings, relative_errors, synthetic_faces  # noqa: E402
+
+TOLERANCE = 1e-3
+
+
+@pytest.fixture(scope="module")
+def backends():
+    if not os.path.exists(settings.ONNX_MODEL_PATH):
+        pytest.skip(f"Chưa có mô hình ONNX: {settings.ONNX_MODEL_PATH}")
+    return DeepFaceBackend(settings.EMBEDDING_MODEL), OnnxBackend(settings.EMBEDDING_MODEL)
+
+
+@pytest.mark.parametrize("detector", ["skip", "opencv"])
+def test_onnx_matches_deepface(backends, detector):
+    reference_backend, candidate_backend = backends
+    images = synthetic_faces(8, seed=0)
+    reference = embeddings(reference_backend, images, detector)
+    candidate = embeddings(candidate_backend, images, detector)
+    assert relative_errors(candidate, reference).max() <= TOLERANCE
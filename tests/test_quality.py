@@ -0,0 +1,39 @@
+import statistics
+import time
+
+import numpy as np
+import pytest
+
+from backend import quality
+
+
+@pytest.mark.parametrize("height, width", [(480, 640), (720, 1280), (1080, 1920), (500, 500), (100, 80)])
+def test_grayscale_targets_analysis_side(height, width):
+    image = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    gray = quality._grayscale(image)
+    assert min(gray.shape) == min(quality._ANALYSIS_SIDE, height, width)
+    assert gray.shape[1] / gray.shape[0] == pytest.approx(width / height, rel=0.01)
+
+
+def test_grayscale_matches_full_frame_luma():
+    image = np.random.default_rng(1).integers(0, 256, (120, 90, 3), dtype=np.uint8)
+    expected = image[:, :, 0] * 0.114 + image[:, :, 1] * 0.587 + image[:, :, 2] * 0.299
+    np.testing.assert_allclose(quality._grayscale(image), expected, rtol=1e-5)
+
+
+def test_grayscale_accepts_cropped_view():
+    frame = np.random.default_rng(2).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+    crop = frame[100:600, 300:800]
+    np.testing.assert_array_equal(quality._grayscale(crop), quality._grayscale(crop.copy()))
+
+
+@pytest.mark.parametrize("height, width", [(480, 640), (1080, 1920)])
+def test_assess_stays_under_one_millisecond(height, width):
+    image = np.random.default_rng(3).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    quality.assess(image)
+    timings = []
+    for _ in range(50):
+        start = time.perf_counter()
+        quality.assess(image)
+        timings.append(time.perf_counter() - start)
+    assert statistics.median(timings) < 1e-3